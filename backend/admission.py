@@ -0,0 +1,239 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge
+
+from resilience import DeadlineExceeded, Overloaded, current_deadline
+
+IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Calls holding a slot of a concurrency limiter",
+    ["limiter"],
+    multiprocess_mode="livesum"
+)
+QUEUED = Gauge(
+    "admission_queued",
+    "Calls waiting for a slot of a concurrency limiter",
+    ["limiter"],
+    multiprocess_mode="livesum"
+)
+REJECTED = Counter(
+    "admission_rejected",
+    "Calls turned away because a limiter's queue was full or a quota could not be met in time",
+    ["limiter"]
+)
+QUOTA_WAIT = Counter(
+    "quota_wait_seconds",
+    "Seconds calls spent waiting for tokens-per-minute quota",
+    ["quota"]
+)
+RATE_LIMITED = Counter(
+    "quota_rate_limited",
+    "429 responses from the upstream despite the token bucket",
+    ["quota"]
+)
+
+# Seconds until the current request's deadline, or None without one
+def deadline_left():
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left
+
+# Quotas are set per deployment; each of the WEB_CONCURRENCY workers
+# started by uvicorn or gunicorn gets its share
+def per_worker(value):
+    return value / max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Lets at most `limit` calls run at once and up to `queue_size` more wait for
+# a slot, in arrival order; past that, calls are rejected at once. Waiting is
+# bounded by the request deadline.
+class ConcurrencyLimiter:
+    def __init__(self, name, limit, queue_size=256):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    # Whether a new call would be rejected right now
+    def saturated(self):
+        return self.active >= self.limit and len(self.waiters) >= self.queue_size
+
+    def reject(self):
+        self.rejected += 1
+        REJECTED.labels(self.name).inc()
+        return Overloaded(f"{self.name} at capacity, try again shortly")
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.queue_size:
+                raise self.reject()
+            await self._wait()
+        self.admitted += 1
+        IN_FLIGHT.labels(self.name).inc()
+
+    # Take a slot only if one is free right now, never queueing
+    def try_acquire(self):
+        if self.active >= self.limit or self.waiters:
+            return False
+        self.active += 1
+        self.admitted += 1
+        IN_FLIGHT.labels(self.name).inc()
+        return True
+
+    async def _wait(self):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.queued += 1
+        QUEUED.labels(self.name).inc()
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, deadline_left())
+        except BaseException as e:
+            # The slot may have been handed over just as the wait ended
+            if future.done() and not future.cancelled():
+                self._release()
+            elif future in self.waiters:
+                self.waiters.remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"request deadline exceeded waiting for {self.name}")
+            raise
+        finally:
+            self.wait_seconds += time.monotonic() - start
+            QUEUED.labels(self.name).dec()
+
+    # Hand the slot straight to the oldest waiter, or free it
+    def _release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def release(self):
+        IN_FLIGHT.labels(self.name).dec()
+        self._release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "in_flight": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 1) if self.queued else 0.0
+        }
+
+# Tokens-per-minute quota of one deployment. A call reserves its estimated
+# tokens up front and waits until the bucket has refilled enough to cover
+# them, so calls go out at the quota rate instead of bursting into 429s; the
+# estimate is settled against the reported usage afterwards. Reservations
+# queue in arrival order, and a call that could not be covered before its
+# deadline is rejected at once. A reservation is capped at the bucket's
+# capacity; acquire() returns what was reserved, which is what to settle.
+class TokenBucket:
+    def __init__(self, name, per_minute, burst_seconds=10.0):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = self.rate * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.reserved = 0
+        self.used = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        self._refill()
+        self.tokens -= tokens
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait <= 0:
+            self.reserved += tokens
+            return tokens
+        left = deadline_left()
+        if left is not None and wait > left:
+            self.tokens += tokens
+            self.rejected += 1
+            REJECTED.labels(self.name).inc()
+            raise Overloaded(f"{self.name} quota exhausted, try again shortly", retry_after=math.ceil(wait))
+        self.throttled += 1
+        self.wait_seconds += wait
+        QUOTA_WAIT.labels(self.name).inc(wait)
+        try:
+            await asyncio.sleep(wait)
+        except BaseException:
+            self.tokens += tokens
+            raise
+        self.reserved += tokens
+        return tokens
+
+    # Reserve only if the bucket covers the tokens right now; returns the
+    # reservation, or None without waiting
+    def try_acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        self._refill()
+        if self.tokens < tokens:
+            return None
+        self.tokens -= tokens
+        self.reserved += tokens
+        return tokens
+
+    # Correct a reservation by the tokens the call really used
+    def settle(self, used, reserved):
+        self._refill()
+        self.used += used
+        self.tokens = min(self.capacity, self.tokens - (used - reserved))
+
+    # The upstream answered 429 anyway (another client shares the quota, or
+    # the estimates ran low): hold everyone off for its Retry-After
+    def pause(self, seconds):
+        self._refill()
+        self.rate_limited += 1
+        RATE_LIMITED.labels(self.name).inc()
+        self.tokens = min(self.tokens, -self.rate * seconds)
+
+    def stats(self):
+        self._refill()
+        return {
+            "tokens_per_minute": round(self.rate * 60),
+            "available": round(self.tokens),
+            "reserved": self.reserved,
+            "used": self.used,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "wait_seconds": round(self.wait_seconds, 2)
+        }
@@ -13,6 +13,13 @@ from openai import AzureOpenAI
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 
+from semantic_cache import bump_index_version
+from embedding_cache import default_cache, embed_texts_sync
+from usage import UsageTotals
+from retrievers import DEFAULT_LOCAL_INDEX
+from embedding_store import write_store
+from chunking import PageChunker
+
 load_dotenv()
 
 BASE_URL = "https://www.madewithnestle.ca"
@@ -29,6 +36,28 @@ search_client = SearchClient(
     credential=AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_KEY"))
 )
 
+# Unchanged pages are not re-embedded on later runs
+embedding_cache = default_cache()
+
+# CHUNK_TOKENS > 0 indexes pages as heading-aware passages of that many
+# tokens. Whole pages are the default: on the sample pages they rank the
+# right page first more often (100% vs 94% at 256 tokens, bench_chunking.py)
+# for about 10% more packed prompt tokens.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "0"))
+chunker = PageChunker(
+    max_tokens=CHUNK_TOKENS,
+    overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+) if CHUNK_TOKENS > 0 else None
+
+# Texts sent per embeddings request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+# Documents per Azure AI Search upload or delete request (the service takes at most 1000)
+UPLOAD_BATCH_SIZE = 500
+
+# Tokens and estimated spend of this run, printed at the end
+usage_totals = UsageTotals()
+
 def normalize_url(url):
     parsed = urlparse(url)
     return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
@@ -36,23 +65,72 @@ def normalize_url(url):
 def is_internal(url):
     return url.startswith("/") or BASE_URL in url
 
-async def extract_text_and_embed(page, url):
+# Returns the page's text blocks as (tag, text) pairs, headings included
+async def extract_blocks(page, url):
     await page.goto(url, wait_until="domcontentloaded")
     soup = BeautifulSoup(await page.content(), "html.parser")
     for tag in soup(['header', 'footer', 'nav', 'script', 'style']):
         tag.decompose()
     blocks = soup.find_all(["h1", "h2", "h3", "p", "li"])
-    lines = [el.get_text(strip=True) for el in blocks if el.get_text(strip=True)]
-    combined = f"Link: {url}\n" + "\n".join(lines)
-    emb = client.embeddings.create(input=[combined], model="text-embedding-3-small")
-    return {
+    return [(el.name, el.get_text(strip=True)) for el in blocks if el.get_text(strip=True)]
+
+# Split a page into passages, or keep it whole when chunking is off
+def page_documents(url, blocks):
+    doc_type = "recipe" if "/recipe/" in url else "information"
+    if chunker:
+        return chunker.chunk(url, blocks, doc_type)
+    return [{
         "id": base64.urlsafe_b64encode(url.encode()).decode(),
-        "type": "recipe" if "/recipe/" in url else "information",
-        "text": combined, "embedding": emb.data[0].embedding
-    }
+        "type": doc_type,
+        "text": f"Link: {url}\n" + "\n".join(text for _, text in blocks)
+    }]
+
+# Embed every document in batches, skipping texts already in the embedding cache
+def embed_documents(documents):
+    for start in range(0, len(documents), EMBED_BATCH_SIZE):
+        batch = documents[start:start + EMBED_BATCH_SIZE]
+        embeddings = embed_texts_sync(
+            client, embedding_cache, [doc["text"] for doc in batch],
+            on_usage=lambda model, tokens: usage_totals.add("embed", model, tokens)
+        )
+        for doc, embedding in zip(batch, embeddings):
+            doc["embedding"] = embedding
+
+# Page URL of an index document id: ids are the urlsafe base64 of the page
+# URL, with a #passage-<n> fragment for passages (see chunking.py)
+def page_of(doc_id):
+    try:
+        return base64.urlsafe_b64decode(doc_id + "=" * (-len(doc_id) % 4)).decode("utf-8").split("#", 1)[0]
+    except ValueError:
+        return None
+
+# Upload in batches; returns the number of documents that failed
+def upload_documents(documents):
+    failed = 0
+    for start in range(0, len(documents), UPLOAD_BATCH_SIZE):
+        batch = documents[start:start + UPLOAD_BATCH_SIZE]
+        try:
+            results = search_client.upload_documents(documents=batch)
+            failed += sum(1 for r in results if r.status_code not in (200, 201))
+        except Exception as e:
+            print(f"Upload batch at {start} failed: {e}")
+            failed += len(batch)
+    return failed
+
+# Documents in the index that belong to a page scraped this run but were not
+# produced by it: whole pages replaced by passages (or the reverse), and
+# passages a page no longer has. Read from the index itself, so a fresh host
+# or a lost local copy still finds them; pages that failed to scrape or were
+# not reached keep their documents.
+def stale_documents(scraped, current_ids):
+    stale = []
+    for doc in search_client.search(search_text="*", select=["id"]):
+        if doc["id"] not in current_ids and page_of(doc["id"]) in scraped:
+            stale.append(doc["id"])
+    return stale
 
 async def main():
-    visited, documents, recipes = set(), [], []
+    visited, scraped, documents = set(), set(), []
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=False)
         page = await browser.new_page()
@@ -65,8 +143,8 @@ async def main():
             visited.add(url)
             print(f"Scraping: {url}")
             try:
-                doc = await extract_text_and_embed(page, url)
-                documents.append(doc)
+                documents.extend(page_documents(url, await extract_blocks(page, url)))
+                scraped.add(url)
             except Exception as e:
                 print(f"Failed to scrape {url}: {e}")
 
@@ -82,14 +160,41 @@ async def main():
 
         await browser.close()
 
-    print(f"Uploading {len(documents)} documents to Azure AI Search...")
-    results = search_client.upload_documents(documents=documents)
+    print(f"Embedding {len(documents)} documents...")
+    embed_documents(documents)
 
-    failed = [r for r in results if r.status_code not in (200, 201)]
+    # Keep a local copy for the in-process retriever (RETRIEVER=local)
+    local_index = os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX).split(",")[0]
+    os.makedirs(os.path.dirname(local_index), exist_ok=True)
+    with open(local_index, "w", encoding="utf-8") as f:
+        json.dump(documents, f)
+    if documents and os.getenv("LOCAL_STORE_PATH"):
+        write_store(
+            os.getenv("LOCAL_STORE_PATH"),
+            [doc["id"] for doc in documents],
+            [doc["text"] for doc in documents],
+            [doc["embedding"] for doc in documents],
+            os.getenv("LOCAL_STORE_DTYPE", "int8")
+        )
+
+    print(f"Uploading {len(documents)} documents to Azure AI Search...")
+    failed = upload_documents(documents)
     if failed:
-        print(f"{len(failed)} documents failed to upload.")
+        # The old documents still answer for pages whose new ones are missing
+        print(f"{failed} documents failed to upload; keeping stale documents until a clean run.")
     else:
         print("All documents uploaded successfully.")
+        stale = stale_documents(scraped, {doc["id"] for doc in documents})
+        if stale:
+            print(f"Removing {len(stale)} stale documents from Azure AI Search...")
+            for start in range(0, len(stale), UPLOAD_BATCH_SIZE):
+                search_client.delete_documents(documents=[{"id": doc_id} for doc_id in stale[start:start + UPLOAD_BATCH_SIZE]])
+
+    # Let running APIs know their cached answers are stale
+    bump_index_version()
+
+    print(usage_totals.report("OpenAI usage"))
+    print(f"Embedding cache: {embedding_cache.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
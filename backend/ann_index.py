@@ -0,0 +1,165 @@
+import argparse
+import os
+
+import numpy as np
+
+# Inverted-file (IVF) index over normalized embeddings. Vectors are grouped
+# under their nearest of `nlist` k-means centroids and stored list by list
+# in one contiguous matrix, so a query scores the centroids, then only the
+# rows of the `nprobe` best lists. Larger nprobe trades speed for recall, and
+# how many lists a given recall needs depends on how the data clusters, so
+# build() measures it: it keeps the smallest nprobe whose recall@10 against
+# exact search reaches `target_recall` on a sample of the indexed vectors,
+# and save() stores it with the index.
+# A freshly built index holds its own list-ordered float32 copy of the
+# vectors; a saved one holds only the centroids and the row order and scores
+# through `score_rows` of the retriever it is attached to, so a quantized
+# store is not duplicated in float32 in every worker.
+class IVFIndex:
+    def __init__(self, centroids, offsets, order, matrix=None, nprobe=8, score_rows=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.order = order
+        self.matrix = matrix
+        self.nprobe = nprobe
+        # (original row ids, normalized query) -> scores
+        self.score_rows = score_rows
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk=65536):
+        labels = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), chunk):
+            labels[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+        return labels
+
+    # Spherical k-means on a sample, then assign every vector to a list
+    @classmethod
+    def build(cls, matrix, nlist=None, iterations=10, sample_size=None, nprobe=None, seed=0, target_recall=0.95):
+        matrix = cls._normalize(np.asarray(matrix, dtype=np.float32))
+        n = len(matrix)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, sample_size or max(nlist * 40, 10000))
+        sample = matrix[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = cls._normalize(sums)
+
+        labels = cls._assign(matrix, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        index = cls(centroids, offsets, order, np.ascontiguousarray(matrix[order]), nprobe)
+        if nprobe is None:
+            index.calibrate(matrix, target_recall, seed=seed)
+        return index
+
+    # Smallest nprobe, doubling from 1, at which sampled vectors find at
+    # least `target_recall` of their k exact nearest neighbours (themselves
+    # excluded)
+    def calibrate(self, matrix, target_recall=0.95, queries=100, k=10, seed=0):
+        rng = np.random.default_rng(seed)
+        k = min(k, len(matrix) - 1)
+        nlist = len(self.centroids)
+        if k < 1:
+            self.nprobe = nlist
+            return self.nprobe
+        picks = rng.choice(len(matrix), min(queries, len(matrix)), replace=False)
+        truth = []
+        for row in picks:
+            scores = matrix @ matrix[row]
+            scores[row] = -np.inf
+            truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+        nprobe = 1
+        while nprobe < nlist:
+            found = sum(
+                len(expected & set(self.search(matrix[row], k + 1, nprobe=nprobe)[0].tolist()))
+                for row, expected in zip(picks, truth)
+            )
+            if found >= target_recall * k * len(picks):
+                break
+            nprobe *= 2
+        self.nprobe = min(nprobe, nlist)
+        return self.nprobe
+
+    # Returns (row ids in the original matrix, scores), best first
+    def search(self, query, k=10, nprobe=None):
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = self.order[rows]
+        if self.score_rows is not None:
+            scores = self.score_rows(ids, query)
+        else:
+            scores = self.matrix[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    # A directory of .npy files, opened with mmap by load()
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ("centroids", "offsets", "order"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(path, "nprobe.npy"), np.array(self.nprobe or 0))
+
+    # nprobe overrides the calibrated value saved with the index; an index
+    # saved without one probes 1 in 12 lists
+    @classmethod
+    def load(cls, path, nprobe=None, score_rows=None):
+        if not os.path.isdir(path):
+            raise ValueError(f"{path} is not an IVF index directory; rebuild it with ann_index.py")
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ("centroids", "offsets", "order")]
+        saved = os.path.join(path, "nprobe.npy")
+        if not nprobe and os.path.exists(saved):
+            nprobe = int(np.load(saved))
+        return cls(*arrays, nprobe=nprobe or max(1, len(arrays[0]) // 12), score_rows=score_rows)
+
+# Build the index offline from the store in LOCAL_STORE_PATH, or else from
+# the scraper dumps the local retriever loads
+def main():
+    from retrievers import DEFAULT_LOCAL_INDEX, LocalRetriever
+
+    parser = argparse.ArgumentParser(description="Build an IVF index for the local retriever")
+    parser.add_argument("--input", default=os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX))
+    parser.add_argument("--store", default=os.getenv("LOCAL_STORE_PATH"))
+    parser.add_argument("--out", default=os.getenv("LOCAL_ANN_INDEX", DEFAULT_LOCAL_INDEX + ".ivf"))
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--target-recall", type=float, default=float(os.getenv("ANN_TARGET_RECALL", "0.95")),
+                        help="recall@10 against exact search that the saved nprobe must reach")
+    args = parser.parse_args()
+
+    if args.store:
+        from embedding_store import EmbeddingStore
+
+        store = EmbeddingStore(args.store)
+        matrix = np.asarray(store.vectors, dtype=np.float32)
+        if store.scales is not None:
+            matrix *= store.scales[:, None]
+    else:
+        matrix = LocalRetriever.from_json(args.input.split(",")).matrix
+    index = IVFIndex.build(matrix, nlist=args.nlist, target_recall=args.target_recall)
+    index.save(args.out)
+    print(f"Indexed {len(matrix)} documents into {len(index.centroids)} lists at {args.out}, "
+          f"probing {index.nprobe} per query for {args.target_recall:.0%} recall@10")
+
+if __name__ == "__main__":
+    main()
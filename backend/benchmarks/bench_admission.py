@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else 0.0
+
+# Chat model tokens billed so far, from the Prometheus counters
+async def chat_model_tokens(http):
+    body = (await http.get("/metrics")).text
+    return sum(
+        float(line.rsplit(" ", 1)[1]) for line in body.splitlines()
+        if line.startswith("openai_tokens_total{") and 'stage="embed"' not in line
+    )
+
+# Fire `requests` distinct questions at once, at most `concurrency` open
+async def spike(http, label, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await http.post("/chat", json={"message": f"what can I bake with smarties? ({label} {i})"})
+            body = resp.json() if resp.headers.get("content-type") == "application/json" else {}
+            return time.perf_counter() - start, resp.status_code, body
+
+    tokens_before = await chat_model_tokens(http)
+    start = time.perf_counter()
+    samples = await asyncio.gather(*(one(i) for i in range(requests)))
+    return samples, time.perf_counter() - start, await chat_model_tokens(http) - tokens_before
+
+def report(label, samples, seconds, tokens, stub, calls_before, quota):
+    answered = sorted(latency for latency, status, body in samples if status == 200 and "response" in body)
+    rejected = sorted(latency for latency, status, body in samples if status == 503)
+    timed_out = sum(1 for _, status, _ in samples if status == 504)
+    failed = len(samples) - len(answered) - len(rejected) - timed_out
+    stats = stub.fetch_stats()
+    print(f"{label}")
+    print(f"  answered {len(answered):4d}   rejected (503) {len(rejected):4d}   timed out (504) {timed_out:4d}   "
+          f"failed {failed:4d}   429s from the deployment {stats['rate_limited'] - calls_before['rate_limited']:4d}")
+    print(f"  answers/s {len(answered) / seconds:5.2f}   chat model tokens/min {tokens / seconds * 60:8.0f} "
+          f"(quota {quota})   wall {seconds:5.1f} s")
+    print(f"  answered p50 {percentile(answered, 0.5) * 1000:7.1f} ms   p95 {percentile(answered, 0.95) * 1000:7.1f} ms   "
+          f"rejected p50 {percentile(rejected, 0.5) * 1000:7.1f} ms")
+
+# A spike of /chat requests against a chat deployment with a tokens-per-minute
+# quota: unmetered, every call goes out at once and the 429s, the SDK's retries
+# and the circuit breaker they trip turn most of the spike into errors; with
+# the token bucket set to the quota, calls go out at the quota rate and the
+# requests that could not be answered before their deadline are refused with
+# a quick 503. A last run with a small request queue shows the fast rejection
+# of requests beyond the queue.
+async def main():
+    parser = argparse.ArgumentParser(description="Admission control and TPM metering under a request spike")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--tpm", type=int, default=300000, help="tokens-per-minute quota of the chat deployment")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--deadline", type=float, default=30.0, help="CHAT_DEADLINE of every request")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, token_latency=0.001, chat_tpm=args.tpm)
+    configure_env(stub.start())
+    install_fake_graph(args.latency)
+    os.environ.update({
+        "ROUTER_MODE": "llm",
+        "CYPHER_VERBOSE": "0",
+        "SHARED_CACHE": "0",
+        "CHAT_DEADLINE": str(args.deadline),
+        "BREAKER_RESET_SECONDS": "5"
+    })
+
+    import main as backend
+    from admission import ConcurrencyLimiter, TokenBucket
+
+    def meter(per_minute):
+        quota = TokenBucket("gpt-4o-mini", per_minute) if per_minute else None
+        backend.openai_quotas["gpt-4o-mini"] = quota
+        for name in ("rewrite", "chat"):
+            backend.upstreams[name].quota = quota
+
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+            print(f"{args.requests} requests at once (at most {args.concurrency} open), chat quota {args.tpm} tokens/min, "
+                  f"deadline {args.deadline:.0f} s\n")
+            runs = [
+                ("unmetered", None, None),
+                ("token bucket at the quota", args.tpm, None),
+                ("token bucket, 8 running + 16 queued requests", args.tpm, ConcurrencyLimiter("requests", 8, 16))
+            ]
+            for label, per_minute, limiter in runs:
+                meter(per_minute)
+                backend.request_limiter = limiter or ConcurrencyLimiter("requests", 64, 256)
+                # Start each run with a closed breaker and a full deployment quota
+                for upstream in backend.upstreams.values():
+                    upstream.breaker.success()
+                await asyncio.sleep(10)
+                calls_before = stub.fetch_stats()
+                samples, seconds, tokens = await spike(http, label, args.requests, args.concurrency)
+                report(label, samples, seconds, tokens, stub, calls_before, args.tpm)
+            print(f"\nadmission: {(await http.get('/admission/stats')).json()}")
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+# The pre-async /chat vector path: synchronous clients called from an async handler
+def build_blocking_app():
+    from openai import AzureOpenAI
+    from azure.search.documents import SearchClient
+    from azure.search.documents.models import VectorizedQuery
+    from azure.core.credentials import AzureKeyCredential
+    from pydantic import BaseModel
+
+    client = AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    )
+    search_client = SearchClient(
+        endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+        index_name=os.getenv("AZURE_AI_SEARCH_INDEX"),
+        credential=AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_KEY"))
+    )
+    app = FastAPI()
+
+    class ChatRequest(BaseModel):
+        message: str
+
+    @app.post("/chat")
+    async def chat(req: ChatRequest):
+        client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "First, classify the query"},
+                {"role": "user", "content": f"User query: {req.message}"}
+            ]
+        )
+        embedding = client.embeddings.create(input=[req.message], model="text-embedding-3-small")
+        results = search_client.search(
+            search_text=None,
+            vector_queries=[VectorizedQuery(
+                kind="vector", vector=embedding.data[0].embedding, k_nearest_neighbors=10, fields="embedding"
+            )]
+        )
+        context = "\n\n".join(doc["text"] for doc in results if "text" in doc)
+        answer = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "system", "content": "answer"}, {"role": "user", "content": context}]
+        )
+        return {"response": answer.choices[0].message.content}
+
+    return app
+
+# Fire `total` requests with at most `concurrency` in flight
+async def drive(app, total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await http.post("/chat", json={"message": f"easy nescafe drinks {i}"})
+                latencies.append(time.perf_counter() - start)
+                if resp.status_code != 200 or "error" in resp.json():
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "errors": errors
+    }
+
+def report(name, stats):
+    print(f"{name:<10} {stats['throughput']:8.1f} req/s   p50 {stats['p50'] * 1000:8.1f} ms   errors {stats['errors']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent /chat throughput against local stand-ins")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, target="vector")
+    configure_env(stub.start())
+    install_fake_graph(args.latency)
+    # Keep every request on the same rewrite -> embed -> search -> answer path as the baseline
+    os.environ["ROUTER_MODE"] = "llm"
+
+    import main as backend
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.latency * 1000:.0f} ms per upstream call")
+    report("blocking", await drive(build_blocking_app(), args.requests, args.concurrency))
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        report("async", await drive(backend.app, args.requests, args.concurrency))
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+# Per-request cost of what the graph path used to rebuild on every request,
+# now done once at startup and refreshed in the background
+def main():
+    parser = argparse.ArgumentParser(description="Cypher prompt/chain construction cost per request")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--schema-latency", type=float, default=0.05, help="seconds per schema introspection")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=0)
+    configure_env(stub.start())
+    install_fake_graph(args.schema_latency)
+
+    import main as backend
+    from langchain.prompts import PromptTemplate
+
+    asyncio.run(backend.create_clients())
+    template = backend.CYPHER_PROMPT
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        PromptTemplate.from_template(template)
+    prompt_ms = (time.perf_counter() - start) / args.iterations * 1000
+
+    backend.graph.refresh_schema()
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        backend.build_cypher_chain()
+    chain_ms = (time.perf_counter() - start) / args.iterations * 1000
+
+    start = time.perf_counter()
+    for _ in range(10):
+        backend.graph.refresh_schema()
+    schema_ms = (time.perf_counter() - start) / 10 * 1000
+
+    print(f"PromptTemplate.from_template        {prompt_ms:8.3f} ms/request")
+    print(f"GraphCypherQAChain.from_llm         {chain_ms:8.3f} ms/request")
+    print(f"total eliminated per graph request  {prompt_ms + chain_ms:8.3f} ms")
+    print(f"schema refresh (background task)    {schema_ms:8.3f} ms/refresh")
+    stub.stop()
+
+if __name__ == "__main__":
+    main()
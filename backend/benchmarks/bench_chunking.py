@@ -0,0 +1,101 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import PageChunker, blocks_from_text
+from context_packer import STOPWORDS, ContextPacker
+from retrievers import LocalRetriever, parent_key, result_key
+from stubs import TEST_FILES
+
+DIM = 4096
+
+def words(text):
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS and len(w) > 2]
+
+# Hashed tf-idf vectors. The stand-in embeddings in stubs.py are random per
+# text, so a lexical embedding is used to make retrieval quality measurable.
+def lexical_embeddings(texts, idf):
+    matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word, tf in Counter(words(text)).items():
+            bucket = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little") % DIM
+            matrix[row, bucket] += (1 + np.log(tf)) * idf.get(word, 1.0)
+    return matrix
+
+# Sentences that occur on exactly one page, long enough to ask about
+def question_sentences(pages):
+    seen = Counter(line.strip() for page in pages for line in set(page["text"].splitlines()))
+    for page in pages:
+        for line in page["text"].splitlines():
+            line = line.strip()
+            if seen[line] == 1 and 12 <= len(line.split()) and len(line) <= 400:
+                yield page["url"], line
+
+# Prompt size and retrieval quality of whole-page documents against passages
+# of several sizes on pages.json. Each question is a handful of words from a
+# sentence that occurs on one page; a hit is the right page first, and the
+# answer counts as found when the whole sentence survives into the context.
+def main():
+    parser = argparse.ArgumentParser(description="Whole-page vs passage indexing on pages.json")
+    parser.add_argument("--sizes", default="128,256,512", help="passage sizes in tokens")
+    parser.add_argument("--k", type=int, default=10, help="documents retrieved per question")
+    parser.add_argument("--query-words", type=int, default=6)
+    args = parser.parse_args()
+
+    with open(os.path.join(TEST_FILES, "pages.json"), "r", encoding="utf-8") as f:
+        pages = json.load(f)
+    for page in pages:
+        page["url"] = result_key(page)
+
+    document_frequency = Counter(w for page in pages for w in set(words(page["text"])))
+    idf = {w: np.log(1 + len(pages) / df) for w, df in document_frequency.items()}
+
+    rng = np.random.default_rng(0)
+    questions = []
+    for url, sentence in question_sentences(pages):
+        content = words(sentence)
+        picked = sorted(rng.choice(len(content), min(args.query_words, len(content)), replace=False))
+        questions.append((url, sentence, " ".join(content[i] for i in picked)))
+    query_matrix = lexical_embeddings([q for _, _, q in questions], idf)
+    print(f"{len(pages)} pages, {len(questions)} questions, top-{args.k} retrieved, default packing budget\n")
+
+    systems = [("whole pages", [{"id": page["id"], "text": page["text"]} for page in pages])]
+    for size in (int(s) for s in args.sizes.split(",")):
+        chunker = PageChunker(max_tokens=size, overlap_tokens=size // 5)
+        passages = [p for page in pages for p in chunker.chunk(page["url"], blocks_from_text(page["text"]))]
+        systems.append((f"{size}-token passages", passages))
+
+    packer = ContextPacker()
+    for name, documents in systems:
+        retriever = LocalRetriever(
+            [doc["id"] for doc in documents],
+            [doc["text"] for doc in documents],
+            lexical_embeddings([doc["text"] for doc in documents], idf)
+        )
+        page_hits = retrieved = packed = 0
+        raw_tokens = []
+        packed_tokens = []
+        for (url, sentence, question), vector in zip(questions, query_matrix):
+            top, _ = retriever.top_k(vector, args.k)
+            results = [{"id": retriever.ids[i], "text": retriever.texts[i]} for i in top]
+            context, usage = packer.pack(results, question)
+            page_hits += parent_key(results[0]) == url
+            retrieved += any(sentence in doc["text"] for doc in results[:3])
+            packed += sentence in context
+            raw_tokens.append(usage["tokens_before"])
+            packed_tokens.append(usage["tokens_after"])
+        n = len(questions)
+        print(f"{name:<20} {len(documents):4d} docs   right page first {page_hits / n:6.1%}   "
+              f"answer in top 3 {retrieved / n:6.1%}   answer in packed prompt {packed / n:6.1%}   "
+              f"prompt tokens raw {np.mean(raw_tokens):6.0f} -> packed {np.mean(packed_tokens):5.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+# Bursts of identical messages, as when a promotion sends everyone the same
+# question at once; every burst uses a new message so earlier answers are
+# never in the semantic cache
+async def bursts(app, count, size, tag):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+        async def one(message):
+            start = time.perf_counter()
+            resp = await http.post("/chat", json={"message": message})
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+        for burst in range(count):
+            message = f"what can I bake with {tag} chocolate number {burst}?"
+            await asyncio.gather(*(one(message) for _ in range(size)))
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1]
+
+# Upstream calls and latency for the same bursts with and without coalescing
+async def main():
+    parser = argparse.ArgumentParser(description="Single-flight coalescing of identical /chat requests")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--size", type=int, default=50, help="identical requests per burst")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, target="vector", token_latency=0.005)
+    configure_env(stub.start())
+    install_fake_graph(args.latency)
+    # Every request pays the LLM rewrite, as without the local router
+    os.environ["ROUTER_MODE"] = "llm"
+
+    import main as backend
+    from single_flight import SingleFlight
+
+    print(f"{args.bursts} bursts of {args.size} identical requests, {args.latency * 1000:.0f} ms per upstream call")
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        for name, flights in (("no coalescing", None), ("single-flight", SingleFlight())):
+            backend.chat_flights = flights
+            before = stub.fetch_stats()
+            p50, worst = await bursts(backend.app, args.bursts, args.size, name.split()[0])
+            after = stub.fetch_stats()
+            calls = {kind: after[kind] - before[kind] for kind in ("chat", "embeddings", "search")}
+            total = sum(calls.values())
+            print(f"{name:<14} upstream calls {total:5d} ({calls['chat']} chat, {calls['embeddings']} embeddings, "
+                  f"{calls['search']} search)   p50 {p50 * 1000:7.1f} ms   max {worst * 1000:7.1f} ms")
+            if flights:
+                print(f"{'':<14} {flights.stats()}")
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
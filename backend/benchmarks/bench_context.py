@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import passage_id
+from context_packer import ContextPacker
+from retrievers import LocalRetriever, reciprocal_rank_fusion
+from stubs import TEST_FILES, make_fake_graph_class
+
+def report(name, samples, elapsed):
+    before = sum(s["tokens_before"] for s in samples)
+    after = sum(s["tokens_after"] for s in samples)
+    print(f"{name:<8} {before / len(samples):8.0f} -> {after / len(samples):6.0f} tokens/request   "
+          f"saved {1 - after / before:6.1%}   duplicates dropped {sum(s['duplicates'] for s in samples):3d}   "
+          f"packing {elapsed / len(samples) * 1000:6.2f} ms/request")
+
+# Prompt tokens sent with and without packing for vector hits and graph rows
+# built from the sample dumps, one query per sample recipe
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens before and after context packing")
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--doc-budget", type=int, default=400)
+    args = parser.parse_args()
+
+    packer = ContextPacker(budget=args.budget, doc_budget=args.doc_budget)
+    print(f"tokenizer: {packer.stats()['tokenizer']}, budget {args.budget}, per document {args.doc_budget}")
+
+    local = LocalRetriever.from_json([os.path.join(TEST_FILES, "pages.json"), os.path.join(TEST_FILES, "recipes.json")])
+    with open(os.path.join(TEST_FILES, "recipes.json"), "r", encoding="utf-8") as f:
+        recipes = json.load(f)
+    graph = make_fake_graph_class(latency=0)(refresh_schema=False)
+    rng = np.random.default_rng(0)
+
+    vector_queries = []
+    graph_queries = []
+    for recipe in recipes:
+        question = f"how do I make {recipe['title'].strip().lower()}"
+        vector = np.array(recipe["embedding"]) + 0.01 * rng.standard_normal(len(recipe["embedding"]))
+        top, scores = local.top_k(vector, 10)
+        hits = [{"id": local.ids[i], "text": local.texts[i], "score": float(s)} for i, s in zip(top, scores)]
+        vector_queries.append((hits, question))
+        # Template lookups by ingredient return one row per recipe, the LLM's
+        # Cypher often returns repeats; both go through the same packer
+        word = max(recipe["title"].lower().split(), key=len)
+        rows = graph.query("MATCH (r:Recipe) RETURN r", {"ingredients": [word], "tags": [], "limit": 10})
+        graph_queries.append((rows + rows[:2], question))
+
+    for name, queries in (("vector", vector_queries), ("graph", graph_queries)):
+        start = time.perf_counter()
+        samples = [packer.pack(results, question)[1] for results, question in queries]
+        report(name, samples, time.perf_counter() - start)
+
+    # Hybrid retrieval fuses a recipe's passages with its graph row, passages
+    # first (see main.hybrid_search); packing keeps the passages, not the row
+    recipe = recipes[0]
+    lines = recipe["text"].splitlines()
+    passages = [
+        {"id": passage_id(recipe["url"], n), "text": "\n".join(part)}
+        for n, part in enumerate((lines[:len(lines) // 2], lines[len(lines) // 2:]))
+    ]
+    row = {"r.title": recipe["title"], "r.url": recipe["url"], "r.instructions": recipe["instructions"]}
+    fused = [
+        result
+        for group, _ in reciprocal_rank_fusion([passages, [row]])
+        for result in sorted(group, key=lambda r: not r.get("text"))
+    ]
+    usage = packer.pack(fused, f"how do I make {recipe['title'].strip().lower()}")[1]
+    print(f"\none recipe as 2 passages + 1 graph row: kept {usage['kept']}, duplicates dropped {usage['duplicates']} "
+          f"(expected 2 and 1)")
+
+    results, question = vector_queries[0]
+    context, usage = packer.pack(results, question)
+    print(f"\npacked vector context for {question!r} ({usage['tokens_after']} tokens):")
+    print("  " + context[:600].replace("\n", "\n  "))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env
+
+# Embeds `count` distinct queries arriving as a Poisson process at `rate` per
+# second; returns per-query latencies in seconds
+async def arrivals(embed, count, rate, tag, rng):
+    latencies = []
+
+    async def one(i):
+        start = time.perf_counter()
+        await embed([f"{tag} query number {i}"])
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    for i in range(count):
+        tasks.append(asyncio.create_task(one(i)))
+        await asyncio.sleep(rng.exponential(1 / rate))
+    await asyncio.gather(*tasks)
+    return sorted(latencies)
+
+# Embeddings requests and query latency with one call per query against
+# micro-batching at several windows
+async def main():
+    parser = argparse.ArgumentParser(description="Query embedding micro-batching")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=500, help="queries per second")
+    parser.add_argument("--windows", default="0,2,5,10", help="batching windows in ms (0 = no batching)")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per embeddings call")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency)
+    configure_env(stub.start())
+
+    from openai import AsyncAzureOpenAI
+    from embedding_batcher import EmbeddingBatcher
+    from embedding_cache import default_cache, embed_texts_async
+
+    client = AsyncAzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    )
+    cache = default_cache()
+    rng = np.random.default_rng(0)
+
+    print(f"{args.queries} distinct queries at {args.rate:.0f}/s, {args.latency * 1000:.0f} ms per embeddings call")
+    for window in (float(w) for w in args.windows.split(",")):
+        if window:
+            batcher = EmbeddingBatcher(client, cache, window=window / 1000)
+            embed = batcher.embed
+        else:
+            embed = lambda texts: embed_texts_async(client, cache, texts)
+        before = stub.fetch_stats()["embeddings"]
+        latencies = await arrivals(embed, args.queries, args.rate, f"window {window}", rng)
+        calls = stub.fetch_stats()["embeddings"] - before
+        p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+        name = f"window {window:g} ms" if window else "no batching"
+        print(f"{name:<14} {calls:5d} embeddings calls ({args.queries / calls:5.1f} queries/call)   "
+              f"p50 {p(0.5):6.1f} ms   p99 {p(0.99):6.1f} ms")
+
+    await client.close()
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+from retrievers import reciprocal_rank_fusion, result_key
+
+QUERIES = [
+    "chocolate chip cookies", "iced coffee drinks", "easy smarties dessert", "something with caramel",
+    "quick breakfast ideas", "kitkat cake", "hot chocolate for kids", "coffee crisp treats",
+]
+
+async def timed(retrieve, query):
+    start = time.perf_counter()
+    context, _ = await retrieve(query)
+    return (time.perf_counter() - start) * 1000, context
+
+def report(name, samples):
+    times = sorted(ms for ms, _ in samples)
+    empty = sum(1 for _, context in samples if not context)
+    print(f"{name:<28} p50 {times[len(times) // 2]:8.1f} ms   max {times[-1]:8.1f} ms   empty contexts {empty}/{len(samples)}")
+
+# Retrieval latency of the routed path (one backend, the router's pick) and the
+# hybrid path (both backends concurrently, fused with RRF), then hybrid again
+# with a graph slower than its deadline
+async def main():
+    parser = argparse.ArgumentParser(description="Routed vs hybrid retrieval latency")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per OpenAI/Search call")
+    parser.add_argument("--graph-latency", type=float, default=0.2, help="seconds per Neo4j query")
+    parser.add_argument("--graph-timeout", type=float, default=0.5, help="HYBRID_GRAPH_TIMEOUT for the slow-graph run")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, token_latency=0)
+    configure_env(stub.start())
+    fake_graph = install_fake_graph(args.graph_latency)
+
+    import main as backend
+
+    async with backend.lifespan(backend.app):
+        await backend.wait_ready()
+        for query in QUERIES:
+            # Warm the embedding cache so every run pays the same costs
+            await backend.embed_query(query)
+
+        backend.retrieval_mode = "routed"
+        report("routed, vector", [await timed(lambda q: backend.retrieve_context("vector", q), q) for q in QUERIES])
+        report("routed, graph", [await timed(lambda q: backend.retrieve_context("graph", q), q) for q in QUERIES])
+
+        backend.retrieval_mode = "hybrid"
+        samples = [await timed(lambda q: backend.retrieve_context("vector", q), q) for q in QUERIES]
+        report("hybrid", samples)
+
+        # Same queries against a graph that answers after the deadline
+        backend.hybrid_timeouts["graph"] = args.graph_timeout
+        query = fake_graph.query
+        def slow_query(self, *a, **kw):
+            time.sleep(args.graph_timeout * 3)
+            return query(self, *a, **kw)
+        fake_graph.query = slow_query
+        report(f"hybrid, graph > {args.graph_timeout}s deadline", [await timed(lambda q: backend.retrieve_context("vector", q), q) for q in QUERIES])
+        fake_graph.query = query
+        print(f"graph timeouts: {backend.route_stats['hybrid_graph_timeout']}")
+
+        print(f"\nfused results for {QUERIES[0]!r}:")
+        vector_results = await backend.search_vector(QUERIES[0])
+        graph_results = await backend.search_graph(QUERIES[0])
+        for results, score in reciprocal_rank_fusion([vector_results, graph_results], limit=8):
+            sources = "+".join(sorted({"vector" if "text" in r else "graph" for r in results}))
+            print(f"  {score:.4f}  {sources:<12}  {result_key(results[0])}")
+
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
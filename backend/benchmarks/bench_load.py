@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph, serve_app
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Labelled queries of the router evaluation set, cycled. A tag and request
+# number are appended so the answer cache and coalescing never hide upstream work.
+def workload(total, labelled, tag):
+    return [
+        (f"{labelled[i % len(labelled)]['query']} ({tag} request {i})", labelled[i % len(labelled)]["label"])
+        for i in range(total)
+    ]
+
+# One /chat request; returns (route target, ok)
+async def send_json(http, message):
+    resp = await http.post("/chat", json={"message": message})
+    if resp.status_code != 200:
+        return None, False
+    body = resp.json()
+    return body.get("target", "reply" if "response" in body else None), "error" not in body
+
+# One /chat/stream request read to the end; returns (route target, ok)
+async def send_stream(http, message):
+    target, ok = None, False
+    async with http.stream("POST", "/chat/stream", json={"message": message}) as resp:
+        if resp.status_code != 200:
+            return None, False
+        event = None
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "meta":
+                    target = data.get("target")
+                elif event == "error":
+                    return target, False
+                elif event == "done":
+                    ok = True
+    return target, ok
+
+# Send every request with at most `concurrency` in flight; returns the
+# samples as (target, seconds, ok) and the wall-clock time
+async def drive(url, requests, concurrency, send):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as http:
+        async def one(message, label):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    target, ok = await send(http, message)
+                except httpx.HTTPError:
+                    target, ok = None, False
+                samples.append((target or label, time.perf_counter() - start, ok))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(message, label) for message, label in requests))
+        return samples, time.perf_counter() - start
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+# Throughput, latency percentiles and error rate per route target and overall
+def summarize(samples, elapsed):
+    groups = {}
+    for target, seconds, ok in samples:
+        groups.setdefault(target, []).append((seconds, ok))
+    groups["all"] = [(seconds, ok) for _, seconds, ok in samples]
+    summary = {}
+    for target, rows in groups.items():
+        latencies = sorted(seconds for seconds, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        summary[target] = {
+            "requests": len(rows),
+            "throughput": round(len(rows) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4)
+        }
+    return summary
+
+def report(concurrency, summary, upstream):
+    print(f"\nconcurrency {concurrency}   upstream calls {upstream}")
+    print(f"{'target':<8} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for target, s in sorted(summary.items(), key=lambda item: item[0] == "all"):
+        print(f"{target:<8} {s['requests']:8d} {s['throughput']:8.1f} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} "
+              f"{s['p99_ms']:9.1f} {s['errors']:4d} ({s['error_rate']:.1%})")
+
+# Drives the API, served by uvicorn on a local socket, with a mix of vector,
+# graph and reply queries against the local stand-ins at several concurrency
+# levels
+async def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /chat against local stand-ins")
+    parser.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,10,50", help="comma-separated concurrency levels")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--queries", default=os.path.join(BENCH_DIR, "router_eval.json"),
+                        help="labelled queries ({query, label}) to cycle through")
+    parser.add_argument("--router", choices=["llm", "local"], default="llm",
+                        help="llm routes every query by its label through the stand-in")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="sigma of the lognormal latency factor")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="seconds per answer word")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="seconds per Neo4j query")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls that fail")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    stub = StubServer(
+        latency=args.latency,
+        target={item["query"]: item["label"] for item in labelled},
+        token_latency=args.token_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate
+    )
+    configure_env(stub.start())
+    install_fake_graph(args.graph_latency)
+    os.environ["ROUTER_MODE"] = args.router
+    os.environ["CYPHER_VERBOSE"] = "0"
+
+    import main as backend
+
+    send = send_json if args.endpoint == "chat" else send_stream
+    results = {}
+    print(f"{args.requests} /{args.endpoint.replace('stream', 'chat/stream')} requests per level, "
+          f"{args.latency * 1000:.0f} ms per upstream call (jitter {args.jitter}), error rate {args.error_rate:.1%}")
+    server, task, url = await serve_app(backend.app)
+    await backend.wait_ready()
+    for level in (int(c) for c in args.concurrency.split(",")):
+        before = stub.fetch_stats()
+        samples, elapsed = await drive(url, workload(args.requests, labelled, f"c{level}"), level, send)
+        after = stub.fetch_stats()
+        upstream = {kind: after[kind] - before[kind] for kind in after}
+        summary = summarize(samples, elapsed)
+        report(level, summary, upstream)
+        results[level] = {"summary": summary, "upstream": upstream}
+
+    server.should_exit = True
+    await task
+    stub.stop()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
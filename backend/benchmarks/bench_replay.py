@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fresh embedding, Cypher, shared and answer caches, so every round runs the same
+# calls as the recording did
+def reset_caches(backend):
+    from embedding_cache import EmbeddingCache
+    from cypher_cache import CypherCache
+    from shared_cache import SharedCache
+
+    scratch = tempfile.mkdtemp(prefix="nestle-replay-")
+    backend.embedding_cache = EmbeddingCache(path=os.path.join(scratch, "embeddings.sqlite"))
+    if backend.embedding_batcher:
+        backend.embedding_batcher.cache = backend.embedding_cache
+    backend.cypher_cache = CypherCache(os.path.join(scratch, "cypher_cache.sqlite"))
+    if backend.shared_cache:
+        backend.shared_cache = SharedCache(os.path.join(scratch, "shared_cache.sqlite"))
+    backend.answer_cache.clear()
+
+def parse_server_timing(header):
+    stages = {}
+    for entry in header.split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        stages[name] = float(duration)
+    return stages
+
+# Every query once, one after another; returns per-request latencies in ms
+# and the Server-Timing stages of each request
+async def run_round(app, queries):
+    latencies, stages = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+        for query in queries:
+            start = time.perf_counter()
+            resp = await http.post("/chat", json={"message": query})
+            resp.raise_for_status()
+            if "error" in resp.json():
+                raise RuntimeError(resp.json()["error"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            stages.append(parse_server_timing(resp.headers["server-timing"]))
+    return latencies, stages
+
+def report(name, latencies, stages):
+    names = [stage for stage in stages[0] if stage != "total"] if stages else []
+    for timings in stages:
+        names += [stage for stage in timings if stage not in names and stage != "total"]
+    breakdown = "  ".join(
+        f"{stage} {statistics.median(t.get(stage, 0.0) for t in stages):.1f}" for stage in names
+    )
+    print(f"{name:<10} p50 {statistics.median(latencies):7.1f} ms   total {sum(latencies):8.1f} ms   stages (median ms): {breakdown}")
+
+# Records the query set's upstream calls against the stand-ins (or the live
+# services with --live), then replays them over several rounds without any
+# network access and shows how little the latency of our own code varies
+async def main():
+    parser = argparse.ArgumentParser(description="Record/replay of upstream calls for deterministic benchmarks")
+    parser.add_argument("phase", choices=["record", "replay"])
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "nestle-upstream.jsonl"))
+    parser.add_argument("--queries", default=os.path.join(BENCH_DIR, "router_eval.json"))
+    parser.add_argument("--limit", type=int, default=20, help="queries taken from --queries")
+    parser.add_argument("--rounds", type=int, default=5, help="replay rounds")
+    parser.add_argument("--scale", type=float, default=1.0, help="replayed latency scale (0 = none)")
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in seconds per upstream call when recording")
+    parser.add_argument("--jitter", type=float, default=0.5, help="stand-in latency jitter when recording")
+    parser.add_argument("--live", action="store_true", help="record the services configured in .env")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = json.load(f)[:args.limit]
+    queries = [item["query"] for item in labelled]
+
+    stub = None
+    if args.phase == "record":
+        if os.path.exists(args.fixtures):
+            os.remove(args.fixtures)
+        if not args.live:
+            stub = StubServer(
+                latency=args.latency, jitter=args.jitter,
+                target={item["query"]: item["label"] for item in labelled}
+            )
+            configure_env(stub.start())
+            install_fake_graph(args.latency)
+    else:
+        # Nothing listens here: any call missing from the fixtures fails loudly
+        configure_env("http://127.0.0.1:9")
+        os.environ["NEO4J_URI"] = "bolt://127.0.0.1:9"
+    if args.live:
+        scratch = tempfile.mkdtemp(prefix="nestle-replay-")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(scratch, "embeddings.sqlite")
+        os.environ["CYPHER_CACHE_PATH"] = os.path.join(scratch, "cypher_cache.sqlite")
+        os.environ["SHARED_CACHE_PATH"] = os.path.join(scratch, "shared_cache.sqlite")
+    os.environ.update({
+        "UPSTREAM_MODE": args.phase,
+        "UPSTREAM_FIXTURES": args.fixtures,
+        "UPSTREAM_REPLAY_SCALE": str(args.scale),
+        "SERVER_TIMING": "1",
+        "CYPHER_VERBOSE": "0"
+    })
+
+    import main as backend
+
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        if args.phase == "record":
+            latencies, stages = await run_round(backend.app, queries)
+            report("recorded", latencies, stages)
+        else:
+            medians = []
+            for i in range(args.rounds):
+                reset_caches(backend)
+                latencies, stages = await run_round(backend.app, queries)
+                report(f"round {i + 1}", latencies, stages)
+                medians.append(statistics.median(latencies))
+            spread = (max(medians) - min(medians)) / statistics.mean(medians)
+            print(f"p50 spread across rounds: {spread:.1%}   replay scale {args.scale}")
+        print(backend.upstream.stats())
+    if stub:
+        stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+# Send the queries with at most `concurrency` in flight; returns (seconds,
+# status code, body, Server-Timing header) per request in order
+async def send_all(http, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await http.post("/chat", json={"message": query})
+            return time.perf_counter() - start, resp.status_code, resp.json(), resp.headers.get("server-timing", "")
+
+    return await asyncio.gather(*(one(query) for query in queries))
+
+# Time each request spent in the given Server-Timing stages
+def stage_time(samples, stages):
+    totals = []
+    for *_, header in samples:
+        total = 0.0
+        for entry in header.split(","):
+            name, _, duration = entry.strip().partition(";dur=")
+            if name in stages:
+                total += float(duration) / 1000
+        totals.append((total, 200, {}, ""))
+    return totals
+
+def latency_line(label, samples):
+    latencies = sorted(sample[0] for sample in samples)
+    errors = sum(1 for _, status, body, _ in samples if status != 200 or "error" in body)
+    print(f"{label:<38} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms   p95 {percentile(latencies, 0.95) * 1000:7.1f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms   max {latencies[-1] * 1000:7.1f} ms   errors {errors}")
+
+# Hedged requests, circuit breaking and the request deadline against the
+# local stand-ins: tail latency with heavy-tailed upstream latency with and
+# without hedging; graph queries during a Neo4j outage, before and after its
+# breaker opens and once it recovers; and a request that would hang on a
+# stalled Neo4j without a deadline
+async def main():
+    parser = argparse.ArgumentParser(description="Deadlines, hedged requests and circuit breakers")
+    parser.add_argument("--requests", type=int, default=300, help="requests per hedging run")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.03, help="median seconds per upstream call")
+    parser.add_argument("--jitter", type=float, default=0.8, help="sigma of the lognormal latency factor")
+    parser.add_argument("--neo4j-timeout", type=float, default=0.5)
+    parser.add_argument("--deadline", type=float, default=1.0, help="request deadline for the stalled-Neo4j run")
+    args = parser.parse_args()
+
+    with open(os.path.join(BENCH_DIR, "router_eval.json"), "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    stub = StubServer(
+        latency=args.latency, jitter=args.jitter, token_latency=0.001,
+        target={item["query"]: item["label"] for item in labelled}
+    )
+    configure_env(stub.start())
+    fake_graph = install_fake_graph(0.01)
+    os.environ.update({
+        "ROUTER_MODE": "llm",
+        "CYPHER_VERBOSE": "0",
+        "QUERY_EMBED_WINDOW_MS": "0",
+        "NEO4J_TIMEOUT": str(args.neo4j_timeout),
+        "BREAKER_FAILURES": "5",
+        "BREAKER_RESET_SECONDS": "5",
+        "SERVER_TIMING": "1"
+    })
+
+    import main as backend
+    from resilience import Hedger
+
+    graph_queries = [item["query"] for item in labelled if item["label"] == "graph"]
+    workload = lambda tag, pool, n: [f"{pool[i % len(pool)]} ({tag} {i})" for i in range(n)]
+
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+            queries = [item["query"] for item in labelled]
+            print(f"hedging: {args.requests} requests, upstream latency {args.latency * 1000:.0f} ms x lognormal({args.jitter})")
+            for hedged in (False, True):
+                for name in ("embeddings", "rewrite"):
+                    backend.upstreams[name].hedger = Hedger(name, backend.hedge_quantile) if hedged else None
+                label = "hedged" if hedged else "not hedged"
+                samples = await send_all(http, workload(label, queries, args.requests), args.concurrency)
+                latency_line(f"{label}: embed + rewrite stages", stage_time(samples, {"embed", "rewrite"}))
+                latency_line(f"{label}: whole request", samples)
+            for name in ("embeddings", "rewrite"):
+                print(f"  {name}: {backend.upstreams[name].hedger.stats()}")
+
+            print(f"\nNeo4j outage: each query hangs until the {args.neo4j_timeout}s timeout")
+            fake_graph.outage = "stall"
+            samples = await send_all(http, workload("outage", graph_queries, 20), 1)
+            latency_line("first 5 graph queries (breaker closed)", samples[:5])
+            latency_line("next 15 (breaker open)", samples[5:])
+            print(f"  answered from the vector index: {backend.route_stats['graph_fallback']}   "
+                  f"neo4j breaker: {backend.upstreams['neo4j'].breaker.stats()}")
+            fake_graph.outage = None
+            await asyncio.sleep(backend.upstreams["neo4j"].breaker.reset_timeout)
+            samples = await send_all(http, workload("recovered", graph_queries, 10), 1)
+            latency_line("after recovery (half-open probe)", samples)
+            print(f"  neo4j breaker: {backend.upstreams['neo4j'].breaker.stats()}")
+
+            print(f"\nrequest deadline {args.deadline}s, Neo4j stalled with a 10s timeout")
+            backend.chat_deadline = args.deadline
+            backend.upstreams["neo4j"].timeout = backend.graph.timeout = 10
+            backend.upstreams["neo4j"].breaker.success()
+            fake_graph.outage, fake_graph.stall = "stall", 3.0
+            samples = await send_all(http, workload("deadline", graph_queries, 3), 1)
+            latency_line("graph queries", samples)
+            print(f"  statuses {[sample[1] for sample in samples]}   first body {samples[0][2]}")
+            fake_graph.outage = None
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
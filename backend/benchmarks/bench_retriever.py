@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from stubs import StubServer, configure_env, fake_embedding, TEST_FILES
+
+# Per-query latency of the Azure retriever (against the stand-in, with its
+# simulated network latency) and the in-process retriever on the sample dumps
+async def main():
+    parser = argparse.ArgumentParser(description="Azure vs in-process vector retrieval latency")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.03, help="simulated Azure round-trip in seconds")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency)
+    configure_env(stub.start())
+
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.aio import SearchClient
+    from retrievers import AzureSearchRetriever, LocalRetriever
+
+    search_client = SearchClient(
+        endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+        index_name=os.getenv("AZURE_AI_SEARCH_INDEX"),
+        credential=AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_KEY"))
+    )
+    paths = [os.path.join(TEST_FILES, "pages.json"), os.path.join(TEST_FILES, "recipes.json")]
+    start = time.perf_counter()
+    local = LocalRetriever.from_json(paths)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    vectors = [fake_embedding(f"query {i}").tolist() for i in range(args.queries)]
+    for name, retriever in (("azure", AzureSearchRetriever(search_client)), ("local", local)):
+        start = time.perf_counter()
+        for vector in vectors:
+            await retriever.search(vector, k=10)
+        per_query = (time.perf_counter() - start) / args.queries * 1000
+        print(f"{name:<6} {per_query:8.3f} ms/query")
+
+    # Both backends must agree on the top hits for the same corpus
+    vector = vectors[0]
+    azure_ids = [doc["id"] for doc in await AzureSearchRetriever(search_client).search(vector, k=10)]
+    local_ids = [doc["id"] for doc in await local.search(vector, k=10)]
+    print(f"local index: {len(local.ids)} documents loaded in {load_ms:.1f} ms, top-10 overlap with azure {len(set(azure_ids) & set(local_ids))}/10")
+
+    await search_client.close()
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+# Compare the local router with the LLM router on the labelled evaluation set.
+# Uses the credentials in backend/.env unless --stub is given (stand-in
+# embeddings are random, so --stub only exercises the code path).
+async def main():
+    parser = argparse.ArgumentParser(description="Local router vs LLM router on a labelled set")
+    parser.add_argument("--stub", action="store_true", help="run against local stand-ins")
+    parser.add_argument("--min-margin", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        stub = StubServer(latency=0.3)
+        configure_env(stub.start())
+        install_fake_graph(0.05)
+
+    os.environ["ROUTER_MODE"] = "llm"
+    import main as backend
+    from query_router import build_router
+    from cypher_templates import fetch_slot_vocabulary
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_eval.json")) as f:
+        samples = json.load(f)
+
+    await backend.create_clients()
+    slot_vocabulary = await asyncio.to_thread(fetch_slot_vocabulary, backend.graph)
+    vocabulary = slot_vocabulary["ingredient"] + slot_vocabulary["tag"]
+    router = await build_router(backend.embed_texts, vocabulary, min_margin=args.min_margin)
+    embeddings = await backend.embed_texts([s["query"] for s in samples])
+
+    covered = local_correct = llm_correct = agree = 0
+    local_time = llm_time = 0.0
+    for sample, embedding in zip(samples, embeddings):
+        start = time.perf_counter()
+        local, _ = router.route(sample["query"], embedding)
+        local_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            llm, _ = await backend.classify_query(sample["query"])
+        except Exception:
+            llm = None
+        llm_time += time.perf_counter() - start
+
+        llm_correct += llm == sample["label"]
+        if local:
+            covered += 1
+            local_correct += local == sample["label"]
+            agree += local == llm
+
+    n = len(samples)
+    llm_ms = llm_time / n * 1000
+    print(f"{n} labelled queries, {len(vocabulary)} vocabulary terms")
+    print(f"LLM router      accuracy {llm_correct / n:6.1%}   {llm_ms:7.1f} ms/query")
+    print(f"local router    coverage {covered / n:6.1%}   {local_time / n * 1000:7.3f} ms/query")
+    if covered:
+        print(f"  on covered    accuracy {local_correct / covered:6.1%}   agreement with LLM {agree / covered:6.1%}")
+    print(f"latency saved   {covered / n * llm_ms:7.1f} ms per request on average")
+
+    if stub:
+        stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+# A conversation that keeps refining one request
+FOLLOW_UPS = [
+    "what can I bake with smarties?",
+    "make it dairy-free",
+    "something quicker, under 30 minutes",
+    "what about for a kids' party?",
+    "can I swap the flour for oats?",
+    "give me one more option",
+    "which of those is easiest?",
+    "how many does it serve?",
+]
+
+# A typical answer length, so resent history grows like it would in production
+ANSWER = " ".join(["• **Smarties Cookies**: chewy cookies with Smarties, ready in 25 minutes."] * 8)
+
+# Prompt tokens billed for the request itself (summaries run in the background)
+def prompt_tokens(body):
+    return body["usage"]["prompt_tokens"]
+
+# Summary prompt tokens from the Prometheus counters
+async def summary_tokens(http):
+    body = (await http.get("/metrics")).text
+    return int(sum(
+        float(line.rsplit(" ", 1)[1]) for line in body.splitlines()
+        if line.startswith("openai_tokens_total{") and 'stage="summarize"' in line and 'kind="prompt"' in line
+    ))
+
+# One conversation of `turns` requests; the client either resends the whole
+# transcript in every message or sends only the new message and a session ID
+async def converse(http, turns, mode, backend):
+    session_id = str(uuid.uuid4())
+    transcript = []
+    rows = []
+    for i in range(turns):
+        question = f"{FOLLOW_UPS[i % len(FOLLOW_UPS)]} ({mode} {session_id[:8]})"
+        if mode == "resend":
+            message = "\n".join(transcript + [f"User: {question}"])
+            payload = {"message": message}
+        else:
+            payload = {"message": question, "session_id": session_id}
+        start = time.perf_counter()
+        resp = await http.post("/chat", json=payload)
+        resp.raise_for_status()
+        body = resp.json()
+        rows.append((prompt_tokens(body), (time.perf_counter() - start) * 1000))
+        transcript += [f"User: {question}", f"Assistant: {body['response']}"]
+        # Let background summaries finish between turns, as a user's think time would
+        await asyncio.gather(*backend.background_tasks)
+    return rows
+
+# Prompt tokens and latency per turn of a long conversation, resending the
+# transcript from the client versus server-side sessions with a rolling
+# summary and a history token budget
+async def main():
+    parser = argparse.ArgumentParser(description="Per-turn cost of multi-turn conversations")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per upstream call")
+    parser.add_argument("--token-latency", type=float, default=0.0005, help="seconds per answer word")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, token_latency=args.token_latency, answer=ANSWER)
+    configure_env(stub.start())
+    install_fake_graph(args.latency)
+    # The stub rewrites a follow-up to itself, so repeated follow-ups would be answer cache hits
+    os.environ.update({
+        "RESPONSE_USAGE": "1", "ROUTER_MODE": "llm", "CYPHER_VERBOSE": "0",
+        "SEMANTIC_CACHE_MAX_ENTRIES": "0", "SHARED_CACHE": "0",
+    })
+
+    import main as backend
+
+    async with backend.app.router.lifespan_context(backend.app):
+        await backend.wait_ready()
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+            resend = await converse(http, args.turns, "resend", backend)
+            session = await converse(http, args.turns, "session", backend)
+            summaries = await summary_tokens(http)
+            stats = (await http.get("/sessions/stats")).json()
+    stub.stop()
+
+    print(f"{args.turns}-turn conversation, prompt tokens of the rewrite and answer calls per turn")
+    print(f"{'turn':>4} {'resend tokens':>14} {'resend ms':>10} {'session tokens':>15} {'session ms':>11}")
+    for turn in sorted({1, 2, 5, 10, 15, 20, args.turns}):
+        if turn <= args.turns:
+            (r_tokens, r_ms), (s_tokens, s_ms) = resend[turn - 1], session[turn - 1]
+            print(f"{turn:4d} {r_tokens:14d} {r_ms:10.1f} {s_tokens:15d} {s_ms:11.1f}")
+    print(f"total prompt tokens: resend {sum(t for t, _ in resend)}, "
+          f"session {sum(t for t, _ in session)} + {summaries} for {stats['summaries']} background summaries")
+    print(f"average history tokens per session request: {stats['avg_history_tokens']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# One API worker process on its own port
+def run_worker(port, graph_latency):
+    import uvicorn
+
+    install_fake_graph(graph_latency)
+    import main as backend
+    uvicorn.run(backend.app, host="127.0.0.1", port=port, log_level="warning")
+
+# Popular questions asked far more often than the rest, as in real traffic
+def workload(total, queries, skew, seed=7):
+    weights = [1 / (rank + 1) ** skew for rank in range(len(queries))]
+    return random.Random(seed).choices(queries, weights=weights, k=total)
+
+# Requests answered from a cache, read from the Prometheus counters of every worker
+async def cached_requests(http, urls):
+    total = 0
+    for url in urls:
+        body = (await http.get(f"{url}/metrics")).text
+        for line in body.splitlines():
+            if line.startswith("chat_requests_total{") and 'outcome="cached"' in line:
+                total += float(line.rsplit(" ", 1)[1])
+    return int(total)
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+# Starts `workers` API processes sharing one cache directory, sends the
+# workload round-robin across them (as a load balancer would) and returns
+# hit rate, latency and upstream chat calls
+async def run(workers, shared, messages, concurrency, stub, graph_latency):
+    scratch = tempfile.mkdtemp(prefix="nestle-shared-")
+    os.environ.update({
+        "EMBEDDING_CACHE_PATH": os.path.join(scratch, "embeddings.sqlite"),
+        "CYPHER_CACHE_PATH": os.path.join(scratch, "cypher_cache.sqlite"),
+        "SHARED_CACHE_PATH": os.path.join(scratch, "shared_cache.sqlite"),
+        "SHARED_CACHE": "1" if shared else "0"
+    })
+    context = multiprocessing.get_context("spawn")
+    ports = [free_port() for _ in range(workers)]
+    processes = [context.Process(target=run_worker, args=(port, graph_latency), daemon=True) for port in ports]
+    for process in processes:
+        process.start()
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+
+    try:
+        async with httpx.AsyncClient(timeout=300) as http:
+            for url in urls:
+                while True:
+                    try:
+                        if (await http.get(f"{url}/ready")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.05)
+            before = stub.fetch_stats()["chat"]
+
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def one(i, message):
+                async with semaphore:
+                    start = time.perf_counter()
+                    resp = await http.post(f"{urls[i % workers]}/chat", json={"message": message})
+                    resp.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i, message) for i, message in enumerate(messages)))
+            elapsed = time.perf_counter() - start
+            hits = await cached_requests(http, urls)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    latencies.sort()
+    return {
+        "hit_rate": hits / len(messages),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "throughput": len(messages) / elapsed,
+        "chat_calls": stub.fetch_stats()["chat"] - before
+    }
+
+# Hit rate and latency of a skewed, repeating /chat workload served by 1, 4
+# and 8 worker processes, with each worker caching only for itself
+# (SHARED_CACHE=0) and with the cache tier shared by all of them
+async def main():
+    parser = argparse.ArgumentParser(description="Answer cache hit rate across worker processes")
+    parser.add_argument("--workers", default="1,4,8", help="comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of question popularity")
+    parser.add_argument("--queries", default=os.path.join(BENCH_DIR, "router_eval.json"))
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="seconds per Neo4j query")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    stub = StubServer(latency=args.latency, target={item["query"]: item["label"] for item in labelled})
+    configure_env(stub.start())
+    os.environ["CYPHER_VERBOSE"] = "0"
+    messages = workload(args.requests, [item["query"] for item in labelled], args.skew)
+    print(f"{args.requests} requests over {len(set(messages))} distinct questions, concurrency {args.concurrency}")
+    print(f"{'workers':>7} {'cache':<9} {'hit rate':>8} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>7} {'chat calls':>10}")
+
+    for workers in (int(n) for n in re.split(r"\s*,\s*", args.workers)):
+        for shared in (False, True):
+            result = await run(workers, shared, messages, args.concurrency, stub, args.graph_latency)
+            print(f"{workers:7d} {'shared' if shared else 'private':<9} {result['hit_rate']:8.1%} "
+                  f"{result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['throughput']:7.1f} {result['chat_calls']:10d}")
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubServer, configure_env, install_fake_graph, serve_app
+
+# One cold start in this process: import main, listen, poll /ready, then
+# answer one /chat; prints the timings as JSON
+async def cold_start(graph_latency):
+    # The Neo4j stand-in imports langchain_neo4j up front, so neo4j_connect
+    # reads lower here than against a real server
+    install_fake_graph(graph_latency)
+    os.environ["CYPHER_VERBOSE"] = "0"
+    process_start = time.perf_counter()
+    import main as backend
+    timings = {"import_s": time.perf_counter() - process_start}
+
+    server, task, url = await serve_app(backend.app)
+    timings["listening_s"] = time.perf_counter() - process_start
+    async with httpx.AsyncClient(base_url=url, timeout=60) as http:
+        while (await http.get("/ready")).status_code != 200:
+            await asyncio.sleep(0.01)
+        timings["ready_s"] = time.perf_counter() - process_start
+        resp = await http.post("/chat", json={"message": "what can I bake with smarties?"})
+        resp.raise_for_status()
+        timings["first_answer_s"] = time.perf_counter() - process_start
+        timings["steps_ms"] = (await http.get("/ready")).json()["steps"]
+    server.should_exit = True
+    await task
+    print(json.dumps(timings))
+
+# Worker cold start against the local stand-ins, each run in a fresh
+# interpreter: import time, time until the server listens, until /ready
+# and until the first answer, plus the median time of every warm-up step
+def main():
+    parser = argparse.ArgumentParser(description="API cold start: import, listen, ready and first answer")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="seconds per Neo4j query")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(cold_start(args.graph_latency))
+        return
+
+    stub = StubServer(latency=args.latency)
+    configure_env(stub.start())
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--graph-latency", str(args.graph_latency)],
+            capture_output=True, text=True, check=True, env=os.environ
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    stub.stop()
+
+    print(f"{args.runs} cold starts, {args.latency * 1000:.0f} ms per upstream call (median)")
+    for key, label in (("import_s", "import main"), ("listening_s", "listening"),
+                       ("ready_s", "/ready 200"), ("first_answer_s", "first /chat answer")):
+        print(f"{label:<20} {statistics.median(run[key] for run in runs) * 1000:8.1f} ms")
+    print("warm-up steps (run concurrently where possible):")
+    for step in runs[0]["steps_ms"]:
+        print(f"  {step:<18} {statistics.median(run['steps_ms'][step] for run in runs):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore, write_store
+from stubs import TEST_FILES
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def exact(matrix, query, k):
+    scores = matrix @ (query / np.linalg.norm(query))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+# Size on disk, open time, query time and top-k agreement of float16/int8
+# stores with float32 exact search, scanning every row and through an IVF
+# index scored on the store's vectors, on the scraped sample dumps and a
+# synthetic corpus
+def check(name, ids, texts, matrix, queries, k):
+    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    truth = [exact(matrix, q, k) for q in queries]
+    json_bytes = len(json.dumps([m.tolist() for m in matrix[:min(len(matrix), 2000)]])) * len(matrix) / min(len(matrix), 2000)
+    print(f"\n{name}: {len(ids)} x {matrix.shape[1]}, embeddings as JSON ~{json_bytes / 1e6:.1f} MB, float32 {matrix.nbytes / 1e6:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as index_path:
+        IVFIndex.build(matrix).save(index_path)
+        for dtype in ("float16", "int8"):
+            check_store(dtype, ids, texts, matrix, queries, truth, k, index_path)
+
+def check_store(dtype, ids, texts, matrix, queries, truth, k, index_path):
+    with tempfile.TemporaryDirectory() as path:
+        write_store(path, ids, texts, matrix, dtype)
+        start = time.perf_counter()
+        store = EmbeddingStore(path)
+        open_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        found = [store.top_k(q, k)[0] for q in queries]
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        print(f"  {dtype:<8} {directory_size(path) / 1e6:8.1f} MB on disk   open {open_ms:6.2f} ms   "
+              f"{query_ms:7.2f} ms/query   top-{k} agreement with float32 {recall:6.1%}")
+
+        index = IVFIndex.load(index_path, score_rows=store.score_rows)
+        start = time.perf_counter()
+        found = [index.search(q, k)[0] for q in queries]
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        print(f"  {dtype + ' + IVF':<14} {directory_size(index_path) / 1e6:6.1f} MB index"
+              f"{'':24}{query_ms:7.2f} ms/query   top-{k} agreement with float32 {recall:6.1%}")
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding store quality check")
+    parser.add_argument("--synthetic", type=int, default=50000, help="synthetic corpus size (0 to skip)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    documents = []
+    for name in ("pages.json", "recipes.json"):
+        with open(os.path.join(TEST_FILES, name), encoding="utf-8") as f:
+            documents.extend(json.load(f))
+    matrix = np.array([doc["embedding"] for doc in documents], dtype=np.float32)
+    # Queries are the documents themselves, perturbed
+    queries = matrix[rng.integers(len(matrix), size=args.queries)] + 0.02 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32)
+    check("sample dumps", [d["id"] for d in documents], [d["text"] for d in documents], matrix, queries, min(args.k, len(documents)))
+
+    if args.synthetic:
+        centers = rng.standard_normal((args.synthetic // 100, 1536)).astype(np.float32)
+        matrix = centers[rng.integers(len(centers), size=args.synthetic)] + rng.standard_normal((args.synthetic, 1536)).astype(np.float32)
+        queries = matrix[rng.integers(args.synthetic, size=args.queries)] + 0.3 * rng.standard_normal((args.queries, 1536)).astype(np.float32)
+        ids = [str(i) for i in range(args.synthetic)]
+        check("synthetic", ids, ["x"] * args.synthetic, matrix, queries, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import STALL_MARKER, StubServer, configure_env, install_fake_graph, serve_app
+
+ANSWER = " ".join(["word"] * 120)
+
+# Time to first byte of the answer and total time for the JSON endpoint
+async def time_json(http, message):
+    start = time.perf_counter()
+    resp = await http.post("/chat", json={"message": message})
+    resp.raise_for_status()
+    total = time.perf_counter() - start
+    return total, total, total
+
+# Time to routing metadata, first answer token and end of stream for the SSE endpoint
+async def time_stream(http, message):
+    start = time.perf_counter()
+    meta = first_token = None
+    async with http.stream("POST", "/chat/stream", json={"message": message}) as resp:
+        event = None
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                json.loads(line[len("data: "):])
+                if event == "meta" and meta is None:
+                    meta = time.perf_counter() - start
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+    return meta, first_token, time.perf_counter() - start
+
+def report(name, samples):
+    columns = zip(*samples)
+    meta, first, total = (sorted(c)[len(samples) // 2] * 1000 for c in columns)
+    print(f"{name:<13} metadata {meta:7.1f} ms   first token {first:7.1f} ms   total {total:7.1f} ms")
+
+# Read a stream up to its first answer token, then hang up
+async def hang_up(http, message):
+    async with http.stream("POST", "/chat/stream", json={"message": message}) as resp:
+        async for line in resp.aiter_lines():
+            if line == "event: token":
+                return
+
+# A stream the client drops and one that stalls past ANSWER_TIMEOUT must both
+# be closed by the backend itself, not just give back their chat model slot.
+# The streams are kept referenced here, so garbage collection cannot close them.
+async def check_dropped_streams(http, backend, stub, stall_timeout=1.0):
+    opened = []
+    create = backend.client.chat.completions.create
+
+    async def keep(*args, **kwargs):
+        opened.append(await create(*args, **kwargs))
+        return opened[-1]
+
+    chat = backend.upstreams["chat"]
+    before = stub.fetch_stats()["streams_dropped"]
+    backend.client.chat.completions.create = keep
+    timeout, chat.timeout = chat.timeout, stall_timeout
+    try:
+        await hang_up(http, "easy nescafe drinks (hang up)")
+        await time_stream(http, f"easy nescafe drinks {STALL_MARKER}")
+        await asyncio.sleep(0.5)
+    finally:
+        chat.timeout = timeout
+        backend.client.chat.completions.create = create
+    streams = [stream for stream in opened if hasattr(stream, "response")]
+    closed = sum(stream.response.is_closed for stream in streams)
+    dropped = stub.fetch_stats()["streams_dropped"] - before
+    held = chat.limiter.stats()["in_flight"] if chat.limiter else 0
+    print(f"hung up + stalled: {closed} of {len(streams)} streams closed by the backend, "
+          f"{dropped} seen dropped upstream, {held} chat model slots still held")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Time to first token of /chat vs /chat/stream")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per upstream call")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per streamed word")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, target="vector", answer=ANSWER, token_latency=args.token_latency)
+    configure_env(stub.start())
+    install_fake_graph(args.latency)
+    # Every request must reach the model, or the second endpoint is timed on cache hits
+    os.environ.update({"SEMANTIC_CACHE_MAX_ENTRIES": "0", "SHARED_CACHE": "0", "CYPHER_VERBOSE": "0"})
+
+    import main as backend
+
+    server, task, url = await serve_app(backend.app)
+    await backend.wait_ready()
+    async with httpx.AsyncClient(base_url=url, timeout=300) as http:
+        for name, timer in (("/chat", time_json), ("/chat/stream", time_stream)):
+            samples = [await timer(http, f"easy nescafe drinks ({name} {i})") for i in range(args.requests)]
+            report(name, samples)
+        await check_dropped_streams(http, backend, stub)
+
+    server.should_exit = True
+    await task
+    stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
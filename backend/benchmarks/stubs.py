@@ -0,0 +1,434 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import socket
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+from aiohttp import web
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_FILES = os.path.join(BACKEND_DIR, "test-files")
+
+EMBEDDING_DIM = 1536
+
+# Deterministic unit vector for a piece of text
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+# Load the sample scraper dumps used as the stand-in search corpus
+def load_documents():
+    documents = []
+    for name in ("pages.json", "recipes.json"):
+        with open(os.path.join(TEST_FILES, name), "r", encoding="utf-8") as f:
+            documents.extend(json.load(f))
+    return documents
+
+# Azure OpenAI answers with the dated snapshot behind a deployment, not the name asked for
+SNAPSHOTS = {"gpt-4o-mini": "gpt-4o-mini-2024-07-18", "gpt-4o": "gpt-4o-2024-08-06"}
+
+def snapshot(model):
+    return SNAPSHOTS.get(model, model)
+
+# Put in a question, makes the streamed answer to it stall after one word
+STALL_MARKER = "[stall]"
+
+# Prompt size billed by the stand-in, at ~4 characters per token
+def prompt_tokens(messages):
+    return sum(len(message["content"]) for message in messages) // 4
+
+# Local stand-in for the Azure OpenAI and Azure AI Search REST endpoints.
+# `target` is the route every query is classified as, or a dict of query
+# prefix -> target for a labelled mix (unlisted queries go to "vector").
+# `jitter` is the sigma of a lognormal factor on every latency, and
+# `error_rate` the share of calls answered with a 500. `chat_tpm` enforces a
+# tokens-per-minute quota on chat completions like Azure OpenAI does: calls
+# it cannot cover get a 429 with the milliseconds until it could.
+class StubServer:
+    def __init__(self, latency=0.05, target="vector", answer="Here are some ideas.", token_latency=0.02,
+                 jitter=0.0, error_rate=0.0, chat_tpm=0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.target = target
+        self.answer = answer
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chat_tpm = chat_tpm
+        self.quota = chat_tpm / 6
+        self.quota_updated = time.monotonic()
+        self.documents = load_documents()
+        self.matrix = np.array([doc["embedding"] for doc in self.documents], dtype=np.float32)
+        self.calls = {"chat": 0, "embeddings": 0, "search": 0}
+        self.failures = 0
+        # Streamed answers whose client hung up before the last chunk
+        self.streams_dropped = 0
+        self.rate_limited = 0
+        self.url = None
+        self._process = None
+
+    def target_for(self, query):
+        if isinstance(self.target, str):
+            return self.target
+        prefix = max((q for q in self.target if query.startswith(q)), key=len, default=None)
+        return self.target[prefix] if prefix is not None else "vector"
+
+    async def delay(self):
+        factor = random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        await asyncio.sleep(self.latency * factor)
+
+    # An injected upstream failure, or None
+    def failure(self):
+        if self.error_rate and random.random() < self.error_rate:
+            self.failures += 1
+            return web.json_response({"error": {"code": "InternalServerError", "message": "stub failure"}}, status=500)
+        return None
+
+    # A 429 if the quota, refilled at `chat_tpm` per minute up to ten
+    # seconds' worth, cannot cover `tokens` now; otherwise spend them
+    def rate_limit(self, tokens):
+        if not self.chat_tpm:
+            return None
+        now = time.monotonic()
+        rate = self.chat_tpm / 60
+        self.quota = min(rate * 10, self.quota + (now - self.quota_updated) * rate)
+        self.quota_updated = now
+        if self.quota < tokens:
+            self.rate_limited += 1
+            wait_ms = int((tokens - self.quota) / rate * 1000) + 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Requests to the deployment have exceeded the token rate limit"}},
+                status=429, headers={"retry-after-ms": str(wait_ms), "retry-after": str(wait_ms // 1000 + 1)}
+            )
+        self.quota -= tokens
+        return None
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self.chat)
+        app.router.add_post("/openai/deployments/{deployment}/embeddings", self.embeddings)
+        app.router.add_post(r"/{index:indexes.*}/docs/search.post.search", self.search)
+        return app
+
+    async def chat(self, request):
+        self.calls["chat"] += 1
+        body = await request.json()
+        await self.delay()
+        if failed := self.failure():
+            return failed
+        messages = body["messages"]
+        if "classify the query" in messages[0]["content"]:
+            user = messages[-1]["content"].replace("User query: ", "", 1)
+            content = json.dumps({"target": self.target_for(user), "rewritten_query": user})
+        elif "Cypher query:" in messages[-1]["content"]:
+            question = messages[-1]["content"].split("Question:")[-1].split("Cypher query:")[0]
+            word = max(re.findall(r"[a-z]+", question.lower()) or ["recipe"], key=len)
+            content = (
+                f"MATCH (r:Recipe) WHERE toLower(r.title) CONTAINS '{word}' "
+                "RETURN r.title, r.url, r.image, r.instructions"
+            )
+        else:
+            content = self.answer
+        if limited := self.rate_limit(prompt_tokens(messages) + len(content.split(" "))):
+            return limited
+        if body.get("stream"):
+            return await self.stream_chat(request, body, content, prompt_tokens(messages))
+        # Non-streamed answers still pay the model's generation time
+        await asyncio.sleep(self.token_latency * len(content.split(" ")))
+        return web.json_response({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": snapshot(body.get("model", "gpt-4o-mini")),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens(messages),
+                "completion_tokens": len(content.split(" ")),
+                "total_tokens": prompt_tokens(messages) + len(content.split(" "))
+            }
+        })
+
+    # Stream the answer word by word as chat.completion.chunk events. A
+    # question containing STALL_MARKER stalls after the first word, until the
+    # client gives up.
+    async def stream_chat(self, request, body, content, prompt):
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        stall = STALL_MARKER in body["messages"][-1]["content"]
+        for i, word in enumerate(content.split(" ")):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": snapshot(body.get("model", "gpt-4o-mini")),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+            }
+            if not await self.stream_write(request, resp, chunk):
+                return resp
+            await asyncio.sleep(self.token_latency)
+            while stall and i == 0 and not self.hung_up(request):
+                await asyncio.sleep(0.05)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": snapshot(body.get("model", "gpt-4o-mini")),
+                "choices": [],
+                "usage": {"prompt_tokens": prompt, "completion_tokens": len(content.split(" ")), "total_tokens": prompt + len(content.split(" "))}
+            }
+            if not await self.stream_write(request, resp, chunk):
+                return resp
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    @staticmethod
+    def hung_up(request):
+        return request.transport is None or request.transport.is_closing()
+
+    # Write one chunk; False (and counted) once the client has hung up
+    async def stream_write(self, request, resp, chunk):
+        if not self.hung_up(request):
+            try:
+                await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                return True
+            except ConnectionResetError:
+                pass
+        self.streams_dropped += 1
+        return False
+
+    async def embeddings(self, request):
+        self.calls["embeddings"] += 1
+        body = await request.json()
+        await self.delay()
+        if failed := self.failure():
+            return failed
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # The openai SDK asks for base64 by default, like the real service returns
+        if body.get("encoding_format") == "base64":
+            encode = lambda vec: base64.b64encode(vec.tobytes()).decode()
+        else:
+            encode = lambda vec: vec.tolist()
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": encode(fake_embedding(text))}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 10 * len(inputs), "total_tokens": 10 * len(inputs)}
+        })
+
+    async def search(self, request):
+        self.calls["search"] += 1
+        body = await request.json()
+        await self.delay()
+        if failed := self.failure():
+            return failed
+        query = body["vectorQueries"][0]
+        k = query.get("k", 10)
+        scores = self.matrix @ np.asarray(query["vector"], dtype=np.float32)
+        top = np.argsort(-scores)[:k]
+        return web.json_response({
+            "value": [
+                {"@search.score": float(scores[i]), "id": self.documents[i]["id"], "text": self.documents[i]["text"]}
+                for i in top
+            ]
+        })
+
+    async def stats(self, request):
+        return web.json_response({
+            **self.calls, "failures": self.failures, "rate_limited": self.rate_limited,
+            "streams_dropped": self.streams_dropped
+        })
+
+    def _serve(self, port):
+        # Hedged and timed-out calls are dropped mid-request by design
+        logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+        app = self._app()
+        app.router.add_get("/_stats", self.stats)
+        web.run_app(app, host="127.0.0.1", port=port, access_log=None, print=None)
+
+    # Serve from a child process so the stubs neither share the GIL with the
+    # code under test nor get stalled by blocking clients
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self._process = multiprocessing.Process(target=self._serve, args=(port,), daemon=True)
+        self._process.start()
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return self.url
+            except OSError:
+                time.sleep(0.05)
+
+    def fetch_stats(self):
+        with urllib.request.urlopen(self.url + "/_stats") as resp:
+            return json.loads(resp.read())
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+# Run an ASGI app on a real socket in this event loop; httpx's ASGITransport
+# buffers whole responses
+async def serve_app(app):
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task, f"http://127.0.0.1:{port}"
+
+# Point the backend's environment variables at the stub server. Caches go to
+# a scratch directory so stand-in embeddings never reach the real caches.
+def configure_env(url):
+    scratch = tempfile.mkdtemp(prefix="nestle-bench-")
+    os.environ.update({
+        "EMBEDDING_CACHE_PATH": os.path.join(scratch, "embeddings.sqlite"),
+        "CYPHER_CACHE_PATH": os.path.join(scratch, "cypher_cache.sqlite"),
+        "SHARED_CACHE_PATH": os.path.join(scratch, "shared_cache.sqlite"),
+        "SESSION_PATH": os.path.join(scratch, "sessions.sqlite"),
+        "INDEX_VERSION_FILE": os.path.join(scratch, ".index_version"),
+        "AZURE_OPENAI_KEY": "stub",
+        "AZURE_OPENAI_ENDPOINT": url,
+        "AZURE_OPENAI_VERSION": "2024-10-21",
+        "AZURE_AI_SEARCH_ENDPOINT": url,
+        "AZURE_AI_SEARCH_KEY": "stub",
+        "AZURE_AI_SEARCH_INDEX": "stub-index",
+        "NEO4J_URI": "bolt://127.0.0.1:7687",
+        "NEO4J_USERNAME": "neo4j",
+        "NEO4J_PASSWORD": "stub",
+    })
+
+GRAPH_SCHEMA = """Node properties:
+Recipe {id: STRING, title: STRING, url: STRING, image: STRING, instructions: STRING}
+Ingredient {name: STRING}
+Tag {name: STRING}
+Time {minutes: INTEGER}
+SkillLevel {name: STRING}
+Servings {count: STRING}
+Relationship properties:
+HAS_INGREDIENT {amount: STRING}
+The relationships:
+(:Recipe)-[:HAS_INGREDIENT]->(:Ingredient)
+(:Recipe)-[:HAS_TAG]->(:Tag)
+(:Recipe)-[:HAS_TIME]->(:Time)
+(:Recipe)-[:HAS_SKILL_LEVEL]->(:SkillLevel)
+(:Recipe)-[:HAS_SERVINGS]->(:Servings)"""
+
+# In-process stand-in for langchain_neo4j.Neo4jGraph backed by recipes.json.
+# Setting `outage` on the class simulates an unhealthy server: "down" fails
+# every query, "stall" makes each one hang until the transaction timeout.
+def make_fake_graph_class(latency=0.05):
+    from langchain_neo4j import Neo4jGraph
+
+    with open(os.path.join(TEST_FILES, "recipes.json"), "r", encoding="utf-8") as f:
+        recipes = json.load(f)
+    rows = [
+        {
+            "r.title": r["title"].strip().lower(),
+            "r.url": r["url"],
+            "r.image": r["image"],
+            "r.instructions": "\n".join(r["instructions"])
+        }
+        for r in recipes
+    ]
+    vocabulary = (
+        [{"kind": "ingredient", "name": name} for name in sorted(
+            {re.sub(r"^[\d\s/.]+[a-z]*\s+", "", i.strip().lower()) for r in recipes for i in r["ingredients"]}
+        )]
+        + [{"kind": "tag", "name": name} for name in sorted({t.strip().lower() for r in recipes for t in r["tags"]})]
+        + [{"kind": "skill", "name": name} for name in sorted({(r["skill_level"] or "unknown").strip().lower() for r in recipes})]
+    )
+
+    class FakeNeo4jGraph(Neo4jGraph):
+        queries = 0
+        outage = None
+        stall = 30.0
+
+        def __init__(self, *args, refresh_schema=True, timeout=None, **kwargs):
+            self.timeout = timeout
+            self.sanitize = False
+            self._enhanced_schema = False
+            self.schema = ""
+            self.structured_schema = {}
+            if refresh_schema:
+                self.refresh_schema()
+
+        def refresh_schema(self):
+            time.sleep(latency)
+            self.schema = GRAPH_SCHEMA
+            self.structured_schema = {
+                "node_props": {
+                    label: [{"property": prop, "type": kind} for prop, kind in props]
+                    for label, props in [
+                        ("Recipe", [("id", "STRING"), ("title", "STRING"), ("url", "STRING"), ("image", "STRING"), ("instructions", "STRING")]),
+                        ("Ingredient", [("name", "STRING")]), ("Tag", [("name", "STRING")]),
+                        ("Time", [("minutes", "INTEGER")]), ("SkillLevel", [("name", "STRING")]),
+                        ("Servings", [("count", "STRING")])
+                    ]
+                },
+                "rel_props": {"HAS_INGREDIENT": [{"property": "amount", "type": "STRING"}]},
+                "relationships": [
+                    {"start": "Recipe", "type": rel, "end": end}
+                    for rel, end in [
+                        ("HAS_INGREDIENT", "Ingredient"), ("HAS_TAG", "Tag"), ("HAS_TIME", "Time"),
+                        ("HAS_SKILL_LEVEL", "SkillLevel"), ("HAS_SERVINGS", "Servings")
+                    ]
+                ],
+                "metadata": {}
+            }
+
+        def query(self, query, params={}, session_params={}):
+            from neo4j.exceptions import Neo4jError, ServiceUnavailable
+
+            FakeNeo4jGraph.queries += 1
+            if FakeNeo4jGraph.outage == "down":
+                raise ServiceUnavailable("stand-in outage")
+            if FakeNeo4jGraph.outage == "stall":
+                time.sleep(min(FakeNeo4jGraph.stall, self.timeout or FakeNeo4jGraph.stall))
+                raise Neo4jError._hydrate_neo4j(
+                    code="Neo.ClientError.Transaction.TransactionTimedOut", message="transaction timed out"
+                )
+            time.sleep(latency)
+            if "AS kind" in query:
+                return vocabulary
+            if params:
+                terms = params.get("ingredients", []) + params.get("tags", [])
+                matched = [row for row in rows if any(t in row["r.title"] for t in terms)]
+                return matched[:params.get("limit", 10)]
+            words = [w for w in re.findall(r"'([^']+)'", query)]
+            matched = [row for row in rows if any(w.lower() in row["r.title"] for w in words)]
+            return matched or rows[:3]
+
+    return FakeNeo4jGraph
+
+# Swap the Neo4j wrapper for the in-process stand-in before main is imported
+def install_fake_graph(latency=0.05):
+    import langchain_neo4j
+
+    fake = make_fake_graph_class(latency)
+    langchain_neo4j.Neo4jGraph = fake
+    return fake
@@ -0,0 +1,120 @@
+import base64
+import re
+
+from context_packer import count_tokens, load_encoder
+
+HEADINGS = {"h1", "h2", "h3"}
+
+# A heading only starts a new passage once the current one holds this share
+# of the budget, so runs of short sections are kept together
+MIN_SECTION_SHARE = 4
+
+# Passage ids are the urlsafe base64 of "<page url>#passage-<n>", so the
+# parent page is recoverable from any hit (see retrievers.parent_key)
+def passage_id(url, n):
+    return base64.urlsafe_b64encode(f"{url}#passage-{n}".encode()).decode()
+
+# Rebuild (tag, text) blocks from a flat scraper dump: a "Title:" line or
+# else the first heading is the h1, and short lines without closing
+# punctuation are taken as section headings
+def blocks_from_text(text):
+    blocks = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("Link:"):
+            continue
+        if line.startswith("Title:"):
+            blocks.append(("h1", line[len("Title:"):].split("Link:")[0].strip()))
+            continue
+        heading = len(line) <= 60 and len(line.split()) <= 8 and not line.endswith((".", "!", "?", ":", ","))
+        if heading and not any(tag == "h1" for tag, _ in blocks):
+            blocks.append(("h1", line))
+        else:
+            blocks.append(("h2" if heading else "p", line))
+    return blocks
+
+# Splits pages into passages of at most max_tokens. Text is grouped under its
+# nearest heading; long sections are cut into windows that repeat the last
+# overlap_tokens of lines, and lines longer than a window are split on
+# sentence and then word boundaries.
+class PageChunker:
+    def __init__(self, max_tokens=256, overlap_tokens=48, model="text-embedding-3-small"):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._encode = load_encoder(model)
+
+    def count(self, text):
+        return count_tokens(self._encode, text)
+
+    def split_long(self, text, budget):
+        if self.count(text) <= budget:
+            return [text]
+        pieces = []
+        for sentence in re.split(r"(?<=[.!?])\s+", text):
+            words = sentence.split()
+            while words:
+                # Take as many words as fit, at least one
+                size = len(words)
+                while size > 1 and self.count(" ".join(words[:size])) > budget:
+                    size = max(1, size * budget // self.count(" ".join(words[:size])))
+                pieces.append(" ".join(words[:size]))
+                words = words[size:]
+        # Re-join short sentences that fit together
+        merged = []
+        for piece in pieces:
+            if merged and self.count(merged[-1] + " " + piece) <= budget:
+                merged[-1] += " " + piece
+            else:
+                merged.append(piece)
+        return merged
+
+    def overlap(self, window):
+        carry = []
+        used = 0
+        for line in reversed(window):
+            cost = self.count(line) + 1
+            if used + cost > self.overlap_tokens:
+                break
+            carry.insert(0, line)
+            used += cost
+        return carry, used
+
+    # Returns [{"id", "type", "text"}] passages for one page, each headed by
+    # the page link, its title and the section it comes from
+    def chunk(self, url, blocks, doc_type="information"):
+        title = next((text for tag, text in blocks if tag == "h1"), "")
+        budget = self.max_tokens - self.count(f"Link: {url}\nTitle: {title}\nSection: ") - 16
+        passages = []
+        section = ""
+        window = []
+        used = 0
+
+        def flush():
+            header = [f"Link: {url}"]
+            if title:
+                header.append(f"Title: {title}")
+            if section and section != title:
+                header.append(f"Section: {section}")
+            passages.append({
+                "id": passage_id(url, len(passages)),
+                "type": doc_type,
+                "text": "\n".join(header + window)
+            })
+
+        for tag, text in blocks:
+            if tag in HEADINGS:
+                if used >= self.max_tokens // MIN_SECTION_SHARE:
+                    flush()
+                    window, used = [], 0
+                if not window:
+                    section = text
+            for piece in self.split_long(text, budget):
+                cost = self.count(piece) + 1
+                if window and used + cost > budget:
+                    flush()
+                    window, used = self.overlap(window)
+                window.append(piece)
+                used += cost
+        if window:
+            flush()
+        return passages
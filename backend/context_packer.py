@@ -0,0 +1,134 @@
+import re
+
+from retrievers import parent_key, result_key
+
+# Words that say nothing about which lines of a document are relevant
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "can", "do", "for", "from", "give", "have", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "recipe", "recipes", "show", "some", "that", "the", "to",
+    "what", "with", "you", "your"
+}
+
+# Lines that identify a document and are always kept
+HEADER_PREFIXES = ("link:", "recipe:", "title:", "url:")
+
+# Sections smaller than this are not worth adding once the budget is nearly spent
+MIN_SECTION_TOKENS = 32
+
+def terms(text):
+    return {word.rstrip("s") for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS}
+
+# Graph rows become "title: ..." lines, dropping the r. prefix and empty values
+def render(result):
+    if result.get("text"):
+        return result["text"]
+    return "\n".join(
+        f"{key.split('.')[-1]}: {value}" for key, value in result.items() if value not in (None, "", [])
+    )
+
+# tiktoken downloads its BPE files on first use; where that is impossible
+# (offline workers) token counts are estimated at ~4 characters per token
+def load_encoder(model):
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model).encode_ordinary
+    except Exception as e:
+        print(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+def count_tokens(encode, text):
+    if encode:
+        return len(encode(text))
+    return (len(text) + 3) // 4
+
+# Packs retrieved documents and graph rows into the answer prompt under a
+# token budget: drops repeated recipes, trims each document to the lines that
+# share the most words with the question, and stops when the budget is spent.
+# Passages of one page are distinct documents, but a graph row adds nothing
+# once any passage of its recipe's page is in.
+class ContextPacker:
+    def __init__(self, budget=1500, doc_budget=400, model="gpt-4o-mini"):
+        self.budget = budget
+        self.doc_budget = doc_budget
+        self._encode = load_encoder(model)
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.duplicates = 0
+
+    def count(self, text):
+        return count_tokens(self._encode, text)
+
+    # Keep header lines, then the lines with the most question words, in their original order
+    def trim(self, text, query_terms, limit):
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        costs = [self.count(line) + 1 for line in lines]
+        if sum(costs) <= limit:
+            return "\n".join(lines)
+
+        ranked = sorted(
+            range(len(lines)),
+            key=lambda i: (i == 0 or lines[i].lower().startswith(HEADER_PREFIXES), len(terms(lines[i]) & query_terms), -i),
+            reverse=True
+        )
+        keep = []
+        used = 0
+        for i in ranked:
+            if used + costs[i] <= limit:
+                keep.append(i)
+                used += costs[i]
+        return "\n".join(lines[i] for i in sorted(keep))
+
+    # Returns the packed context and the token accounting for this request
+    def pack(self, results, question):
+        query_terms = terms(question)
+        texts = [render(result) for result in results]
+        seen = set()
+        pages = set()
+        sections = []
+        used = 0
+        duplicates = 0
+        for result, text in zip(results, texts):
+            key = result_key(result)
+            page = parent_key(result)
+            if key in seen or (not result.get("text") and page in pages):
+                duplicates += 1
+                continue
+            seen.add(key)
+            pages.add(page)
+            remaining = self.budget - used
+            if remaining < MIN_SECTION_TOKENS:
+                break
+            section = self.trim(text, query_terms, min(self.doc_budget, remaining))
+            if section:
+                sections.append(section)
+                used += self.count(section) + 2
+
+        context = "\n\n".join(sections)
+        before = self.count("\n\n".join(texts))
+        after = self.count(context)
+        self.requests += 1
+        self.tokens_before += before
+        self.tokens_after += after
+        self.duplicates += duplicates
+        return context, {
+            "tokens_before": before,
+            "tokens_after": after,
+            "tokens_saved": before - after,
+            "documents": len(results),
+            "kept": len(sections),
+            "duplicates": duplicates
+        }
+
+    def stats(self):
+        return {
+            "tokenizer": "tiktoken" if self._encode else "estimate",
+            "budget": self.budget,
+            "doc_budget": self.doc_budget,
+            "requests": self.requests,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "duplicates": self.duplicates
+        }
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from query_router import normalize_text
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+STOPWORDS = {"a", "an", "the", "some", "me", "i", "can", "please", "show", "find", "give", "what", "are", "is", "of", "to", "with"}
+
+# Word order, stopwords, case and punctuation do not change the Cypher
+def normalize_query(query):
+    words = {w for w in normalize_text(query).split() if w not in STOPWORDS}
+    return " ".join(sorted(words))
+
+# LLM-generated Cypher that ran and returned rows, keyed by the normalized
+# rewritten query. Backed by SQLite in WAL mode so it survives restarts and
+# every worker on the host shares it. Pinned entries are never evicted or
+# invalidated. Lookups run on the event loop, so hits only note the key in
+# memory and the next write of this process adds them to the stored counts;
+# a write that cannot get the lock within `busy_timeout` seconds is skipped,
+# and a read that fails is a miss.
+class CypherCache:
+    def __init__(self, path=None, max_entries=5000, busy_timeout=0.1):
+        self.path = path or os.path.join(CACHE_DIR, "cypher_cache.sqlite")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.skipped_writes = 0
+        # key -> [hits, time of the last hit] not yet written back
+        self.touched = {}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cypher_cache (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                cypher TEXT NOT NULL,
+                steps TEXT,
+                pinned INTEGER NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+
+    def get(self, query):
+        key = normalize_query(query)
+        try:
+            row = self.db.execute("SELECT cypher FROM cypher_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        touched = self.touched.setdefault(key, [0, 0.0])
+        touched[0] += 1
+        touched[1] = time.time()
+        return row[0]
+
+    def put(self, query, cypher, steps=None, pinned=False):
+        now = time.time()
+        touched, self.touched = self.touched, {}
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            self._skip(touched)
+            return
+        try:
+            self.db.executemany(
+                "UPDATE cypher_cache SET hits = hits + ?, last_used = MAX(last_used, ?) WHERE key = ?",
+                [(hits, used, key) for key, (hits, used) in touched.items()]
+            )
+            self.db.execute("""
+                INSERT INTO cypher_cache (key, query, cypher, steps, pinned, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    query = excluded.query, cypher = excluded.cypher, steps = excluded.steps,
+                    pinned = MAX(pinned, excluded.pinned), last_used = excluded.last_used
+                WHERE pinned = 0 OR excluded.pinned = 1
+            """, (normalize_query(query), query, cypher, json.dumps(steps, default=str), int(pinned), now, now))
+            self._evict()
+            self.db.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            self._skip(touched)
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    # Another worker holds the lock: drop the write, keep the hits for the next one
+    def _skip(self, touched):
+        self.skipped_writes += 1
+        for key, (hits, used) in touched.items():
+            pending = self.touched.setdefault(key, [0, 0.0])
+            pending[0] += hits
+            pending[1] = max(pending[1], used)
+
+    def pin(self, query, cypher):
+        self.put(query, cypher, pinned=True)
+
+    # Drop a cached query that stopped working, unless it was pinned
+    def invalidate(self, query):
+        try:
+            self.db.execute("DELETE FROM cypher_cache WHERE key = ? AND pinned = 0", (normalize_query(query),))
+        except sqlite3.OperationalError:
+            self.skipped_writes += 1
+
+    def _evict(self):
+        self.db.execute("""
+            DELETE FROM cypher_cache WHERE key IN (
+                SELECT key FROM cypher_cache WHERE pinned = 0
+                ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def stats(self):
+        entries, pinned, stored_hits = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(pinned), 0), COALESCE(SUM(hits), 0) FROM cypher_cache"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "pinned": pinned,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "lifetime_hits": stored_hits,
+            "skipped_writes": self.skipped_writes
+        }
+
+# Pin known-good queries or inspect the cache from the command line
+def main():
+    parser = argparse.ArgumentParser(description="Manage the generated Cypher cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pin = sub.add_parser("pin", help="pin a known-good Cypher query for a question")
+    pin.add_argument("query")
+    pin.add_argument("cypher")
+    unpin = sub.add_parser("invalidate", help="remove an unpinned entry")
+    unpin.add_argument("query")
+    sub.add_parser("list", help="list cached entries")
+    args = parser.parse_args()
+
+    # Not on an event loop here, so wait for the lock like any other CLI
+    cache = CypherCache(os.getenv("CYPHER_CACHE_PATH"), busy_timeout=5)
+    if args.command == "pin":
+        cache.pin(args.query, args.cypher)
+    elif args.command == "invalidate":
+        cache.invalidate(args.query)
+    else:
+        for key, cypher, pinned, hits in cache.db.execute(
+            "SELECT key, cypher, pinned, hits FROM cypher_cache ORDER BY hits DESC"
+        ):
+            print(f"{'*' if pinned else ' '} {hits:5d}  {key}\n         {cypher}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import record, record_usage
+
+# Times the Cypher-writing LLM call and bills its tokens as a stage of the
+# request that made it. It is attached to the shared model because the chain
+# does not hand per-call callbacks down to it; the request is found through
+# its trace context.
+class CypherGenerationMonitor(BaseCallbackHandler):
+    def __init__(self):
+        self.started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self.started.pop(run_id, None)
+        if start is not None:
+            record("cypher_generation", time.perf_counter() - start)
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if token_usage:
+            record_usage(
+                "cypher_generation",
+                (response.llm_output or {}).get("model_name") or "gpt-4o-mini",
+                token_usage.get("prompt_tokens", 0),
+                token_usage.get("completion_tokens", 0)
+            )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
@@ -0,0 +1,113 @@
+import re
+
+from query_router import normalize_text
+
+# Words that say "recipe" without naming anything to filter on
+GENERIC_WORDS = {
+    "recipe", "recipes", "make", "made", "with", "using", "use", "uses", "some", "show", "find",
+    "give", "what", "that", "have", "want", "easy", "quick", "good", "best", "the", "and",
+    "for", "can", "any", "something", "anything", "things", "ideas", "please", "minutes",
+    "minute", "mins", "hour", "hours", "under", "less", "than", "take", "takes", "nestle"
+}
+
+TIME_PATTERN = re.compile(r"\b(\d+)\s*(min|mins|minute|minutes|hr|hrs|hour|hours)\b")
+HOUR_PATTERN = re.compile(r"\b(under|less than|within) (an|one) hour\b")
+
+# One fragment per slot. Fragments are always joined in this order, so each
+# slot combination maps to exactly one query text and Neo4j can reuse its plan.
+SLOT_CLAUSES = [
+    ("ingredients", "all(term IN $ingredients WHERE EXISTS { "
+                    "MATCH (r)-[:HAS_INGREDIENT]->(i:Ingredient) WHERE i.name CONTAINS term })"),
+    ("tags", "all(tag IN $tags WHERE EXISTS { MATCH (r)-[:HAS_TAG]->(t:Tag) WHERE t.name = tag })"),
+    ("max_time", "EXISTS { MATCH (r)-[:HAS_TIME]->(m:Time) WHERE m.minutes > 0 AND m.minutes <= $max_time }"),
+    ("skill_level", "EXISTS { MATCH (r)-[:HAS_SKILL_LEVEL]->(s:SkillLevel) WHERE s.name = $skill_level }"),
+]
+
+RETURN_CLAUSE = "RETURN r.title, r.url, r.image, r.instructions ORDER BY r.title LIMIT $limit"
+
+# Ingredient, tag and skill level names from the recipe graph
+def fetch_slot_vocabulary(graph):
+    rows = graph.query(
+        "MATCH (i:Ingredient) RETURN 'ingredient' AS kind, i.name AS name "
+        "UNION ALL MATCH (t:Tag) RETURN 'tag' AS kind, t.name AS name "
+        "UNION ALL MATCH (s:SkillLevel) RETURN 'skill' AS kind, s.name AS name"
+    )
+    vocabulary = {"ingredient": [], "tag": [], "skill": []}
+    for row in rows:
+        if row.get("name"):
+            vocabulary[row["kind"]].append(row["name"])
+    return vocabulary
+
+def build_query(slots):
+    conditions = [clause for name, clause in SLOT_CLAUSES if name in slots]
+    return "MATCH (r:Recipe)\nWHERE " + "\n  AND ".join(conditions) + "\n" + RETURN_CLAUSE
+
+# Pre-written Cypher for the common recipe intents (by ingredient, tag,
+# maximum time and skill level, and any combination), filled from slots
+# extracted out of the query with the graph's own vocabulary.
+class CypherTemplates:
+    def __init__(self, vocabulary, limit=10):
+        self.limit = limit
+        self.tags = {normalize_text(tag): tag for tag in vocabulary.get("tag", [])}
+        self.skills = {normalize_text(skill): skill for skill in vocabulary.get("skill", []) if skill != "unknown"}
+        self.ingredient_names = [normalize_text(name) for name in vocabulary.get("ingredient", [])]
+        self.ingredient_words = {word for name in self.ingredient_names for word in name.split() if len(word) >= 3}
+
+    def _phrase_in_ingredients(self, phrase):
+        return any(re.search(r"\b" + re.escape(phrase) + r"\b", name) for name in self.ingredient_names)
+
+    def extract_slots(self, query):
+        text = normalize_text(query)
+        slots = {}
+
+        match = TIME_PATTERN.search(text)
+        if match:
+            amount = int(match.group(1))
+            slots["max_time"] = amount * 60 if match.group(2).startswith("h") else amount
+        elif HOUR_PATTERN.search(text):
+            slots["max_time"] = 60
+
+        for name, skill in self.skills.items():
+            if re.search(r"\b" + re.escape(name) + r"\b", text):
+                slots["skill_level"] = skill
+                break
+
+        # Tags match in singular or plural ("drink" finds "drinks")
+        tags, used = [], set()
+        for name, tag in sorted(self.tags.items(), key=lambda item: len(item[0]), reverse=True):
+            singular = name[:-1] if name.endswith("s") else name
+            found = re.search(r"\b(" + re.escape(name) + "|" + re.escape(singular) + r")s?\b", text)
+            if found and name not in GENERIC_WORDS and not used & set(found.group(0).split()):
+                tags.append(tag)
+                used.update(found.group(0).split())
+        if tags:
+            slots["tags"] = tags
+
+        # Ingredient terms: the longest runs of query words that appear in some ingredient name
+        words = [w for w in text.split() if w not in used]
+        ingredients, i = [], 0
+        while i < len(words):
+            matched = None
+            for j in range(len(words), i, -1):
+                phrase = " ".join(words[i:j])
+                if j - i == 1 and (phrase in GENERIC_WORDS or phrase not in self.ingredient_words):
+                    continue
+                if self._phrase_in_ingredients(phrase):
+                    matched = (phrase, j)
+                    break
+            if matched:
+                ingredients.append(matched[0])
+                i = matched[1]
+            else:
+                i += 1
+        if ingredients:
+            slots["ingredients"] = ingredients
+
+        return slots
+
+    # Returns (cypher, params) or None when no slot was found
+    def match(self, query):
+        slots = self.extract_slots(query)
+        if not slots:
+            return None
+        return build_query(slots), {**slots, "limit": self.limit}
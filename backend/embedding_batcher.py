@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+
+import numpy as np
+
+from admission import deadline_left
+from resilience import DeadlineExceeded, current_deadline
+
+# Collects the texts concurrent requests need embedded and sends them as one
+# embeddings call, once `window` seconds have passed since the first text
+# arrived or `max_batch` texts are waiting. Cached texts never wait, and a
+# text that is already waiting or in flight is shared, not sent twice.
+# Callers stop waiting at their request deadline, and a batch is sent under
+# the earliest deadline of the requests waiting on it.
+class EmbeddingBatcher:
+    def __init__(self, client, cache, window=0.005, max_batch=64, on_upstream=None, on_usage=None, call=None):
+        self.client = client
+        self.cache = cache
+        self.window = window
+        self.max_batch = max_batch
+        # Called in the requesting task whenever it has to wait on the API
+        self.on_upstream = on_upstream
+        # Called in the requesting task with (model, tokens) for the texts it enqueued
+        self.on_usage = on_usage
+        # Wraps each embeddings call, e.g. with a timeout and circuit breaker
+        self.call = call
+        self.pending = []
+        self.futures = {}
+        # Earliest request deadline waiting on each pending text
+        self.deadlines = {}
+        self.timer = None
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            self.requests += 1
+            if self.on_upstream:
+                self.on_upstream()
+            loop = asyncio.get_running_loop()
+            deadline = current_deadline.get()
+            waits = []
+            owned = []
+            for i in missing:
+                future = self.futures.get(texts[i])
+                if future is None:
+                    future = loop.create_future()
+                    self.futures[texts[i]] = future
+                    self.pending.append(texts[i])
+                    self.deadlines[texts[i]] = deadline
+                    owned.append(future)
+                if deadline is not None and texts[i] in self.deadlines:
+                    self.deadlines[texts[i]] = min(deadline, self.deadlines[texts[i]] or deadline)
+                waits.append(future)
+            if len(self.pending) >= self.max_batch:
+                self._flush()
+            elif self.pending and self.timer is None:
+                self.timer = loop.call_later(self.window, self._flush)
+            # Shielded so one caller going away does not cancel a result others wait on
+            try:
+                fresh = await asyncio.wait_for(
+                    asyncio.gather(*(asyncio.shield(future) for future in waits)), deadline_left()
+                )
+            except asyncio.TimeoutError:
+                # Nobody may be left to read the batch's error once it comes
+                for future in waits:
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                raise DeadlineExceeded("request deadline exceeded waiting for embeddings")
+            for i, (vector, _) in zip(missing, fresh):
+                vectors[i] = vector
+            if self.on_usage and owned:
+                self.on_usage(self.cache.model, round(sum(future.result()[1] for future in owned)))
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+    def _flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            deadlines = [d for d in (self.deadlines.pop(text) for text in batch) if d is not None]
+            # A fresh context keeps the shared call from being billed to whichever request opened the batch
+            loop.create_task(self._send(batch, min(deadlines, default=None)), context=contextvars.Context())
+
+    async def _send(self, batch, deadline=None):
+        current_deadline.set(deadline)
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            create = lambda: self.client.embeddings.create(input=batch, model=self.cache.model)
+            response = await (self.call(create) if self.call else create())
+            fresh = [item.embedding for item in response.data]
+            rows = self.cache.remember_many(batch, fresh)
+            # The call's tokens are split over its texts by length
+            chars = sum(len(text) for text in batch) or 1
+            for text, vector in zip(batch, fresh):
+                share = response.usage.prompt_tokens * len(text) / chars
+                self.futures.pop(text).set_result((vector, share))
+        except Exception as e:
+            for text in batch:
+                future = self.futures.pop(text, None)
+                if future and not future.done():
+                    future.set_exception(e)
+            return
+        # Callers already have their vectors; the disk write runs off the event loop
+        await asyncio.to_thread(self.cache.store, rows)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Embeddings keyed by a hash of model and text. A small in-process LRU sits
+# in front of a SQLite file that the API workers and both scrapers share;
+# vectors are stored as raw float16/float32 bytes rather than JSON lists.
+# With max_entries set, the oldest vectors are dropped once the file holds more.
+# Writes go through their own connection, so the API can run them in a thread
+# while lookups go on; a write that cannot get the lock within `busy_timeout`
+# seconds is skipped (the vectors stay in memory), and a read that fails is a miss.
+class EmbeddingCache:
+    def __init__(self, path=None, model="text-embedding-3-small", dtype="float16", lru_size=4096, max_entries=0,
+                 busy_timeout=5):
+        self.path = path or os.path.join(CACHE_DIR, "embeddings.sqlite")
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.lru_size = lru_size
+        self.max_entries = max_entries
+        self.lru = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped_writes = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.writer = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.write_lock = threading.Lock()
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).digest()
+
+    def _remember(self, key, vector):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    # Returns one float32 vector or None per text
+    def get_many(self, texts):
+        keys = [self.key(text) for text in texts]
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                found[key] = self.lru[key]
+                self.memory_hits += 1
+            else:
+                missing.append(key)
+
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            try:
+                rows = self.db.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            for key, dtype, blob in rows:
+                vector = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+                found[key] = vector
+                self._remember(key, vector)
+            self.disk_hits += len(rows)
+            self.misses += len(missing) - len(rows)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts, vectors):
+        self.store(self.remember_many(texts, vectors))
+
+    # Same as put_many, with the SQLite write in a thread so the event loop
+    # never waits on another process's lock
+    async def put_many_async(self, texts, vectors):
+        await asyncio.to_thread(self.store, self.remember_many(texts, vectors))
+
+    # Keep vectors in the in-process LRU and return their rows for store()
+    def remember_many(self, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            vector = np.asarray(vector, dtype=np.float32)
+            self._remember(key, vector)
+            rows.append((key, self.dtype.name, vector.astype(self.dtype).tobytes(), now))
+        return rows
+
+    # Insert and trim in one transaction so other workers never see the file over its limit
+    def store(self, rows):
+        with self.write_lock:
+            try:
+                self.writer.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                self.skipped_writes += 1
+                return
+            try:
+                self.writer.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                if self.max_entries:
+                    self.evictions += self.writer.execute("""
+                        DELETE FROM embeddings WHERE key IN (
+                            SELECT key FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.max_entries,)).rowcount
+                self.writer.execute("COMMIT")
+            except sqlite3.OperationalError:
+                if self.writer.in_transaction:
+                    self.writer.execute("ROLLBACK")
+                self.skipped_writes += 1
+            except BaseException:
+                self.writer.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+            "memory_entries": len(self.lru),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "skipped_writes": self.skipped_writes,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+def default_cache(busy_timeout=5):
+    return EmbeddingCache(
+        os.getenv("EMBEDDING_CACHE_PATH"),
+        dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float16"),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "0")),
+        busy_timeout=busy_timeout
+    )
+
+# Embed texts with a synchronous client, only sending cache misses (scrapers)
+def embed_texts_sync(client, cache, texts, on_usage=None):
+    vectors = cache.get_many(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        response = client.embeddings.create(input=[texts[i] for i in missing], model=cache.model)
+        fresh = [item.embedding for item in response.data]
+        if on_usage:
+            on_usage(cache.model, response.usage.prompt_tokens)
+        cache.put_many([texts[i] for i in missing], fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+# Embed texts with an async client, only sending cache misses (API); `call`
+# optionally wraps the embeddings call
+async def embed_texts_async(client, cache, texts, on_usage=None, call=None):
+    vectors = cache.get_many(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        create = lambda: client.embeddings.create(input=[texts[i] for i in missing], model=cache.model)
+        response = await (call(create) if call else create())
+        fresh = [item.embedding for item in response.data]
+        if on_usage:
+            on_usage(cache.model, response.usage.prompt_tokens)
+        await cache.put_many_async([texts[i] for i in missing], fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
@@ -0,0 +1,133 @@
+import argparse
+import json
+import mmap
+import os
+
+import numpy as np
+
+# On-disk layout of a store directory:
+#   meta.json     count, dim, dtype
+#   ids.json      document ids, row order
+#   vectors.npy   float16 or int8 matrix of normalized embeddings
+#   scales.npy    float32 per-row scale (int8 only)
+#   texts.bin     utf-8 document texts back to back
+#   offsets.npy   int64 byte offsets into texts.bin (count + 1)
+# The arrays are opened with mmap, so opening costs milliseconds, pages are
+# only read when touched, and every worker shares them through the OS cache.
+# A full scan still converts every row to float32 per query (about 50 ms for
+# 50k int8 rows, 250 ms for float16, see bench_store.py); past a few thousand
+# rows, search through an IVF index (ann_index.py), which only scores the
+# rows of the lists it probes.
+
+def quantize(matrix, dtype):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported store dtype: {dtype}")
+
+def write_store(path, ids, texts, matrix, dtype="int8"):
+    os.makedirs(path, exist_ok=True)
+    vectors, scales = quantize(matrix, dtype)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    if scales is not None:
+        np.save(os.path.join(path, "scales.npy"), scales)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+    with open(os.path.join(path, "texts.bin"), "wb") as f:
+        for blob in encoded:
+            f.write(blob)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(list(ids), f)
+    # meta.json goes last so a half-written store is never opened
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(encoded), "dim": int(vectors.shape[1]), "dtype": dtype}, f)
+
+class EmbeddingStore:
+    def __init__(self, path, chunk=2048):
+        self.path = path
+        self.chunk = chunk
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = None
+        if self.meta["dtype"] == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._texts_file = open(os.path.join(path, "texts.bin"), "rb")
+        self.texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def text(self, i):
+        return bytes(self.texts[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    # Cosine scores for every row, upcast chunk by chunk into one reused
+    # buffer small enough to stay in the CPU cache
+    def scores(self, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        scores = np.empty(len(self), dtype=np.float32)
+        buffer = np.empty((min(self.chunk, len(self)), self.meta["dim"]), dtype=np.float32)
+        for start in range(0, len(self), self.chunk):
+            block = self.vectors[start:start + self.chunk]
+            buffer[:len(block)] = block
+            np.matmul(buffer[:len(block)], query, out=scores[start:start + len(block)])
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    # Cosine scores of the given rows only, e.g. those an IVF index probes;
+    # rows are read in file order so neighbouring ones share page reads
+    def score_rows(self, rows, query):
+        order = np.argsort(rows)
+        sorted_rows = rows[order]
+        found = self.vectors[sorted_rows].astype(np.float32) @ query
+        if self.scales is not None:
+            found *= self.scales[sorted_rows]
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[order] = found
+        return scores
+
+    def top_k(self, vector, k=10):
+        scores = self.scores(vector)
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def close(self):
+        if self.texts:
+            self.texts.close()
+        self._texts_file.close()
+
+# Convert scraper JSON dumps into a store
+def main():
+    from retrievers import DEFAULT_LOCAL_INDEX, LocalRetriever
+
+    parser = argparse.ArgumentParser(description="Write a quantized, memory-mapped embedding store")
+    parser.add_argument("--input", default=os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX))
+    parser.add_argument("--out", default=os.getenv("LOCAL_STORE_PATH", os.path.join(os.path.dirname(DEFAULT_LOCAL_INDEX), "store")))
+    parser.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    args = parser.parse_args()
+
+    documents = LocalRetriever.from_json(args.input.split(","))
+    write_store(args.out, documents.ids, documents.texts, documents.matrix, args.dtype)
+    print(f"Wrote {len(documents.ids)} {args.dtype} vectors to {args.out}")
+
+if __name__ == "__main__":
+    main()
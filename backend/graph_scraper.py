@@ -12,6 +12,10 @@ from bs4 import BeautifulSoup
 
 from neo4j import GraphDatabase
 
+from semantic_cache import bump_index_version
+from embedding_cache import default_cache, embed_texts_sync
+from usage import UsageTotals
+
 load_dotenv()
 
 # Setup OpenAI Client
@@ -27,6 +31,12 @@ USERNAME = os.getenv("NEO4J_USERNAME")
 PASSWORD = os.getenv("NEO4J_PASSWORD")
 driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
 
+# Unchanged recipes are not re-embedded on later runs
+embedding_cache = default_cache()
+
+# Tokens and estimated spend of this run, printed at the end
+usage_totals = UsageTotals()
+
 # Recipe URLs
 BASE_URL = "https://www.madewithnestle.ca"
 RECIPE_INDEX = BASE_URL + "/recipes"
@@ -130,12 +140,11 @@ async def scrape_recipe_details(page, recipe):
         recipe["tags"] = tags or []
         recipe["id"] = base64.urlsafe_b64encode(recipe["url"].encode()).decode()
 
-        response = client.embeddings.create(
-            input=[combined_text],
-            model="text-embedding-3-small"
-        )
         recipe["text"] = combined_text
-        recipe["embedding"] = response.data[0].embedding
+        recipe["embedding"] = embed_texts_sync(
+            client, embedding_cache, [combined_text],
+            on_usage=lambda model, tokens: usage_totals.add("embed", model, tokens)
+        )[0]
         recipe["type"] = "recipe"
 
         return recipe
@@ -238,5 +247,11 @@ async def scrape_recipes():
 
         print(f"Uploaded {len(recipes)} recipes to Neo4j.") 
 
+        # Let running APIs know their cached answers are stale
+        bump_index_version()
+
+        print(usage_totals.report("OpenAI usage"))
+        print(f"Embedding cache: {embedding_cache.stats()}")
+
 if __name__ == "__main__":
     asyncio.run(scrape_recipes())
@@ -1,57 +1,475 @@
 import os
 import json
+import time
+import asyncio
+from contextlib import aclosing, asynccontextmanager, nullcontext
 
-from fastapi import FastAPI
+import_started = time.perf_counter()
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from dotenv import load_dotenv
 
-from openai import AzureOpenAI
-from azure.search.documents.models import VectorizedQuery
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-
-from langchain_openai import AzureChatOpenAI
-from langchain_neo4j import Neo4jGraph
-from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain
-from langchain.prompts import PromptTemplate
+from semantic_cache import SemanticCache, index_version
+from sessions import clip, default_sessions
+from query_router import build_router, normalize_text
+from cypher_templates import CypherTemplates, fetch_slot_vocabulary
+from cypher_cache import CypherCache
+from embedding_cache import default_cache, embed_texts_async
+from embedding_batcher import EmbeddingBatcher
+from retrievers import AzureSearchRetriever, build_retriever, reciprocal_rank_fusion
+from context_packer import ContextPacker
+from admission import ConcurrencyLimiter, TokenBucket, per_worker
+from resilience import FALLBACKS, DeadlineExceeded, Overloaded, Upstream, UpstreamUnavailable, retry_after, start_deadline
+from shared_cache import default_shared_cache
+from single_flight import SingleFlight, count_upstream_call
+from tracing import record, record_usage, render_metrics, set_outcome, span, start_trace
+from upstream_replay import upstream_from_env
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Setup Azure OpenAI client
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
+# Record every upstream call to a fixture file, or replay them from it
+# (UPSTREAM_MODE=record|replay); None talks to the live services
+upstream = upstream_from_env()
+
+# The OpenAI, Azure AI Search and Neo4j clients and the Cypher model are
+# imported and built by the warm-up task once the server is listening, so a
+# worker starts without paying for the SDK imports or connecting to Neo4j
+client = None
+search_client = None
+graph = None
+llm = None
+cypher_prompt = None
+
+# Count every OpenAI request against the chat request that made it
+async def count_openai_request(request):
+    count_upstream_call()
+
+# A 429 means the deployment's quota ran out regardless of the token bucket,
+# e.g. because another client shares it: hold all calls off for its Retry-After
+async def note_rate_limit(response):
+    if response.status_code != 429:
+        return
+    deployment = response.request.url.path.split("/deployments/", 1)[-1].split("/", 1)[0]
+    quota = openai_quotas.get(deployment)
+    if quota:
+        quota.pause(retry_after(response))
+
+# Setup Azure OpenAI client and the query embedding batcher that uses it
+def create_openai_client():
+    global client, embedding_batcher
+    from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
+    client = AsyncAzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=DefaultAsyncHttpxClient(
+            event_hooks={"request": [count_openai_request], "response": [note_rate_limit]},
+            transport=upstream.transport() if upstream else None
+        )
+    )
+    # Batch query embeddings from concurrent requests into shared API calls;
+    # QUERY_EMBED_WINDOW_MS=0 sends every request's texts on their own
+    query_embed_window = float(os.getenv("QUERY_EMBED_WINDOW_MS", "5")) / 1000
+    embedding_batcher = EmbeddingBatcher(
+        client,
+        embedding_cache,
+        window=query_embed_window,
+        max_batch=int(os.getenv("QUERY_EMBED_MAX_BATCH", "64")),
+        on_upstream=count_upstream_call,
+        on_usage=lambda model, tokens: record_usage("embed", model, tokens),
+        call=upstreams["embeddings"].call
+    ) if query_embed_window > 0 else None
 
 # Setup the SearchClient
-search_client = SearchClient(
-    endpoint = os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
-    index_name = os.getenv("AZURE_AI_SEARCH_INDEX"),
-    credential = AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_KEY"))
-)
+def create_search_client():
+    global search_client
+    from azure.search.documents.aio import SearchClient
+    from azure.core.credentials import AzureKeyCredential
 
-# Setup Neo4j connection
-graph = Neo4jGraph(
-    url=os.getenv("NEO4J_URI"),
-    username=os.getenv("NEO4J_USERNAME"),
-    password=os.getenv("NEO4J_PASSWORD")
-)
+    search_client = SearchClient(
+        endpoint = os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+        index_name = os.getenv("AZURE_AI_SEARCH_INDEX"),
+        credential = AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_KEY"))
+    )
+
+# Setup Neo4j connection; the schema is fetched in a later warm-up step
+def create_graph():
+    global graph
+    from langchain_neo4j import Neo4jGraph
+
+    graph = (upstream.graph_class(Neo4jGraph) if upstream else Neo4jGraph)(
+        url=os.getenv("NEO4J_URI"),
+        username=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD"),
+        # Neo4j aborts queries running longer than the timeout, so a cut-off query does not keep its thread busy
+        timeout=upstreams["neo4j"].timeout,
+        refresh_schema=False
+    )
+
+# Setup Azure OpenAI Chat model with the custom Cypher prompt that enforces CONTAINS instead of =
+def create_llm():
+    global llm, cypher_prompt
+    from langchain_openai import AzureChatOpenAI
+    from langchain_core.prompts import PromptTemplate
+    from cypher_monitor import CypherGenerationMonitor
+
+    http_clients = {}
+    if upstream:
+        import httpx
+
+        http_clients = {
+            "http_client": httpx.Client(transport=upstream.transport()),
+            "http_async_client": httpx.AsyncClient(transport=upstream.transport())
+        }
+    llm = AzureChatOpenAI(
+        azure_deployment="gpt-4o-mini",
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION"),
+        temperature=0,
+        callbacks=[CypherGenerationMonitor()],
+        **http_clients
+    )
+    cypher_prompt = PromptTemplate.from_template(CYPHER_PROMPT)
+
+CYPHER_PROMPT = """
+You are an expert Cypher query generator for a recipe knowledge graph.
+you should generalize by using `toLower(variable) CONTAINS 'substring'` instead of exact matches.
+Avoid `=` at all times.
+Normalize all text comparisons using `toLower()`.
+Also, return r.title, r.url, r.image and r.instructions
 
-# Setup Azure OpenAI Chat model
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini", 
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_VERSION"),
-    temperature=0
+Graph Schema:
+{schema}
+
+Question:
+{question}
+
+Cypher query:
+"""
+
+# Fit retrieved documents into a fixed prompt token budget; loading the
+# tokenizer may download its vocabulary, so it is built during warm-up
+def create_context_packer():
+    global context_packer
+    context_packer = ContextPacker(
+        budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+        doc_budget=int(os.getenv("CONTEXT_DOC_TOKENS", "400"))
+    )
+
+# Import and build every client concurrently, off the event loop; Neo4j
+# connects while the other SDKs are still importing
+async def create_clients():
+    await asyncio.gather(*(
+        timed_step(name, required_steps[name])
+        for name in ("openai_client", "search_client", "neo4j_connect", "cypher_llm", "tokenizer")
+    ))
+
+# Shared Cypher chain, built at startup and rebuilt whenever the schema is refreshed
+cypher_chain = None
+
+# Build custom chain with prompt. return_direct skips the chain's own QA
+# call because the final answer is generated separately. CYPHER_VERBOSE=0
+# stops it printing every generated query.
+def build_cypher_chain():
+    from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain
+
+    return GraphCypherQAChain.from_llm(
+        llm=llm,
+        graph=graph,
+        cypher_prompt=cypher_prompt,
+        verbose=os.getenv("CYPHER_VERBOSE", "1") == "1",
+        allow_dangerous_requests=True,
+        return_intermediate_steps=True,
+        return_direct=True
+    )
+
+# Introspect the graph schema off the event loop and swap in a fresh chain
+async def refresh_graph_schema():
+    global cypher_chain
+    await asyncio.to_thread(graph.refresh_schema)
+    cypher_chain = await asyncio.to_thread(build_cypher_chain)
+
+# Keep the schema, template and router vocabulary current in the background so no request pays for introspection
+async def schema_refresher(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_graph_schema()
+            # A schema fetch that failed during warm-up no longer holds /ready back
+            startup["errors"].pop("graph_schema", None)
+            vocabulary = await refresh_cypher_templates()
+            if query_router:
+                query_router.set_vocabulary(vocabulary["ingredient"] + vocabulary["tag"])
+        except Exception as e:
+            print(f"Failed to refresh graph schema: {e}")
+
+# Vector retriever (Azure AI Search or in-process), built at startup
+retriever = None
+
+async def setup_retriever():
+    global retriever
+    retriever = await asyncio.to_thread(build_retriever, search_client)
+    if upstream and isinstance(retriever, AzureSearchRetriever):
+        retriever = upstream.wrap_retriever(retriever)
+
+# Setup persistent embedding cache, shared by all workers and the scrapers; a
+# write that waits over 100 ms for another process is skipped
+embedding_cache = default_cache(busy_timeout=0.1)
+embedding_batcher = None
+
+# Setup persistent cache of LLM-generated Cypher, shared by all workers
+cypher_cache = CypherCache(os.getenv("CYPHER_CACHE_PATH"))
+
+# Setup semantic answer cache for paraphrased questions
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 )
 
+# Rewrites and exact-match answers shared by every worker on this host, so a
+# question answered by one worker is a hit for all of them
+shared_cache = default_shared_cache()
+
+# Conversation history for requests that carry a session_id
+sessions = default_sessions()
+session_stats = {"turns": 0, "history_requests": 0, "history_tokens": 0, "summaries": 0, "summary_errors": 0}
+summarizing = set()
+background_tasks = set()
+
+context_packer = None
+
+# Identical /chat messages in flight at the same time share one answer
+chat_flights = SingleFlight() if os.getenv("CHAT_COALESCE", "1") == "1" else None
+
+# Local embedding router and Cypher templates, built from the graph vocabulary
+# at startup; None means always ask the LLM
+query_router = None
+cypher_templates = None
+route_stats = {
+    "local": 0, "llm": 0, "rewrite_cached": 0, "cypher_template": 0, "cypher_cached": 0, "cypher_llm": 0,
+    "hybrid_vector_timeout": 0, "hybrid_graph_timeout": 0, "graph_fallback": 0
+}
+
+# RETRIEVAL_MODE=hybrid searches both backends concurrently for every query
+# and fuses the results instead of trusting the router's pick; each backend
+# gets its own deadline so the slower one cannot hold up the answer
+retrieval_mode = os.getenv("RETRIEVAL_MODE", "routed")
+hybrid_timeouts = {
+    "vector": float(os.getenv("HYBRID_VECTOR_TIMEOUT", "2")),
+    "graph": float(os.getenv("HYBRID_GRAPH_TIMEOUT", "5"))
+}
+
+# Every call to an upstream service goes through a circuit breaker and a
+# timeout, cut shorter when the request's CHAT_DEADLINE is closer.
+# HEDGE_REQUESTS=1 also sends a duplicate embeddings or rewrite call once the
+# first has taken longer than HEDGE_QUANTILE of recent calls.
+chat_deadline = float(os.getenv("CHAT_DEADLINE", "30"))
+hedge_requests = os.getenv("HEDGE_REQUESTS", "0") == "1"
+hedge_quantile = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+breaker_settings = {
+    "threshold": int(os.getenv("BREAKER_FAILURES", "5")),
+    "reset_timeout": float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+}
+
+# Admission control: at most *_CONCURRENCY calls in flight per upstream (the
+# rewrite and answer calls share the chat model's), with UPSTREAM_QUEUE more
+# waiting and the rest refused with a 503; 0 turns a limiter off.
+# CHAT_MODEL_TPM and EMBED_TPM meter calls to the deployments' tokens-per-
+# minute quotas, split between the WEB_CONCURRENCY workers; 0 leaves them unmetered.
+def concurrency_limiter(name, variable, default, queue_size):
+    limit = int(os.getenv(variable, default))
+    return ConcurrencyLimiter(name, limit, queue_size) if limit > 0 else None
+
+def openai_quota(deployment, variable):
+    per_minute = float(os.getenv(variable, "0"))
+    if per_minute <= 0:
+        return None
+    return TokenBucket(deployment, per_worker(per_minute), float(os.getenv("QUOTA_BURST_SECONDS", "10")))
+
+upstream_queue = int(os.getenv("UPSTREAM_QUEUE", "256"))
+request_limiter = concurrency_limiter("requests", "REQUEST_CONCURRENCY", "64", int(os.getenv("REQUEST_QUEUE", "256")))
+limiters = {
+    "chat_model": concurrency_limiter("chat_model", "CHAT_MODEL_CONCURRENCY", "16", upstream_queue),
+    "embeddings": concurrency_limiter("embeddings", "EMBED_CONCURRENCY", "8", upstream_queue),
+    "search": concurrency_limiter("search", "SEARCH_CONCURRENCY", "16", upstream_queue),
+    "neo4j": concurrency_limiter("neo4j", "NEO4J_CONCURRENCY", "8", upstream_queue)
+}
+openai_quotas = {
+    "gpt-4o-mini": openai_quota("gpt-4o-mini", "CHAT_MODEL_TPM"),
+    "text-embedding-3-small": openai_quota("text-embedding-3-small", "EMBED_TPM")
+}
+chat_model = {"limiter": limiters["chat_model"], "quota": openai_quotas["gpt-4o-mini"]}
+
+# Usage of a losing hedged call, which none of the callers read
+def hedge_usage(stage, model):
+    def record_loser(response):
+        usage = getattr(response, "usage", None)
+        if usage:
+            record_usage(stage, getattr(response, "model", None) or model,
+                         usage.prompt_tokens, getattr(usage, "completion_tokens", 0) or 0)
+    return record_loser
+
+upstreams = {
+    "embeddings": Upstream("embeddings", float(os.getenv("EMBED_TIMEOUT", "5")),
+                           hedge=hedge_requests, quantile=hedge_quantile, **breaker_settings,
+                           limiter=limiters["embeddings"], quota=openai_quotas["text-embedding-3-small"],
+                           on_usage=hedge_usage("embed", "text-embedding-3-small")),
+    "rewrite": Upstream("rewrite", float(os.getenv("REWRITE_TIMEOUT", "10")),
+                        hedge=hedge_requests, quantile=hedge_quantile, **breaker_settings, **chat_model,
+                        on_usage=hedge_usage("rewrite", "gpt-4o-mini")),
+    "chat": Upstream("chat", float(os.getenv("ANSWER_TIMEOUT", "20")), **breaker_settings, **chat_model),
+    "search": Upstream("search", float(os.getenv("SEARCH_TIMEOUT", "5")), **breaker_settings,
+                       limiter=limiters["search"]),
+    "neo4j": Upstream("neo4j", float(os.getenv("NEO4J_TIMEOUT", "10")), **breaker_settings,
+                      limiter=limiters["neo4j"])
+}
+
+# Tokens a chat model call is reserved from the quota: its prompt plus the
+# completion it is expected to write; the usage it reports settles the
+# difference. With CHAT_MODEL_TPM=0 nothing is reserved, so nothing is counted.
+REWRITE_COMPLETION_TOKENS = 60
+CYPHER_COMPLETION_TOKENS = 60
+ANSWER_COMPLETION_TOKENS = 400
+
+def chat_tokens(messages, completion):
+    if not chat_model["quota"]:
+        return 0
+    return sum(context_packer.count(message["content"]) for message in messages) + completion
+
+async def refresh_cypher_templates():
+    global cypher_templates
+    vocabulary = await asyncio.to_thread(fetch_slot_vocabulary, graph)
+    cypher_templates = CypherTemplates(vocabulary)
+    return vocabulary
+
+async def setup_graph_vocabulary():
+    global query_router
+    try:
+        vocabulary = await refresh_cypher_templates()
+    except Exception as e:
+        print(f"Failed to load graph vocabulary, falling back to the LLM: {e}")
+        return
+
+    if os.getenv("ROUTER_MODE", "local") != "local":
+        return
+    try:
+        query_router = await build_router(
+            embed_texts,
+            vocabulary["ingredient"] + vocabulary["tag"],
+            min_margin=float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))
+        )
+    except Exception as e:
+        print(f"Local router disabled, falling back to LLM routing: {e}")
+
+# Open WARMUP_CONNECTIONS connections to OpenAI and Azure AI Search before the
+# first request needs them, with concurrent one-word embeddings and top-1 searches
+async def warm_connections():
+    count = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+    if count <= 0:
+        return
+    responses = await asyncio.gather(*(
+        client.embeddings.create(input=["warm-up"], model=embedding_cache.model) for _ in range(count)
+    ))
+    vector = responses[0].data[0].embedding
+    await asyncio.gather(*(retriever.search(vector, k=1) for _ in range(count)))
+
+# Import and init time: the module import, then every warm-up step in ms.
+# `errors` holds the required steps that are failing right now, `warnings`
+# the optional ones that failed.
+startup = {"import_ms": None, "steps": {}, "errors": {}, "warnings": {}, "ready": False, "ready_ms": None}
+
+# Steps a worker cannot answer without, by name, so failed ones can be retried
+required_steps = {
+    "openai_client": lambda: asyncio.to_thread(create_openai_client),
+    "search_client": lambda: asyncio.to_thread(create_search_client),
+    "neo4j_connect": lambda: asyncio.to_thread(create_graph),
+    "cypher_llm": lambda: asyncio.to_thread(create_llm),
+    "tokenizer": lambda: asyncio.to_thread(create_context_packer),
+    "graph_schema": lambda: refresh_graph_schema(),
+    "retriever": lambda: setup_retriever()
+}
+
+async def timed_step(name, setup, required=True):
+    start = time.perf_counter()
+    try:
+        await setup()
+        startup["errors"].pop(name, None)
+    except Exception as e:
+        startup["errors" if required else "warnings"][name] = str(e)
+        print(f"Warm-up step {name} failed: {e}")
+    finally:
+        startup["steps"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+# Re-run failed required steps, in the order they failed, until all pass.
+# Without the graph vocabulary, routing and templates fall back to the LLM,
+# so it is reloaded too once Neo4j answers instead of at the next refresh.
+async def retry_failed_steps(interval):
+    while startup["errors"] or cypher_templates is None:
+        await asyncio.sleep(interval)
+        for name in list(startup["errors"]):
+            await timed_step(name, required_steps[name])
+        if cypher_templates is None and "graph_schema" not in startup["errors"]:
+            await timed_step("graph_vocabulary", setup_graph_vocabulary, required=False)
+
+# Build the clients, Cypher chain, router and retriever, fill the connection
+# pools and optionally answer WARMUP_PROMPT end to end. Filling the pools and
+# the warm-up prompt only save the first requests time, so their failures
+# are warnings; failed required steps are retried in the background.
+async def warm_up():
+    global refresher, retrier
+    start = time.perf_counter()
+    await create_clients()
+    await asyncio.gather(
+        timed_step("graph_schema", required_steps["graph_schema"]),
+        timed_step("graph_vocabulary", setup_graph_vocabulary, required=False),
+        timed_step("retriever", required_steps["retriever"])
+    )
+    await timed_step("connections", warm_connections, required=False)
+    if os.getenv("WARMUP_PROMPT"):
+        await timed_step("warmup_prompt", lambda: answer_chat(os.getenv("WARMUP_PROMPT")), required=False)
+    refresher = asyncio.create_task(
+        schema_refresher(float(os.getenv("GRAPH_SCHEMA_REFRESH_SECONDS", "600")))
+    )
+    if startup["errors"] or cypher_templates is None:
+        retrier = asyncio.create_task(retry_failed_steps(float(os.getenv("WARMUP_RETRY_SECONDS", "10"))))
+    startup["ready_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    print(f"Warm-up finished in {startup['ready_ms']} ms: {startup['steps']}")
+
+warmup = None
+refresher = None
+retrier = None
+
+# Requests that arrive during warm-up wait for it instead of failing
+async def wait_ready():
+    if warmup and not warmup.done():
+        await asyncio.shield(warmup)
+
+# Start warm-up without holding up the server, and close async clients when
+# it shuts down
+@asynccontextmanager
+async def lifespan(app):
+    global warmup
+    warmup = asyncio.create_task(warm_up())
+    yield
+    for task in (warmup, refresher, retrier, *background_tasks):
+        if task:
+            task.cancel()
+    if search_client:
+        await search_client.close()
+    if client:
+        await client.close()
+
 # Create FastAPI app instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -59,17 +477,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# SERVER_TIMING=1 adds each request's stage breakdown as a Server-Timing header
+server_timing = os.getenv("SERVER_TIMING", "0") == "1"
+
+# RESPONSE_USAGE=1 adds each request's OpenAI token usage and cost to its response
+response_usage = os.getenv("RESPONSE_USAGE", "0") == "1"
+
 # Define the structure of incoming JSON data
 class ChatRequest(BaseModel):
     message: str
+    # Optional conversation ID chosen by the client; follow-ups then see earlier turns
+    session_id: str | None = Field(default=None, max_length=128)
 
-# Create a POST endpoint at /chat
-@app.post("/chat")
-async def chat(req: ChatRequest):
-    prompt = req.message
+# The rewrite model answered with something other than the JSON it was asked for
+class RouteParseError(ValueError):
+    pass
 
+# Classify the query as vector/graph/reply and rewrite it for retrieval; with
+# conversation history, follow-ups are rewritten into standalone queries
+async def classify_query(prompt, history=""):
     rewrite_prompt = [
         {
             "role": "system",
@@ -96,95 +525,211 @@ async def chat(req: ChatRequest):
             "content": f"User query: {prompt}"
         }
     ]
+    if history:
+        rewrite_prompt.insert(1, {
+            "role": "system",
+            "content": (
+                "Conversation so far. If the user query is a follow-up, rewrite it into a standalone "
+                f"query that includes what it refers to:\n{history}"
+            )
+        })
 
-    rewrite_response = client.chat.completions.create(
+    rewrite_response = await upstreams["rewrite"].call(lambda: client.chat.completions.create(
         model="gpt-4o-mini",
         messages=rewrite_prompt,
         temperature=0.5
-    )
+    ), tokens=chat_tokens(rewrite_prompt, REWRITE_COMPLETION_TOKENS))
 
-    try:
-        content = rewrite_response.choices[0].message.content.strip()
+    if rewrite_response.usage:
+        record_usage("rewrite", rewrite_response.model or "gpt-4o-mini",
+                     rewrite_response.usage.prompt_tokens, rewrite_response.usage.completion_tokens)
+    content = (rewrite_response.choices[0].message.content or "").strip()
 
-        if content.startswith("```"):
-            content = content.strip("```").strip()
+    if content.startswith("```"):
+        content = content.strip("```").strip()
+    try:
         parsed = json.loads(content)
-        target = parsed.get("target")
-        rewritten_query = parsed.get("rewritten_query")
-    except Exception as e:
-        return {"error": f"Failed to parse response: {str(e)}"}
-    
-    if target == "reply":
-        return {
-            "response" : rewritten_query
-        }
+    except json.JSONDecodeError as e:
+        raise RouteParseError(e) from e
+    if not isinstance(parsed, dict):
+        raise RouteParseError(f"expected a JSON object, got {content!r}")
+    return parsed.get("target"), parsed.get("rewritten_query")
 
-    if target == "vector":
-        # Generate embedding for the query
-        embedding_response = client.embeddings.create(
-            input=[rewritten_query],
-            model="text-embedding-3-small"
-        )
-        query_vector = embedding_response.data[0].embedding
-        # Creating VectorizedQuery with embedding
-        vector_query = VectorizedQuery(
-            kind="vector",
-            vector=query_vector,
-            k_nearest_neighbors=10,
-            fields="embedding"
-        )
-        # Search Azure AI Search index
-        results = search_client.search(
-            search_text=None,
-            vector_queries=[vector_query]
-        )
-        context = "\n\n".join(
-            doc["text"] for doc in results if "text" in doc
+# Generate embeddings for several texts in one call, skipping cached ones
+async def embed_texts(texts):
+    with span("embed"):
+        if embedding_batcher:
+            return await embedding_batcher.embed(texts)
+        return await embed_texts_async(
+            client, embedding_cache, texts,
+            on_usage=lambda model, tokens: record_usage("embed", model, tokens),
+            call=upstreams["embeddings"].call
         )
 
+# Generate embedding for a query
+async def embed_query(text):
+    return (await embed_texts([text]))[0]
+
+# Rewrite a follow-up into a standalone query with its history in view and
+# return it with its route. From there on it is an ordinary question, cached
+# and coalesced on the standalone query. Replies to a follow-up depend on the
+# conversation, so they keep the message as it was sent.
+async def standalone_query(prompt, history):
+    if not history:
+        return prompt, None
+    route_stats["llm"] += 1
+    with span("rewrite"):
+        target, rewritten_query = await classify_query(prompt, history)
+    if target == "reply" or not rewritten_query:
+        return prompt, (target, rewritten_query)
+    return rewritten_query, (target, rewritten_query)
+
+# Route with the local router when it is confident, otherwise classify and
+# rewrite with the LLM
+async def route_query(prompt, message_embedding):
+    if query_router:
+        with span("route"):
+            target, _ = query_router.route(prompt, message_embedding)
+        if target:
+            route_stats["local"] += 1
+            return target, prompt
+    key = normalize_text(prompt)
+    cached = shared_cache.get("rewrites", key) if shared_cache else None
+    if cached:
+        route_stats["rewrite_cached"] += 1
+        return tuple(cached)
+    route_stats["llm"] += 1
+    with span("rewrite"):
+        target, rewritten_query = await classify_query(prompt)
+    if shared_cache and target in ("vector", "graph", "reply"):
+        shared_cache.put("rewrites", key, [target, rewritten_query])
+    return target, rewritten_query
+
+# Search the configured vector index
+async def search_vector(rewritten_query):
+    query_vector = await embed_query(rewritten_query)
+    count_upstream_call()
+    with span("search"):
+        return await upstreams["search"].call(lambda: retriever.search(query_vector, k=10))
+
+# Fetch matching recipe rows from Neo4j
+async def search_graph(rewritten_query):
+    # Answer common recipe intents with pre-written, parameterized Cypher
+    if cypher_templates:
+        template = cypher_templates.match(rewritten_query)
+        if template:
+            cypher, params = template
+            count_upstream_call()
+            with span("neo4j"):
+                context = await upstreams["neo4j"].call(lambda: asyncio.to_thread(graph.query, cypher, params))
+            if context:
+                route_stats["cypher_template"] += 1
+                return context
+
+    # Reuse Cypher the LLM already wrote for the same normalized question
+    cached_cypher = cypher_cache.get(rewritten_query)
+    if cached_cypher:
+        try:
+            count_upstream_call()
+            with span("neo4j"):
+                context = await upstreams["neo4j"].call(lambda: asyncio.to_thread(graph.query, cached_cypher))
+            route_stats["cypher_cached"] += 1
+            return context[:cypher_chain.top_k]
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"Cached Cypher failed, regenerating: {e}")
+            cypher_cache.invalidate(rewritten_query)
+
+    # Otherwise have the LLM write the Cypher with the shared chain's prompt
+    # and model, then run it. The two steps go through their own upstreams,
+    # so a failing model does not trip the Neo4j breaker or hold a Neo4j slot.
+    route_stats["cypher_llm"] += 1
+    # One LLM call to write the Cypher, one Neo4j query to run it
+    count_upstream_call(2)
+    from langchain_neo4j.chains.graph_qa.cypher import extract_cypher
+
+    chain = cypher_chain
+    # The Cypher-writing call draws on the chat model quota too; the message
+    # (not the chain's parsed string) carries the usage that settles it
+    cypher_request = {"content": f"{CYPHER_PROMPT}{chain.graph_schema}{rewritten_query}"}
+    message = await upstreams["rewrite"].call(
+        lambda: (cypher_prompt | llm).ainvoke({"question": rewritten_query, "schema": chain.graph_schema}),
+        tokens=chat_tokens([cypher_request], CYPHER_COMPLETION_TOKENS)
+    )
+    generated = message.content
+    # Unwrap backticks and correct the query the way the chain itself does
+    cypher = extract_cypher(generated)
+    if chain.cypher_query_corrector:
+        cypher = chain.cypher_query_corrector(cypher)
+    if chain.verbose:
+        print(f"Generated Cypher:\n{cypher}")
+    # The corrector blanks Cypher that does not fit the schema
+    if not cypher:
+        return []
+    with span("neo4j"):
+        context = await upstreams["neo4j"].call(lambda: asyncio.to_thread(graph.query, cypher))
+    context = context[:chain.top_k]
+    # Only Cypher that ran and returned rows is worth caching
+    if context:
+        cypher_cache.put(rewritten_query, cypher, [{"query": cypher}])
+    return context
+
+# Run one backend under its deadline; a slow or failing backend contributes nothing
+async def bounded_search(name, search):
+    try:
+        return await asyncio.wait_for(search, hybrid_timeouts[name])
+    except asyncio.TimeoutError:
+        route_stats[f"hybrid_{name}_timeout"] += 1
+        print(f"Hybrid {name} retrieval timed out after {hybrid_timeouts[name]}s")
+    except Exception as e:
+        print(f"Hybrid {name} retrieval failed: {e}")
+    return []
+
+# Query both backends at once and fuse them by recipe URL. A recipe found by
+# both is listed page text first, so packing keeps the richer version.
+async def hybrid_search(rewritten_query):
+    vector_results, graph_results = await asyncio.gather(
+        bounded_search("vector", search_vector(rewritten_query)),
+        bounded_search("graph", search_graph(rewritten_query))
+    )
+    return [
+        result
+        for results, _ in reciprocal_rank_fusion([vector_results, graph_results], limit=10)
+        for result in sorted(results, key=lambda r: not r.get("text"))
+    ]
+
+# Retrieve from Azure AI Search or Neo4j depending on the target and pack the
+# hits into the prompt budget; returns the context and its token accounting
+async def retrieve_context(target, rewritten_query):
+    if retrieval_mode == "hybrid":
+        results = await hybrid_search(rewritten_query)
+    elif target == "vector":
+        results = [doc for doc in await search_vector(rewritten_query) if doc.get("text")]
     else:
-        # Custom Cypher prompt that enforces CONTAINS instead of =
-        cypher_prompt = PromptTemplate.from_template("""
-        You are an expert Cypher query generator for a recipe knowledge graph.
-        you should generalize by using `toLower(variable) CONTAINS 'substring'` instead of exact matches.
-        Avoid `=` at all times.
-        Normalize all text comparisons using `toLower()`.
-        Also, return r.title, r.url, r.image and r.instructions
-
-        Graph Schema:
-        {schema}
-
-        Question:
-        {question}
-
-        Cypher query:
-        """)
-
-        # Build custom chain with prompt
-        chain = GraphCypherQAChain.from_llm(
-            llm=llm,
-            graph=graph,
-            cypher_prompt=cypher_prompt,
-            verbose=True,
-            allow_dangerous_requests=True,
-            return_intermediate_steps=True
-        )
-        # Invoke Chain to get Response
-        response = chain.invoke(rewritten_query)
-        # Extract context from response
-        context = response["intermediate_steps"][1].get("context", [])
+        try:
+            results = await search_graph(rewritten_query)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # Neo4j is failing, too slow or behind an open breaker: answer from the vector index
+            print(f"Graph retrieval failed, using vector search: {e}")
+            route_stats["graph_fallback"] += 1
+            FALLBACKS.labels("graph", "vector").inc()
+            results = [doc for doc in await search_vector(rewritten_query) if doc.get("text")]
+    with span("pack"):
+        return context_packer.pack(results, rewritten_query)
 
-    # Create chat response
-    chat_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful madewithnestle.ca assistant."
-            },
-            {
-                "role": "user",
-                "content": f"""You are a helpful assistant for madewithnestle.ca.
+# Messages for the final answer call
+def answer_messages(context, prompt):
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a helpful madewithnestle.ca assistant."
+        },
+        {
+            "role": "user",
+            "content": f"""You are a helpful assistant for madewithnestle.ca.
                     Use the provided context to answer the user's question accurately and conversationally.
                     Be concise, friendly, and avoid generic or verbose language.
 
@@ -203,14 +748,438 @@ async def chat(req: ChatRequest):
 
                     Question:
                     {prompt}"""
+        }
+    ]
+    return messages
 
-            }
-        ],
-        temperature=0.7
+# Earlier turns of the request's session under the history token budget, or "".
+# The store is SQLite, so its calls run off the event loop.
+async def session_history(session_id):
+    if not (sessions and session_id):
+        return ""
+    history = sessions.history(await asyncio.to_thread(sessions.load, session_id), context_packer.count)
+    if history:
+        session_stats["history_requests"] += 1
+        session_stats["history_tokens"] += context_packer.count(history)
+    return history
+
+# Store a finished turn; turns that leave the verbatim window are folded into
+# the summary in the background, so no request waits for it. A turn the
+# store had to skip (database locked) is counted in its stats.
+async def remember_turn(session_id, question, answer):
+    if not (sessions and session_id):
+        return
+    session = await asyncio.to_thread(sessions.append, session_id, question, answer)
+    if session is None:
+        return
+    session_stats["turns"] += 1
+    if sessions.pending(session) and session_id not in summarizing:
+        summarizing.add(session_id)
+        task = asyncio.create_task(summarize_session(session))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+async def summarize_session(session):
+    trace = start_trace("/sessions/summary")
+    start_deadline(chat_deadline)
+    trace.target = "summary"
+    turns = sessions.pending(session)
+    transcript = "\n".join(
+        f"User: {turn['user']}\nAssistant: {clip(turn['assistant'], sessions.answer_tokens, context_packer.count)}"
+        for turn in turns
     )
-    return {
+    try:
+        with span("summarize"):
+            summary_prompt = [
+                {
+                    "role": "system",
+                    "content": (
+                        "Summarize this conversation between a user and the madewithnestle.ca assistant "
+                        f"in under {sessions.summary_tokens * 3 // 4} words. Keep the user's preferences and "
+                        "constraints (diet, allergies, time, skill level) and the recipes or products discussed."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": f"Earlier summary: {session['summary'] or 'none'}\n\n{transcript}"
+                }
+            ]
+            summary_response = await upstreams["chat"].call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=summary_prompt,
+                temperature=0,
+                max_tokens=sessions.summary_tokens
+            ), tokens=chat_tokens(summary_prompt, sessions.summary_tokens))
+        if summary_response.usage:
+            record_usage("summarize", summary_response.model or "gpt-4o-mini",
+                         summary_response.usage.prompt_tokens, summary_response.usage.completion_tokens)
+        await asyncio.to_thread(
+            sessions.apply_summary, session["id"], summary_response.choices[0].message.content.strip(), turns[-1]["n"]
+        )
+        session_stats["summaries"] += 1
+    except Exception as e:
+        trace.outcome = "error"
+        session_stats["summary_errors"] += 1
+        print(f"Session summary failed: {e}")
+    finally:
+        summarizing.discard(session["id"])
+        trace.finish()
+
+# Create a POST endpoint at /chat
+@app.post("/chat")
+async def chat(req: ChatRequest, response: Response):
+    await wait_ready()
+    trace = start_trace("/chat")
+    start_deadline(chat_deadline)
+    result = None
+    try:
+        async with request_limiter.slot() if request_limiter else nullcontext():
+            history = await session_history(req.session_id)
+            try:
+                question, routed = await standalone_query(req.message, history)
+            except RouteParseError as e:
+                set_outcome("unknown", "error")
+                result = {"error": f"Failed to parse response: {str(e)}"}
+            else:
+                if chat_flights:
+                    result = await chat_flights.run(normalize_text(question), lambda: answer_chat(question, routed))
+                else:
+                    result = await answer_chat(question, routed)
+    except UpstreamUnavailable as e:
+        # Timed out, refused by a breaker or over capacity: a quick, explicit error instead of a hang
+        trace.outcome = e.outcome
+        response.status_code = e.status
+        if isinstance(e, Overloaded):
+            response.headers["Retry-After"] = str(e.retry_after)
+        result = {"error": str(e)}
+    except Exception:
+        trace.outcome = "error"
+        raise
+    finally:
+        # No result and no outcome: cancelled, e.g. the client went away
+        if trace.outcome is None and result is None:
+            trace.outcome = "aborted"
+        # Followers of a coalesced request ran none of the stages themselves
+        if trace.outcome is None:
+            record("coalesced", trace.elapsed())
+            trace.target = result.get("target", "reply" if "response" in result else "unknown")
+            trace.outcome = "coalesced"
+        trace.finish()
+    if "response" in result:
+        await remember_turn(req.session_id, req.message, result["response"])
+    if server_timing:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+    # A copy, so the usage of this request never lands in the answer cache
+    if response_usage:
+        return {**result, "usage": trace.usage.summary()}
+    return result
+
+# Answers stored in the shared tier are only valid for the index they were built from
+def shared_answer_key(prompt):
+    return f"{index_version()}\0{normalize_text(prompt)}"
+
+# Look in this worker's semantic cache first, then for the exact question in
+# the shared tier; shared hits are copied into the semantic cache. Replies to
+# follow-ups (no embedding) are never cached.
+def cached_answer(prompt, message_embedding):
+    if message_embedding is None:
+        return None
+    cached = answer_cache.get(message_embedding)
+    if cached is None and shared_cache:
+        cached = shared_cache.get("answers", shared_answer_key(prompt))
+        if cached is not None:
+            answer_cache.put(message_embedding, cached)
+    return cached
+
+def store_answer(prompt, message_embedding, result):
+    if message_embedding is None:
+        return
+    answer_cache.put(message_embedding, result)
+    if shared_cache:
+        shared_cache.put("answers", shared_answer_key(prompt), result)
+
+# A follow-up arrives already routed, with its standalone query as the prompt
+async def answer_chat(prompt, routed=None):
+    # Answer paraphrases of already answered questions from the cache
+    target, rewritten_query = routed or (None, None)
+    message_embedding = None if target == "reply" else await embed_query(prompt)
+    cached = cached_answer(prompt, message_embedding)
+    if cached:
+        set_outcome(cached.get("target", "reply"), "cached")
+        return cached
+
+    if routed is None:
+        try:
+            target, rewritten_query = await route_query(prompt, message_embedding)
+        except RouteParseError as e:
+            set_outcome("unknown", "error")
+            return {"error": f"Failed to parse response: {str(e)}"}
+
+    if target == "reply":
+        result = {
+            "response" : rewritten_query
+        }
+        store_answer(prompt, message_embedding, result)
+        set_outcome("reply", "answered")
+        return result
+
+    context, context_tokens = await retrieve_context(target, rewritten_query)
+
+    # Create chat response
+    messages = answer_messages(context, prompt)
+    with span("answer"):
+        chat_response = await upstreams["chat"].call(lambda: client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.7
+        ), tokens=chat_tokens(messages, ANSWER_COMPLETION_TOKENS))
+    if chat_response.usage:
+        record_usage("answer", chat_response.model or "gpt-4o-mini",
+                     chat_response.usage.prompt_tokens, chat_response.usage.completion_tokens)
+    result = {
         "target": target,
         "rewritten_query": rewritten_query,
         "context": context,
+        "context_tokens": context_tokens,
         "response": chat_response.choices[0].message.content
-    }
\ No newline at end of file
+    }
+    store_answer(prompt, message_embedding, result)
+    set_outcome(target, "answered")
+    return result
+
+# Format a server-sent event
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Create a POST endpoint at /chat/stream that streams the answer as server-sent events
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    await wait_ready()
+    prompt = req.message
+    start = time.perf_counter()
+
+    def elapsed_ms():
+        return round((time.perf_counter() - start) * 1000, 1)
+
+    def done_fields(trace):
+        fields = {"stages": trace.timings_ms()}
+        if response_usage:
+            fields["usage"] = trace.usage.summary()
+        return fields
+
+    async def events():
+        trace = start_trace("/chat/stream")
+        start_deadline(chat_deadline)
+        try:
+            async with request_limiter.slot() if request_limiter else nullcontext():
+                async for event in stream_events(trace):
+                    yield event
+        except UpstreamUnavailable as e:
+            trace.outcome = e.outcome
+            yield sse("error", {"error": str(e)})
+        finally:
+            # Set on every normal exit; still unset means the client went away mid-answer
+            if trace.outcome is None:
+                trace.outcome = "aborted"
+            trace.finish()
+
+    async def stream_events(trace):
+        history = await session_history(req.session_id)
+        try:
+            question, routed = await standalone_query(prompt, history)
+        except RouteParseError as e:
+            set_outcome("unknown", "error")
+            yield sse("error", {"error": f"Failed to parse response: {str(e)}"})
+            return
+        target, rewritten_query = routed or (None, None)
+        message_embedding = None if target == "reply" else await embed_query(question)
+        cached = cached_answer(question, message_embedding)
+        if cached:
+            set_outcome(cached.get("target", "reply"), "cached")
+            await remember_turn(req.session_id, prompt, cached["response"])
+            yield sse("meta", {"target": cached.get("target", "reply"), "rewritten_query": cached.get("rewritten_query"), "cached": True})
+            if "context" in cached:
+                yield sse("context", {"context": cached["context"]})
+            yield sse("token", {"text": cached["response"]})
+            yield sse("done", {"first_token_ms": elapsed_ms(), "total_ms": elapsed_ms(), **done_fields(trace)})
+            return
+
+        if routed is None:
+            try:
+                target, rewritten_query = await route_query(question, message_embedding)
+            except RouteParseError as e:
+                set_outcome("unknown", "error")
+                yield sse("error", {"error": f"Failed to parse response: {str(e)}"})
+                return
+
+        # Routing metadata goes out as soon as classification finishes
+        yield sse("meta", {"target": target, "rewritten_query": rewritten_query})
+
+        if target == "reply":
+            store_answer(question, message_embedding, {"response": rewritten_query})
+            await remember_turn(req.session_id, prompt, rewritten_query)
+            set_outcome("reply", "answered")
+            yield sse("token", {"text": rewritten_query})
+            yield sse("done", {"first_token_ms": elapsed_ms(), "total_ms": elapsed_ms(), **done_fields(trace)})
+            return
+
+        context, context_tokens = await retrieve_context(target, rewritten_query)
+        yield sse("context", {"context": context, "context_tokens": context_tokens})
+
+        answer_start = time.perf_counter()
+        messages = answer_messages(context, question)
+        reserved = chat_tokens(messages, ANSWER_COMPLETION_TOKENS)
+        first_token_ms = None
+        tokens = []
+        # Once tokens flow the deadline no longer applies, only a stall does.
+        # The chat model slot is held until the answer has been read.
+        async with aclosing(upstreams["chat"].stream(lambda: client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        ), tokens=reserved)) as chunks:
+            async for chunk in chunks:
+                # The last chunk carries the usage of the whole answer and no choices
+                if chunk.usage:
+                    record_usage("answer", chunk.model or "gpt-4o-mini",
+                                 chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms()
+                    record("answer_first_token", time.perf_counter() - answer_start)
+                tokens.append(chunk.choices[0].delta.content)
+                yield sse("token", {"text": tokens[-1]})
+        record("answer", time.perf_counter() - answer_start)
+
+        store_answer(question, message_embedding, {
+            "target": target,
+            "rewritten_query": rewritten_query,
+            "context": context,
+            "response": "".join(tokens)
+        })
+        await remember_turn(req.session_id, prompt, "".join(tokens))
+        set_outcome(target, "answered")
+        yield sse("done", {"first_token_ms": first_token_ms, "total_ms": elapsed_ms(), **done_fields(trace)})
+
+    # Refuse with a status code while one can still be sent; a request
+    # admitted here that later finds the queue full gets an error event
+    if request_limiter and request_limiter.saturated():
+        error = request_limiter.reject()
+        return JSONResponse(
+            {"error": str(error)}, status_code=error.status, headers={"Retry-After": str(error.retry_after)}
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Request counts and per-stage latency histograms in Prometheus text format
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Semantic cache hit/miss counters
+@app.get("/cache/stats")
+async def cache_stats():
+    return answer_cache.stats()
+
+# Embedding cache hit/miss counters
+@app.get("/cache/embeddings/stats")
+async def embedding_cache_stats():
+    return {
+        **embedding_cache.stats(),
+        "batching": embedding_batcher.stats() if embedding_batcher else {"enabled": False}
+    }
+
+# Entries, bytes and evictions per namespace of the cache shared by all workers
+@app.get("/cache/shared/stats")
+async def shared_cache_stats():
+    return shared_cache.stats() if shared_cache else {"enabled": False}
+
+# Generated Cypher cache hit/miss counters
+@app.get("/cache/cypher/stats")
+async def cypher_cache_stats():
+    return cypher_cache.stats()
+
+# Prompt tokens saved by context packing
+@app.get("/context/stats")
+async def context_stats():
+    return context_packer.stats() if context_packer else {"ready": False}
+
+# Stored conversations, summaries written and history tokens added to prompts
+@app.get("/sessions/stats")
+async def sessions_stats():
+    if not sessions:
+        return {"enabled": False}
+    return {
+        **await asyncio.to_thread(sessions.stats),
+        **session_stats,
+        "avg_history_tokens": round(session_stats["history_tokens"] / session_stats["history_requests"], 1)
+        if session_stats["history_requests"] else 0.0
+    }
+
+# Forget a conversation, e.g. when the user starts over
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if sessions:
+        await asyncio.to_thread(sessions.delete, session_id)
+    return {"deleted": session_id}
+
+# Timeouts, hedges and circuit breaker state of every upstream, and how many
+# graph queries were answered from the vector index instead
+@app.get("/resilience/stats")
+async def resilience_stats():
+    return {
+        "deadline_s": chat_deadline,
+        "graph_fallback": route_stats["graph_fallback"],
+        **{name: upstream.stats() for name, upstream in upstreams.items()}
+    }
+
+# Requests and upstream calls in flight, queued and rejected per concurrency
+# limiter, and tokens reserved, used and waited for per quota
+@app.get("/admission/stats")
+async def admission_stats():
+    return {
+        "requests": request_limiter.stats() if request_limiter else {"enabled": False},
+        **{name: limiter.stats() if limiter else {"enabled": False} for name, limiter in limiters.items()},
+        "quotas": {name: quota.stats() if quota else {"enabled": False} for name, quota in openai_quotas.items()}
+    }
+
+# Duplicate /chat requests served by another request's upstream calls
+@app.get("/coalesce/stats")
+async def coalesce_stats():
+    return chat_flights.stats() if chat_flights else {"enabled": False}
+
+# Drop every cached answer, e.g. after the scrapers re-index
+@app.post("/cache/invalidate")
+async def cache_invalidate():
+    answer_cache.clear()
+    if shared_cache:
+        shared_cache.clear("answers")
+    return answer_cache.stats()
+
+# Calls recorded to or replayed from the upstream fixture file
+@app.get("/upstream/stats")
+async def upstream_stats():
+    return upstream.stats() if upstream else {"mode": "live"}
+
+# How many queries were routed and answered from the graph without the LLM
+@app.get("/router/stats")
+async def router_stats():
+    return {"enabled": query_router is not None, **route_stats}
+
+# Readiness probe: 503 until warm-up has finished and while a required step
+# is failing, with the import and init time breakdown either way
+@app.get("/ready")
+async def ready():
+    startup["ready"] = startup["ready_ms"] is not None and not startup["errors"]
+    return JSONResponse(startup, status_code=200 if startup["ready"] else 503)
+
+startup["import_ms"] = round((time.perf_counter() - import_started) * 1000, 1)
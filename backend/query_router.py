@@ -0,0 +1,134 @@
+import re
+import unicodedata
+
+import numpy as np
+
+# Labelled exemplars the local router compares incoming queries against
+EXEMPLARS = {
+    "graph": [
+        "recipes with quik",
+        "what can I make with nescafe",
+        "desserts with chocolate chips and peanut butter",
+        "drinks I can make in 5 minutes",
+        "recipes under 30 minutes",
+        "beginner recipes with coffee",
+        "easy drinks with milk",
+        "what recipes use carnation evaporated milk",
+        "cookies with smarties",
+        "quick and easy coffee drinks",
+        "recipes that serve 4 people",
+        "intermediate baking recipes with butter",
+        "iced coffee recipes",
+        "what can I bake with kitkat",
+        "show me recipes tagged drinks",
+        "recipes with coconut milk and vanilla syrup",
+        "something with aero chocolate",
+        "recipes with eggs and flour that take less than an hour",
+    ],
+    "vector": [
+        "what are some nestle products",
+        "ideas for a christmas party",
+        "tell me about nestle's history",
+        "healthy snack ideas for kids",
+        "what should I make for dinner tonight",
+        "summer treat ideas",
+        "where is nestle canada located",
+        "what is nestle's sustainability commitment",
+        "tell me about nescafe",
+        "back to school lunch ideas",
+        "how do I contact nestle",
+        "gift ideas for valentine's day",
+        "what coffee brands does nestle sell",
+        "halloween dessert ideas",
+        "nutrition information about nestle cereals",
+        "brunch ideas for mother's day",
+        "what is boost",
+        "cozy fall treats",
+    ],
+    "reply": [
+        "who are you",
+        "what can you do",
+        "hello",
+        "hi there",
+        "thanks",
+        "what's the weather today",
+        "tell me a joke",
+        "who won the hockey game last night",
+        "how old are you",
+        "can you help me with my math homework",
+        "what's your name",
+        "goodbye",
+    ],
+}
+
+# Time, skill level and serving constraints only the graph can answer
+GRAPH_HINTS = re.compile(
+    r"\b(\d+\s*(min|mins|minute|minutes|hr|hrs|hour|hours)|under an hour|less than an hour"
+    r"|beginner|intermediate|advanced|skill level|servings?|serves \d+)\b"
+)
+
+def normalize_text(text):
+    normalized = unicodedata.normalize("NFKD", text)
+    ascii_str = normalized.encode("ascii", "ignore").decode("utf-8")
+    ascii_str = re.sub(r"[^a-z0-9\s]", " ", ascii_str.lower())
+    return re.sub(r"\s+", " ", ascii_str).strip()
+
+# Classifies queries as graph/vector/reply from exemplar similarity plus a
+# keyword vocabulary, and abstains (returns None) when it is not confident
+# so the caller can fall back to the LLM classifier. "reply" is never
+# returned because those answers have to be written by the LLM anyway.
+class QueryRouter:
+    def __init__(self, exemplars, embeddings, vocabulary=(), k=3, min_margin=0.05, keyword_boost=0.1):
+        self.labels = list(exemplars)
+        self.k = k
+        self.min_margin = min_margin
+        self.keyword_boost = keyword_boost
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrices = {}
+        offset = 0
+        for label in self.labels:
+            count = len(exemplars[label])
+            self.matrices[label] = matrix[offset:offset + count]
+            offset += count
+
+        self.set_vocabulary(vocabulary)
+
+    # Swap in a fresh keyword vocabulary, e.g. after the graph was re-indexed
+    def set_vocabulary(self, vocabulary):
+        terms = {normalize_text(term) for term in vocabulary}
+        terms = sorted((t for t in terms if len(t) >= 3), key=len, reverse=True)
+        self.vocabulary = re.compile(r"\b(" + "|".join(map(re.escape, terms)) + r")\b") if terms else None
+
+    def keyword_match(self, query):
+        query = normalize_text(query)
+        if GRAPH_HINTS.search(query):
+            return True
+        return bool(self.vocabulary and self.vocabulary.search(query))
+
+    def scores(self, query, embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        vec /= np.linalg.norm(vec)
+        scores = {}
+        for label, matrix in self.matrices.items():
+            sims = matrix @ vec
+            top = np.partition(sims, -min(self.k, len(sims)))[-self.k:]
+            scores[label] = float(top.mean())
+        if "graph" in scores and self.keyword_match(query):
+            scores["graph"] += self.keyword_boost
+        return scores
+
+    def route(self, query, embedding):
+        scores = self.scores(query, embedding)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best, runner_up = ranked[0], ranked[1]
+        margin = scores[best] - scores[runner_up]
+        if best == "reply" or margin < self.min_margin:
+            return None, margin
+        return best, margin
+
+async def build_router(embed_texts, vocabulary=(), **kwargs):
+    texts = [text for label in EXEMPLARS for text in EXEMPLARS[label]]
+    embeddings = await embed_texts(texts)
+    return QueryRouter(EXEMPLARS, embeddings, vocabulary, **kwargs)
@@ -0,0 +1,389 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge
+
+TIMEOUTS = Counter(
+    "upstream_timeouts",
+    "Upstream calls cut off by their own timeout or by the request deadline",
+    ["upstream", "cause"]
+)
+HEDGES = Counter(
+    "upstream_hedges",
+    "Duplicate requests sent after the hedge delay, how many of them answered first, and how many were skipped for want of a free slot or tokens",
+    ["upstream", "result"]
+)
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open",
+    ["upstream"],
+    multiprocess_mode="max"
+)
+BREAKER_REJECTIONS = Counter(
+    "circuit_breaker_rejections",
+    "Calls refused without trying because the upstream's breaker was open",
+    ["upstream"]
+)
+FALLBACKS = Counter(
+    "retrieval_fallbacks",
+    "Queries answered from another retrieval path because theirs failed",
+    ["source", "fallback"]
+)
+
+# Why a request could not be answered; the status is what /chat returns
+class UpstreamUnavailable(Exception):
+    status = 503
+    outcome = "unavailable"
+
+class UpstreamTimeout(UpstreamUnavailable, TimeoutError):
+    status = 504
+    outcome = "timeout"
+
+class DeadlineExceeded(UpstreamTimeout):
+    pass
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+# Refused up front so the caller can back off, instead of piling onto a
+# saturated upstream; `retry_after` is the suggested wait in seconds
+class Overloaded(UpstreamUnavailable):
+    outcome = "rejected"
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Seconds a 429 response asks to wait before retrying
+def retry_after(response):
+    milliseconds = response.headers.get("retry-after-ms")
+    if milliseconds:
+        return float(milliseconds) / 1000
+    try:
+        return float(response.headers.get("retry-after", "1"))
+    except ValueError:
+        return 1.0
+
+# Absolute time.monotonic() by which the current request must be answered.
+# Tasks the request starts inherit it.
+current_deadline = ContextVar("current_deadline", default=None)
+
+def start_deadline(seconds):
+    current_deadline.set(time.monotonic() + seconds if seconds else None)
+
+# Seconds an upstream call may take: its own timeout, or less when the
+# request deadline is closer. Returns (seconds, cause of a cut-off).
+def time_left(timeout):
+    deadline = current_deadline.get()
+    if deadline is None:
+        return timeout, "timeout"
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return (left, "deadline") if left < timeout else (timeout, "timeout")
+
+# Tokens a response reports: OpenAI SDK responses and stream chunks carry
+# `usage`, LangChain chat messages `usage_metadata`; None without either
+def tokens_used(result):
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        return usage.total_tokens
+    metadata = getattr(result, "usage_metadata", None)
+    return metadata["total_tokens"] if metadata else None
+
+# Errors that say the request was bad, not that the upstream is unhealthy:
+# HTTP 4xx other than 408/429, and Neo4j client errors such as bad Cypher
+# (but not transaction timeouts, which Neo4j also reports as client errors)
+def is_client_error(error):
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return True
+    code = str(getattr(error, "code", "") or "")
+    return code.startswith("Neo.ClientError") and "TimedOut" not in code
+
+# Opens after `threshold` consecutive failures and refuses calls for
+# `reset_timeout` seconds, then lets a single probe through (half-open); the
+# probe's success closes it again, its failure re-opens it.
+class CircuitBreaker:
+    def __init__(self, name, threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+        BREAKER_STATE.labels(name).set(0)
+
+    def _set(self, state):
+        self.state = state
+        BREAKER_STATE.labels(self.name).set({"closed": 0, "half_open": 1, "open": 2}[state])
+
+    def check(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set("half_open")
+        if self.state == "open" or (self.state == "half_open" and self.probing):
+            self.rejected += 1
+            BREAKER_REJECTIONS.labels(self.name).inc()
+            raise CircuitOpen(f"{self.name} is unavailable")
+        if self.state == "half_open":
+            self.probing = True
+
+    def success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != "closed":
+            self._set("closed")
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            self.opened += 1
+            self.opened_at = time.monotonic()
+            self._set("open")
+
+    # A call that ended without a verdict on the upstream's health (cancelled,
+    # cut off by the request deadline) frees the probe slot without deciding
+    def release(self):
+        self.probing = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+# Sends a duplicate of a call that has not answered within the `quantile`
+# latency of recent calls and takes whichever answers first, so one slow
+# request stops setting the latency. Hedges stay under `max_ratio` of calls
+# so a slow upstream is not handed twice the load. `admit` takes the hedge's
+# own capacity and returns what gives it back, or None to skip the hedge.
+# The losing call is not cancelled but left to finish for up to `linger`
+# seconds, so the tokens it used can be settled and recorded.
+class Hedger:
+    def __init__(self, name, quantile=0.95, window=256, min_samples=20, min_delay=0.01, max_ratio=0.1):
+        self.name = name
+        self.quantile = quantile
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.calls = 0
+        self.hedged = 0
+        self.won = 0
+        self.skipped = 0
+
+    def delay(self):
+        if len(self.samples) < self.min_samples or self.hedged >= self.max_ratio * self.calls:
+            return None
+        ordered = sorted(self.samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))])
+
+    async def run(self, make_call, admit=None, linger=None):
+        self.calls += 1
+        delay = self.delay()
+        start = time.monotonic()
+        first = asyncio.ensure_future(make_call())
+        tasks = [first]
+        release = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    release = admit() if admit else None
+                    if admit and release is None:
+                        self.skipped += 1
+                        HEDGES.labels(self.name, "skipped").inc()
+                    else:
+                        self.hedged += 1
+                        HEDGES.labels(self.name, "sent").inc()
+                        tasks.append(asyncio.ensure_future(make_call()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a success; a failure only counts once both have failed
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.won += 1
+                            HEDGES.labels(self.name, "won").inc()
+                        self.samples.append(time.monotonic() - start)
+                        if release:
+                            # Slots and reservations are interchangeable, so
+                            # the hedge's are given back when the loser ends
+                            self._linger(next(t for t in tasks if t is not task), release, linger)
+                            tasks, release = [task], None
+                        return task.result()
+            raise first.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            if release:
+                release(None)
+
+    @staticmethod
+    def _linger(loser, release, linger):
+        def finished(task):
+            release(task.result() if not task.cancelled() and task.exception() is None else None)
+
+        if not loser.done() and linger:
+            asyncio.get_running_loop().call_later(linger, loser.cancel)
+        loser.add_done_callback(finished)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedges_won": self.won,
+            "hedges_skipped": self.skipped,
+            "delay_ms": round(self.delay() * 1000, 1) if self.delay() is not None else None
+        }
+
+# One upstream dependency: every call goes through its breaker, an optional
+# concurrency limiter and token quota, an optional hedge and a timeout clipped
+# to the request deadline. The timeout starts once the call is admitted.
+class Upstream:
+    def __init__(self, name, timeout, hedge=False, quantile=0.95, threshold=5, reset_timeout=30.0,
+                 limiter=None, quota=None, on_usage=None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(name, threshold, reset_timeout)
+        self.hedger = Hedger(name, quantile) if hedge else None
+        self.limiter = limiter
+        self.quota = quota
+        # Called with the response of a losing hedge, whose usage no caller reads
+        self.on_usage = on_usage
+        self.timeouts = 0
+
+    # `tokens` is reserved from the quota before the call; the usage the
+    # response reports settles it
+    async def call(self, make_call, timeout=None, tokens=0):
+        async with AsyncExitStack() as held:
+            result, reserved = await self._open(make_call, timeout, tokens, held)
+        used = tokens_used(result)
+        if used is not None:
+            self.settle(used, reserved)
+        return result
+
+    # Items of a streamed call, each within the timeout: a stalled stream
+    # fails instead of holding the response open forever. The limiter slot is
+    # held until the stream is read to the end or closed, and the usage its
+    # last item reports settles the reservation. A stream that is dropped
+    # (stalled, or its reader went away) is closed before the slot is given
+    # back, so the upstream stops generating and its connection is freed.
+    async def stream(self, make_call, tokens=0):
+        async with AsyncExitStack() as held:
+            stream, reserved = await self._open(make_call, None, tokens, held)
+            close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+            if close:
+                held.push_async_callback(close)
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    item = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    TIMEOUTS.labels(self.name, "timeout").inc()
+                    self.breaker.failure()
+                    raise UpstreamTimeout(f"{self.name} stream stalled for {self.timeout:.1f}s")
+                used = tokens_used(item)
+                if used is not None:
+                    self.settle(used, reserved)
+                yield item
+
+    # Admit the call and wait for its result and the tokens the quota
+    # reserved; the limiter slot is entered on `held`, so the caller decides
+    # when it is given back
+    async def _open(self, make_call, timeout, tokens, held):
+        self.breaker.check()
+        reserved = 0
+        try:
+            # Quota first: a call it cannot cover in time is refused before it queues
+            if self.quota:
+                reserved = await self.quota.acquire(tokens)
+            if self.limiter:
+                await held.enter_async_context(self.limiter.slot())
+            limit, cause = time_left(timeout or self.timeout)
+            if self.hedger:
+                work = self.hedger.run(make_call, lambda: self._admit_hedge(tokens), self.timeout)
+            else:
+                work = make_call()
+            result = await asyncio.wait_for(work, limit)
+        except UpstreamUnavailable:
+            self.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            TIMEOUTS.labels(self.name, cause).inc()
+            # Running out of the request's budget says nothing about the upstream
+            if cause == "timeout":
+                self.breaker.failure()
+            else:
+                self.breaker.release()
+            if cause == "deadline":
+                raise DeadlineExceeded(f"request deadline exceeded waiting for {self.name}")
+            raise UpstreamTimeout(f"{self.name} timed out after {limit:.1f}s")
+        except Exception as e:
+            # Out of quota says nothing about the upstream's health either;
+            # the caller is told when to come back
+            if getattr(e, "status_code", None) == 429:
+                self.breaker.release()
+                wait = retry_after(e.response) if getattr(e, "response", None) is not None else 1
+                raise Overloaded(f"{self.name} is rate limited, try again shortly", math.ceil(wait)) from e
+            if is_client_error(e):
+                self.breaker.success()
+                raise
+            # Connection errors and 5xx: the caller answers 503, as for an open breaker
+            self.breaker.failure()
+            raise UpstreamUnavailable(f"{self.name} failed: {e}") from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.success()
+        return result, reserved
+
+    def settle(self, used, reserved):
+        if self.quota:
+            self.quota.settle(used, reserved)
+
+    # A hedge is a call of its own: it takes a limiter slot and a token
+    # reservation only if both are free right now, and the usage of whichever
+    # call loses settles that reservation
+    def _admit_hedge(self, tokens):
+        if self.limiter and not self.limiter.try_acquire():
+            return None
+        reserved = 0
+        if self.quota:
+            reserved = self.quota.try_acquire(tokens)
+            if reserved is None:
+                if self.limiter:
+                    self.limiter.release()
+                return None
+
+        def release(result):
+            if self.limiter:
+                self.limiter.release()
+            if result is None:
+                return
+            used = tokens_used(result)
+            if used is not None:
+                self.settle(used, reserved)
+            if self.on_usage:
+                self.on_usage(result)
+
+        return release
+
+    def stats(self):
+        return {
+            "timeout_s": self.timeout,
+            "timeouts": self.timeouts,
+            "breaker": self.breaker.stats(),
+            "hedging": self.hedger.stats() if self.hedger else {"enabled": False}
+        }
@@ -0,0 +1,175 @@
+import base64
+import json
+import os
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_LOCAL_INDEX = os.path.join(CACHE_DIR, "documents.json")
+
+# Every retriever answers `await search(vector, k)` with a list of
+# {"id", "text", "score"} dicts, best first.
+
+# Azure AI Search vector query
+class AzureSearchRetriever:
+    def __init__(self, search_client):
+        self.search_client = search_client
+
+    async def search(self, vector, k=10):
+        from azure.search.documents.models import VectorizedQuery
+
+        vector_query = VectorizedQuery(
+            kind="vector",
+            vector=vector,
+            k_nearest_neighbors=k,
+            fields="embedding"
+        )
+        results = await self.search_client.search(
+            search_text=None,
+            vector_queries=[vector_query],
+            top=k
+        )
+        return [
+            {"id": doc.get("id"), "text": doc.get("text"), "score": doc.get("@search.score")}
+            async for doc in results
+        ]
+
+# Exact cosine search over every document embedding held in one contiguous
+# float32 matrix: one matrix-vector product plus argpartition per query.
+# With an ANN index attached, queries go through the index instead.
+class LocalRetriever:
+    def __init__(self, ids, texts, matrix, index=None):
+        self.ids = list(ids)
+        self.texts = list(texts)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+        self.index = index
+
+    # Load documents shaped like the scraper output (id, text, embedding)
+    @classmethod
+    def from_json(cls, paths):
+        documents = []
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                documents.extend(doc for doc in json.load(f) if doc.get("embedding"))
+        return cls(
+            [doc["id"] for doc in documents],
+            [doc["text"] for doc in documents],
+            np.array([doc["embedding"] for doc in documents], dtype=np.float32)
+        )
+
+    def top_k(self, vector, k=10):
+        if self.index is not None:
+            return self.index.search(vector, k)
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    # Scores of the rows an attached index probes
+    def score_rows(self, rows, query):
+        return self.matrix[rows] @ query
+
+    async def search(self, vector, k=10):
+        top, scores = self.top_k(vector, k)
+        return [
+            {"id": self.ids[i], "text": self.texts[i], "score": float(score)}
+            for i, score in zip(top, scores)
+        ]
+
+# Same search over a quantized, memory-mapped EmbeddingStore (embedding_store.py);
+# texts are read from the mapped file only for the hits
+class MappedRetriever:
+    def __init__(self, store, index=None):
+        self.store = store
+        self.ids = store.ids
+        self.index = index
+
+    def top_k(self, vector, k=10):
+        if self.index is not None:
+            return self.index.search(vector, k)
+        return self.store.top_k(vector, k)
+
+    def score_rows(self, rows, query):
+        return self.store.score_rows(rows, query)
+
+    async def search(self, vector, k=10):
+        top, scores = self.top_k(vector, k)
+        return [
+            {"id": self.ids[i], "text": self.store.text(i), "score": float(score)}
+            for i, score in zip(top, scores)
+        ]
+
+# Key shared by vector hits and graph rows: the page URL. Graph rows carry it
+# in a url column, document ids are its urlsafe base64 (see the scrapers).
+def result_key(result):
+    url = next((v for k, v in result.items() if k.lower().endswith("url") and v), None)
+    if not url and result.get("id"):
+        try:
+            # Some dumps store ids without base64 padding
+            url = base64.urlsafe_b64decode(result["id"] + "=" * (-len(result["id"]) % 4)).decode("utf-8")
+        except ValueError:
+            url = result["id"]
+    if not url:
+        return json.dumps(result, sort_keys=True, default=str)
+    return url.rstrip("/").lower()
+
+# Passages (see chunking.py) share their page's key up to the #passage-<n> fragment
+def parent_key(result):
+    return result_key(result).split("#", 1)[0].rstrip("/")
+
+# Reciprocal-rank fusion: every page scores sum(1 / (k + rank)) over the
+# ranked lists it appears in, so results several backends agree on rise to
+# the top without comparing their incompatible scores. Returns up to `limit`
+# (results from the same page, fused score) pairs, best first.
+def reciprocal_rank_fusion(result_lists, k=60, limit=10):
+    scores = {}
+    grouped = {}
+    for results in result_lists:
+        seen = set()
+        for rank, result in enumerate(results, 1):
+            key = parent_key(result)
+            grouped.setdefault(key, []).append(result)
+            # A page repeated in one list (several passages, or one row per match) counts once, at its best rank
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0) + 1 / (k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [(grouped[key], scores[key]) for key in ranked]
+
+# Pick the retriever from RETRIEVER=azure|local. The local backend opens the
+# store in LOCAL_STORE_PATH if set, otherwise loads the comma-separated JSON
+# dumps in LOCAL_INDEX_PATH (written by ai_search_scraper), and attaches the
+# IVF index in LOCAL_ANN_INDEX if one was built with ann_index.py. The index
+# scores through the retriever's own vectors (quantized, for a store) and
+# probes the lists calibrated at build time unless ANN_NPROBE is set.
+def build_retriever(search_client):
+    kind = os.getenv("RETRIEVER", "azure")
+    if kind == "local":
+        store_path = os.getenv("LOCAL_STORE_PATH")
+        if store_path:
+            from embedding_store import EmbeddingStore
+
+            retriever = MappedRetriever(EmbeddingStore(store_path))
+        else:
+            paths = os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX).split(",")
+            retriever = LocalRetriever.from_json(paths)
+        index_path = os.getenv("LOCAL_ANN_INDEX")
+        if index_path:
+            from ann_index import IVFIndex
+
+            index = IVFIndex.load(index_path, nprobe=int(os.getenv("ANN_NPROBE", "0")), score_rows=retriever.score_rows)
+            if len(index.order) != len(retriever.ids):
+                raise ValueError(f"{index_path} was built from a different corpus; rebuild it with ann_index.py")
+            retriever.index = index
+        return retriever
+    if kind == "azure":
+        return AzureSearchRetriever(search_client)
+    raise ValueError(f"Unknown retriever: {kind}")
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Touched by the scrapers after re-indexing so running APIs drop stale answers
+INDEX_VERSION_FILE = os.getenv(
+    "INDEX_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".index_version")
+)
+
+def bump_index_version():
+    with open(INDEX_VERSION_FILE, "w") as f:
+        f.write(str(time.time()))
+
+def index_version():
+    try:
+        return os.stat(INDEX_VERSION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+# Answers keyed on query embeddings, matched by cosine similarity.
+# Embeddings live in one preallocated matrix so a lookup is a single
+# matrix-vector product; entries are evicted least-recently-used first,
+# on TTL expiry, and whenever the memory budget would be exceeded.
+class SemanticCache:
+    def __init__(self, dim=1536, threshold=0.95, ttl=3600, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.matrix = np.zeros((max_entries, dim), dtype=np.float32)
+        self.occupied = np.zeros(max_entries, dtype=bool)
+        self.entries = OrderedDict()
+        self.free = list(range(max_entries - 1, -1, -1))
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version = index_version()
+
+    def _normalize(self, embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _remove(self, slot):
+        entry = self.entries.pop(slot)
+        self.occupied[slot] = False
+        self.free.append(slot)
+        self.bytes -= entry["size"]
+
+    def _expire(self, now):
+        expired = [slot for slot, entry in self.entries.items() if now - entry["created"] > self.ttl]
+        for slot in expired:
+            self._remove(slot)
+            self.evictions += 1
+
+    def _check_version(self):
+        version = index_version()
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def get(self, embedding):
+        self._check_version()
+        if not self.entries:
+            self.misses += 1
+            return None
+
+        scores = self.matrix @ self._normalize(embedding)
+        scores[~self.occupied] = -np.inf
+        slot = int(np.argmax(scores))
+        entry = self.entries[slot]
+
+        if scores[slot] < self.threshold:
+            self.misses += 1
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self._remove(slot)
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(slot)
+        self.hits += 1
+        return entry["payload"]
+
+    def put(self, embedding, payload):
+        self._check_version()
+        # max_entries=0 turns the cache off
+        if not self.max_entries:
+            return
+        size = self.dim * 4 + len(json.dumps(payload, default=str))
+        if size > self.max_bytes:
+            return
+
+        self._expire(time.time())
+        while self.entries and (not self.free or self.bytes + size > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+        slot = self.free.pop()
+        self.matrix[slot] = self._normalize(embedding)
+        self.occupied[slot] = True
+        self.entries[slot] = {"payload": payload, "created": time.time(), "size": size}
+        self.bytes += size
+
+    def clear(self):
+        self.entries.clear()
+        self.occupied[:] = False
+        self.free = list(range(self.max_entries - 1, -1, -1))
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
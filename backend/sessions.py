@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Turns kept verbatim, at most, when summaries fall behind (e.g. the model is down)
+MAX_STORED_TURNS = 32
+
+# Cut text to about `limit` tokens
+def clip(text, limit, count):
+    tokens = count(text)
+    if tokens <= limit:
+        return text
+    return text[:len(text) * limit // tokens].rstrip() + "…"
+
+# Conversations keyed by session ID, in a SQLite file every worker shares so
+# consecutive turns may land on different workers. A session holds a rolling
+# summary of its older turns plus its latest `keep_turns` turns verbatim, and
+# `history` renders both under a hard token budget, so the prompts of turn 50
+# cost what those of turn 5 do. Sessions idle for longer than `ttl` are dropped.
+# Calls block, so the API runs them in a thread; one lock keeps those threads
+# off the shared connection in turn. A write that cannot get the database
+# lock within `busy_timeout` seconds is skipped and counted, and a read that
+# fails returns an empty session, so a busy file never fails an answer.
+class SessionStore:
+    def __init__(self, path=None, history_tokens=600, summary_tokens=150, answer_tokens=120,
+                 keep_turns=4, ttl=24 * 3600, busy_timeout=1.0):
+        self.path = path or os.path.join(CACHE_DIR, "sessions.sqlite")
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.answer_tokens = answer_tokens
+        self.keep_turns = keep_turns
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.skipped_writes = 0
+        self.failed_reads = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                turns TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _read(self, session_id):
+        row = self.db.execute(
+            "SELECT summary, turns, seq FROM sessions WHERE id = ? AND updated > ?",
+            (session_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return {"id": session_id, "summary": "", "turns": [], "seq": 0}
+        return {"id": session_id, "summary": row[0], "turns": json.loads(row[1]), "seq": row[2]}
+
+    def _write(self, session):
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+            (session["id"], session["summary"], json.dumps(session["turns"]), session["seq"], now)
+        )
+        self.db.execute("DELETE FROM sessions WHERE updated <= ?", (now - self.ttl,))
+
+    # Read-modify-write in one IMMEDIATE transaction, so a summary finishing
+    # on one worker never drops a turn another worker just added. Returns
+    # the updated session, or None if the write was skipped.
+    def _update(self, session_id, change):
+        with self.lock:
+            try:
+                self.db.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                self.skipped_writes += 1
+                return None
+            try:
+                session = self._read(session_id)
+                change(session)
+                self._write(session)
+                self.db.execute("COMMIT")
+            except sqlite3.OperationalError:
+                if self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+                self.skipped_writes += 1
+                return None
+            except BaseException:
+                if self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+                raise
+        return session
+
+    def load(self, session_id):
+        with self.lock:
+            try:
+                return self._read(session_id)
+            except sqlite3.OperationalError:
+                self.failed_reads += 1
+                return {"id": session_id, "summary": "", "turns": [], "seq": 0}
+
+    def append(self, session_id, question, answer):
+        def add(session):
+            session["turns"].append({"n": session["seq"], "user": question, "assistant": answer})
+            session["turns"] = session["turns"][-MAX_STORED_TURNS:]
+            session["seq"] += 1
+        return self._update(session_id, add)
+
+    # Turns that have fallen out of the verbatim window and belong in the summary
+    def pending(self, session):
+        return session["turns"][:-self.keep_turns] if len(session["turns"]) > self.keep_turns else []
+
+    # Replace the summary and drop the turns it now covers, up to turn number `through`
+    def apply_summary(self, session_id, summary, through):
+        def fold(session):
+            session["summary"] = summary
+            session["turns"] = [turn for turn in session["turns"] if turn["n"] > through]
+        return self._update(session_id, fold)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    # Summary first, then the newest turns that still fit the budget, oldest first
+    def history(self, session, count):
+        budget = self.history_tokens
+        parts = []
+        if session["summary"]:
+            summary = f"Summary of the earlier conversation: {clip(session['summary'], self.summary_tokens, count)}"
+            parts.append(summary)
+            budget -= count(summary) + 1
+        recent = []
+        for turn in reversed(session["turns"]):
+            text = f"User: {turn['user']}\nAssistant: {clip(turn['assistant'], self.answer_tokens, count)}"
+            cost = count(text) + 1
+            if cost > budget:
+                break
+            recent.insert(0, text)
+            budget -= cost
+        return "\n".join(parts + recent)
+
+    def stats(self):
+        with self.lock:
+            stored = self.db.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated > ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+        return {
+            "sessions": stored,
+            "history_budget": self.history_tokens,
+            "summary_budget": self.summary_tokens,
+            "keep_turns": self.keep_turns,
+            "ttl": self.ttl,
+            "skipped_writes": self.skipped_writes,
+            "failed_reads": self.failed_reads
+        }
+
+# Session store configured from the environment, or None with SESSIONS=0
+def default_sessions():
+    if os.getenv("SESSIONS", "1") != "1":
+        return None
+    return SessionStore(
+        os.getenv("SESSION_PATH"),
+        history_tokens=int(os.getenv("SESSION_HISTORY_TOKENS", "600")),
+        summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "150")),
+        answer_tokens=int(os.getenv("SESSION_ANSWER_TOKENS", "120")),
+        keep_turns=int(os.getenv("SESSION_KEEP_TURNS", "4")),
+        ttl=float(os.getenv("SESSION_TTL", str(24 * 3600)))
+    )
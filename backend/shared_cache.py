@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import time
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Per-namespace limits: entry count, total value bytes and seconds to live.
+# SHARED_CACHE_LIMITS overrides them with the same shape, e.g.
+# {"answers": {"max_entries": 20000}}.
+DEFAULT_LIMITS = {
+    "rewrites": {"max_entries": 20000, "max_bytes": 16 * 1024 * 1024, "ttl": 24 * 3600},
+    "answers": {"max_entries": 5000, "max_bytes": 64 * 1024 * 1024, "ttl": 3600},
+}
+
+# JSON values in namespaces, shared by every worker on the host through one
+# SQLite file in WAL mode. Each write and its eviction run in one IMMEDIATE
+# transaction, so concurrent workers never see a half-applied update; a
+# namespace over its entry or byte limit drops its least recently used
+# entries, and expired entries are never returned. Hits only note the key in
+# memory; the next write of this process stamps their last_used before it
+# evicts, so reads never take the write lock. The cache runs on the event
+# loop, so a write that cannot get the lock within `busy_timeout` seconds is
+# skipped, and a read that fails is a miss.
+class SharedCache:
+    def __init__(self, path=None, limits=None, busy_timeout=0.1):
+        self.path = path or os.path.join(CACHE_DIR, "shared_cache.sqlite")
+        self.limits = {namespace: dict(limit) for namespace, limit in DEFAULT_LIMITS.items()}
+        for namespace, limit in (limits or {}).items():
+            self.limits.setdefault(namespace, {}).update(limit)
+        self.hits = {}
+        self.misses = {}
+        self.evictions = {}
+        self.skipped = {}
+        # (namespace, key) -> time of the last hit not yet written back
+        self.touched = {}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, last_used)")
+
+    def get(self, namespace, key):
+        now = time.time()
+        try:
+            row = self.db.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+                (namespace, key, now)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            return None
+        self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        self.touched[(namespace, key)] = now
+        return json.loads(row[0])
+
+    def put(self, namespace, key, value):
+        limit = self.limits.get(namespace, {})
+        data = json.dumps(value, default=str)
+        if len(data) > limit.get("max_bytes", float("inf")):
+            return
+        now = time.time()
+        touched, self.touched = self.touched, {}
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            self._skip(namespace, touched)
+            return
+        try:
+            self.db.executemany(
+                "UPDATE entries SET last_used = MAX(last_used, ?) WHERE namespace = ? AND key = ?",
+                [(used, name, entry) for (name, entry), used in touched.items()]
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, data, len(data), now + limit.get("ttl", float("inf")), now)
+            )
+            self._evict(namespace, limit, now)
+            self.db.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            self._skip(namespace, touched)
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    # Another worker holds the lock: drop the write, keep the hits for the next one
+    def _skip(self, namespace, touched):
+        self.skipped[namespace] = self.skipped.get(namespace, 0) + 1
+        for entry, used in touched.items():
+            self.touched.setdefault(entry, used)
+
+    def _evict(self, namespace, limit, now):
+        evicted = self.db.execute(
+            "DELETE FROM entries WHERE namespace = ? AND expires <= ?", (namespace, now)
+        ).rowcount
+        if "max_entries" in limit:
+            evicted += self.db.execute("""
+                DELETE FROM entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM entries WHERE namespace = ?
+                    ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (namespace, namespace, limit["max_entries"])).rowcount
+        if "max_bytes" in limit:
+            # Keep the most recently used entries whose sizes add up to the budget
+            evicted += self.db.execute("""
+                DELETE FROM entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS running
+                        FROM entries WHERE namespace = ?
+                    ) WHERE running > ?
+                )
+            """, (namespace, namespace, limit["max_bytes"])).rowcount
+        if evicted:
+            self.evictions[namespace] = self.evictions.get(namespace, 0) + evicted
+
+    def clear(self, namespace):
+        self.db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    # Entries and bytes are host-wide; hits, misses, evictions and skipped writes
+    # count this process
+    def stats(self):
+        stored = {
+            namespace: (entries, size)
+            for namespace, entries, size in self.db.execute(
+                "SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace"
+            )
+        }
+        result = {}
+        for namespace in sorted(set(self.limits) | set(stored)):
+            entries, size = stored.get(namespace, (0, 0))
+            hits, misses = self.hits.get(namespace, 0), self.misses.get(namespace, 0)
+            result[namespace] = {
+                "entries": entries,
+                "bytes": size,
+                **self.limits.get(namespace, {}),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions.get(namespace, 0),
+                "skipped_writes": self.skipped.get(namespace, 0)
+            }
+        return result
+
+# Shared cache configured from the environment, or None with SHARED_CACHE=0
+def default_shared_cache():
+    if os.getenv("SHARED_CACHE", "1") != "1":
+        return None
+    return SharedCache(
+        os.getenv("SHARED_CACHE_PATH"),
+        json.loads(os.getenv("SHARED_CACHE_LIMITS", "{}"))
+    )
@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+
+# Upstream calls (OpenAI requests, searches, Neo4j queries) made on behalf of
+# the request running in the current task; None outside a coalesced request
+upstream_calls = contextvars.ContextVar("upstream_calls", default=None)
+
+def count_upstream_call(n=1):
+    counter = upstream_calls.get()
+    if counter is not None:
+        counter[0] += n
+
+# Coalesces identical requests that are in flight at the same time: the first
+# caller for a key (the leader) runs the work in its own task, later callers
+# (followers) await that task instead of repeating the upstream calls. The
+# task outlives a leader that disconnects, so followers still get the result;
+# errors are shared the same way. Nothing is kept once the task finishes.
+class SingleFlight:
+    def __init__(self):
+        self.inflight = {}
+        self.leaders = 0
+        self.followers = 0
+        self.calls_made = 0
+        self.calls_saved = 0
+
+    async def _lead(self, work):
+        counter = [0]
+        upstream_calls.set(counter)
+        try:
+            return await work(), counter[0]
+        finally:
+            self.calls_made += counter[0]
+
+    def _finish(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark a failure as retrieved even if its leader went away and nobody awaited it
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key, work):
+        task = self.inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(self._lead(work))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            result, _ = await asyncio.shield(task)
+            return result
+
+        self.followers += 1
+        result, calls = await asyncio.shield(task)
+        self.calls_saved += calls
+        return result
+
+    def stats(self):
+        return {
+            "in_flight": len(self.inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "upstream_calls_made": self.calls_made,
+            "upstream_calls_saved": self.calls_saved
+        }
@@ -0,0 +1,137 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from usage import UsageTotals
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUESTS = Counter(
+    "chat_requests",
+    "Chat requests by endpoint, route target and outcome",
+    ["endpoint", "target", "outcome"]
+)
+REQUEST_SECONDS = Histogram(
+    "chat_request_seconds",
+    "End-to-end chat request latency",
+    ["endpoint", "target"],
+    buckets=BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each pipeline stage of a chat request",
+    ["stage", "target"],
+    buckets=BUCKETS
+)
+
+TOKENS = Counter(
+    "openai_tokens",
+    "OpenAI tokens billed by pipeline stage, route target, model and kind (prompt/completion)",
+    ["stage", "target", "model", "kind"]
+)
+COST = Counter(
+    "openai_cost_usd",
+    "Estimated OpenAI spend in USD by pipeline stage, route target and model",
+    ["stage", "target", "model"]
+)
+
+# Stage timings of the request running in the current task. Work started from
+# the request (threads, single-flight leaders) inherits the same trace.
+current_trace = ContextVar("current_trace", default=None)
+
+class Trace:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.usage = UsageTotals()
+        self.target = None
+        self.outcome = None
+        self.finished = False
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def timings_ms(self):
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+    # Server-Timing header value: one entry per stage plus the total
+    def server_timing(self):
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self):
+        self.finished = True
+        target = self.target or "unknown"
+        REQUESTS.labels(self.endpoint, target, self.outcome or "answered").inc()
+        REQUEST_SECONDS.labels(self.endpoint, target).observe(self.elapsed())
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.labels(stage, target).observe(seconds)
+        count_tokens(self.usage, target)
+
+def count_tokens(usage, target):
+    for stage, model, prompt_tokens, completion_tokens, spend in usage.items():
+        TOKENS.labels(stage, target, model, "prompt").inc(prompt_tokens)
+        TOKENS.labels(stage, target, model, "completion").inc(completion_tokens)
+        COST.labels(stage, target, model).inc(spend)
+
+def start_trace(endpoint):
+    trace = Trace(endpoint)
+    current_trace.set(trace)
+    return trace
+
+def record(stage, seconds):
+    trace = current_trace.get()
+    if trace:
+        trace.add(stage, seconds)
+
+# Tokens an OpenAI response billed to the current request. A call that
+# outlived its request (a losing hedge) goes straight to the counters.
+def record_usage(stage, model, prompt_tokens, completion_tokens=0):
+    trace = current_trace.get()
+    if not trace:
+        return
+    if trace.finished:
+        late = UsageTotals()
+        late.add(stage, model, prompt_tokens, completion_tokens)
+        count_tokens(late, trace.target or "unknown")
+        return
+    trace.usage.add(stage, model, prompt_tokens, completion_tokens)
+
+def stage_seconds(stage):
+    trace = current_trace.get()
+    return trace.stages.get(stage, 0.0) if trace else 0.0
+
+# Tag the current request with its route target and how it was answered
+def set_outcome(target, outcome):
+    trace = current_trace.get()
+    if trace:
+        trace.target = target
+        trace.outcome = outcome
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+# Prometheus exposition of this process's metrics, or of every worker's when
+# PROMETHEUS_MULTIPROC_DIR is set for a multi-process server
+def render_metrics():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
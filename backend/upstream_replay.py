@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+import numpy as np
+
+# UPSTREAM_MODE=record appends every OpenAI, Azure AI Search and Neo4j call
+# with its timing to the JSON-lines file at UPSTREAM_FIXTURES;
+# UPSTREAM_MODE=replay answers the same calls from that file without touching
+# the network, waiting the recorded time scaled by UPSTREAM_REPLAY_SCALE
+# (0 answers at once).
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "upstream.jsonl")
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+# Raised for a call the fixture file has no recording of
+class ReplayMiss(LookupError):
+    pass
+
+class UpstreamRecorder:
+    def __init__(self, path, mode, scale=1.0):
+        self.path = path
+        self.mode = mode
+        self.scale = scale
+        self.lock = threading.Lock()
+        self.fixtures = {}
+        self.served = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.fixtures.setdefault(entry["key"], []).append(entry)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def save(self, entry):
+        line = json.dumps(entry, default=str)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    # Recordings of a repeated call are served in the order they were made,
+    # starting over once all have been used
+    def lookup(self, key, description):
+        with self.lock:
+            entries = self.fixtures.get(key)
+            if not entries:
+                self.misses += 1
+                raise ReplayMiss(f"No recorded response for {description}")
+            i = self.served.get(key, 0)
+            self.served[key] = i + 1
+            self.replayed += 1
+            return entries[i % len(entries)]
+
+    def transport(self):
+        return RecordingTransport(self)
+
+    # Subclass of the Neo4j wrapper that records its queries, or answers them
+    # from the fixtures without ever opening a connection
+    def graph_class(self, base):
+        recorder = self
+
+        if self.mode == "record":
+            class RecordingGraph(base):
+                def query(self, query, params={}, session_params={}):
+                    start = time.perf_counter()
+                    rows = super().query(query, params, session_params)
+                    recorder.save({
+                        "service": "neo4j", "key": digest("neo4j", query, params),
+                        "query": query, "params": params, "rows": rows,
+                        "seconds": time.perf_counter() - start
+                    })
+                    return rows
+
+                def refresh_schema(self):
+                    start = time.perf_counter()
+                    super().refresh_schema()
+                    recorder.save({
+                        "service": "neo4j", "key": digest("neo4j-schema"),
+                        "schema": self.schema, "structured_schema": self.structured_schema,
+                        "seconds": time.perf_counter() - start
+                    })
+
+            return RecordingGraph
+
+        class ReplayGraph(base):
+            def __init__(self, *args, refresh_schema=True, **kwargs):
+                self.timeout = None
+                self.sanitize = False
+                self._enhanced_schema = False
+                self.schema = ""
+                self.structured_schema = {}
+                if refresh_schema:
+                    self.refresh_schema()
+
+            def query(self, query, params={}, session_params={}):
+                entry = recorder.lookup(digest("neo4j", query, params), f"Neo4j query {query!r}")
+                time.sleep(entry["seconds"] * recorder.scale)
+                return entry["rows"]
+
+            def refresh_schema(self):
+                entry = recorder.lookup(digest("neo4j-schema"), "the Neo4j schema")
+                time.sleep(entry["seconds"] * recorder.scale)
+                self.schema = entry["schema"]
+                self.structured_schema = entry["structured_schema"]
+
+        return ReplayGraph
+
+    def wrap_retriever(self, retriever):
+        return RecordingRetriever(retriever, self)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "scale": self.scale,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
+
+# Recorder configured by UPSTREAM_MODE, or None for live upstreams
+def upstream_from_env():
+    mode = os.getenv("UPSTREAM_MODE", "")
+    if mode not in ("record", "replay"):
+        return None
+    return UpstreamRecorder(
+        os.getenv("UPSTREAM_FIXTURES", DEFAULT_FIXTURES),
+        mode,
+        float(os.getenv("UPSTREAM_REPLAY_SCALE", "1"))
+    )
+
+# Vector searches keyed by the exact query vector and k
+class RecordingRetriever:
+    def __init__(self, retriever, recorder):
+        self.retriever = retriever
+        self.recorder = recorder
+
+    async def search(self, vector, k=10):
+        key = digest("search", np.asarray(vector, dtype=np.float32).tobytes(), k)
+        if self.recorder.mode == "replay":
+            entry = self.recorder.lookup(key, f"a top-{k} vector search")
+            await asyncio.sleep(entry["seconds"] * self.recorder.scale)
+            return entry["results"]
+        start = time.perf_counter()
+        results = await self.retriever.search(vector, k=k)
+        self.recorder.save({
+            "service": "search", "key": key, "k": k, "results": results,
+            "seconds": time.perf_counter() - start
+        })
+        return results
+
+def request_key(request):
+    try:
+        body = json.loads(request.content)
+    except ValueError:
+        body = request.content
+    return digest("http", request.method, request.url.path, body)
+
+# Headers that describe the recorded body rather than the response
+DROPPED_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection"}
+
+def replay_headers(headers):
+    return [(name, value) for name, value in headers if name.lower() not in DROPPED_HEADERS]
+
+# Response body that plays recorded chunks back with their recorded gaps
+class ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, chunks, start, scale):
+        self.chunks = chunks
+        self.start = start
+        self.scale = scale
+
+    def __iter__(self):
+        previous = self.start
+        for offset, text in self.chunks:
+            if self.scale:
+                time.sleep((offset - previous) * self.scale)
+            previous = offset
+            yield text.encode("utf-8", "surrogateescape")
+
+    async def __aiter__(self):
+        previous = self.start
+        for offset, text in self.chunks:
+            if self.scale:
+                await asyncio.sleep((offset - previous) * self.scale)
+            previous = offset
+            yield text.encode("utf-8", "surrogateescape")
+
+# Live response body that saves the recording once it has been read through,
+# so streamed answers reach the caller chunk by chunk while being recorded
+class RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, stream, entry, start, recorder):
+        self.stream = stream
+        self.entry = entry
+        self.start = start
+        self.recorder = recorder
+
+    def _add(self, chunk):
+        self.entry["chunks"].append([time.perf_counter() - self.start, chunk.decode("utf-8", "surrogateescape")])
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self._add(chunk)
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self._add(chunk)
+            yield chunk
+
+    def close(self):
+        self.stream.close()
+        self.recorder.save(self.entry)
+
+    async def aclose(self):
+        await self.stream.aclose()
+        self.recorder.save(self.entry)
+
+# httpx transport for the OpenAI clients. Embedding requests are recorded per
+# input text, so replay does not depend on how the texts were batched.
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.sync_transport = None
+        self.async_transport = None
+
+    def handle_request(self, request):
+        if self.recorder.mode == "replay":
+            response, delay = self._replay(request)
+            time.sleep(delay)
+            return response
+        if self.sync_transport is None:
+            self.sync_transport = httpx.HTTPTransport()
+        request.headers["Accept-Encoding"] = "identity"
+        start = time.perf_counter()
+        response = self.sync_transport.handle_request(request)
+        if request.url.path.endswith("/embeddings"):
+            response.read()
+        return self._record(request, response, start)
+
+    async def handle_async_request(self, request):
+        if self.recorder.mode == "replay":
+            response, delay = self._replay(request)
+            await asyncio.sleep(delay)
+            return response
+        if self.async_transport is None:
+            self.async_transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+            )
+        request.headers["Accept-Encoding"] = "identity"
+        start = time.perf_counter()
+        response = await self.async_transport.handle_async_request(request)
+        if request.url.path.endswith("/embeddings"):
+            await response.aread()
+        return self._record(request, response, start)
+
+    def _record(self, request, response, start):
+        seconds = time.perf_counter() - start
+        if request.url.path.endswith("/embeddings"):
+            if response.status_code == 200:
+                self._record_embeddings(request, response, seconds)
+            return httpx.Response(
+                response.status_code,
+                headers=response.headers,
+                content=response.content,
+                extensions=response.extensions
+            )
+        entry = {
+            "service": "openai", "key": request_key(request),
+            "path": request.url.path, "status": response.status_code,
+            "headers": replay_headers(response.headers.multi_items()),
+            "seconds": seconds, "chunks": []
+        }
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=RecordingStream(response.stream, entry, start, self.recorder),
+            extensions=response.extensions
+        )
+
+    def _record_embeddings(self, request, response, seconds):
+        body = json.loads(request.content)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = response.json()
+        chars = sum(len(text) for text in texts) or 1
+        for text, item in zip(texts, data["data"]):
+            self.recorder.save({
+                "service": "openai",
+                "key": digest("embedding", body.get("model"), body.get("encoding_format"), text),
+                "text": text, "embedding": item["embedding"],
+                "tokens": data["usage"]["prompt_tokens"] * len(text) / chars,
+                "seconds": seconds
+            })
+
+    # The recorded response and how long to wait before returning it
+    def _replay(self, request):
+        if request.url.path.endswith("/embeddings"):
+            return self._replay_embeddings(request)
+        entry = self.recorder.lookup(request_key(request), f"{request.method} {request.url.path}")
+        response = httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            stream=ReplayStream(entry["chunks"], entry["seconds"], self.recorder.scale)
+        )
+        return response, entry["seconds"] * self.recorder.scale
+
+    def _replay_embeddings(self, request):
+        body = json.loads(request.content)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        entries = [
+            self.recorder.lookup(
+                digest("embedding", body.get("model"), body.get("encoding_format"), text),
+                f"the embedding of {text!r}"
+            )
+            for text in texts
+        ]
+        tokens = round(sum(entry["tokens"] for entry in entries))
+        response = httpx.Response(200, json={
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": entry["embedding"]}
+                for i, entry in enumerate(entries)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+        return response, max(entry["seconds"] for entry in entries) * self.recorder.scale
@@ -0,0 +1,66 @@
+import json
+import os
+
+# USD per million tokens as (input, output). OPENAI_PRICES overrides or adds
+# entries with the same shape, e.g. {"gpt-4o-mini": [0.15, 0.6]}. Responses
+# name dated snapshots (gpt-4o-mini-2024-07-18), so a model is priced by the
+# longest entry it starts with.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("OPENAI_PRICES", "{}")).items()})
+
+def price(model):
+    if model in PRICES:
+        return PRICES[model]
+    match = max((name for name in PRICES if model.startswith(name + "-")), key=len, default=None)
+    return PRICES[match] if match else (0.0, 0.0)
+
+def cost(model, prompt_tokens, completion_tokens=0):
+    input_price, output_price = price(model)
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+# Token counts per (stage, model), for one request or a whole scraper run
+class UsageTotals:
+    def __init__(self):
+        self.tokens = {}
+        self.calls = {}
+
+    def add(self, stage, model, prompt_tokens, completion_tokens=0):
+        counts = self.tokens.setdefault((stage, model), [0, 0])
+        counts[0] += prompt_tokens
+        counts[1] += completion_tokens
+        self.calls[(stage, model)] = self.calls.get((stage, model), 0) + 1
+
+    def items(self):
+        for (stage, model), (prompt_tokens, completion_tokens) in self.tokens.items():
+            yield stage, model, prompt_tokens, completion_tokens, cost(model, prompt_tokens, completion_tokens)
+
+    def summary(self):
+        stages = {}
+        for stage, model, prompt_tokens, completion_tokens, spend in self.items():
+            key = stage if stage not in stages else f"{stage}/{model}"
+            stages[key] = {
+                "model": model,
+                "calls": self.calls[(stage, model)],
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": round(spend, 8)
+            }
+        return {
+            "prompt_tokens": sum(s["prompt_tokens"] for s in stages.values()),
+            "completion_tokens": sum(s["completion_tokens"] for s in stages.values()),
+            "cost_usd": round(sum(s["cost_usd"] for s in stages.values()), 8),
+            "stages": stages
+        }
+
+    # Printed at the end of a scraper run
+    def report(self, title):
+        summary = self.summary()
+        lines = [f"{title}: {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens, ${summary['cost_usd']:.4f}"]
+        for stage, s in summary["stages"].items():
+            lines.append(f"  {stage:<12} {s['model']:<24} {s['calls']:5d} calls {s['prompt_tokens']:9d} + {s['completion_tokens']:7d} tokens  ${s['cost_usd']:.4f}")
+        return "\n".join(lines)
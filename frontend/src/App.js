@@ -15,6 +15,8 @@ function App() {
   ]);
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
+  // Lets the backend resolve follow-up questions against earlier turns
+  const [sessionId] = useState(() => crypto.randomUUID());
   console.log(process.env.REACT_APP_BACKEND_URL)
 
   const messageEndRef = useRef(null);
@@ -46,6 +48,7 @@ function App() {
     try {
       const response = await axios.post(`${process.env.REACT_APP_BACKEND_URL}/chat`, {
         message: userInput,
+        session_id: sessionId,
       });
       console.log(response.data);
       const backendResponse = response.data.response || 'Sorry, something went wrong.';